@@ -0,0 +1,445 @@
+#  Copyright 2019-2021, the MIDOSS project contributors, The University of British Columbia,
+#  and Dalhousie University.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark suite for the stages of HDF5 forcing file creation.
+
+Synthetic SalishSeaCast NEMO, HRDPS, and WaveWatch3 files, and interpolation weights
+files, with the shapes of the real ones are generated, and each stage of the
+processing is timed separately on them.
+The results are stored in a JSON file so that they can be compared with those of
+other commits to catch slowdowns.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+import h5py
+import numpy
+import xarray
+import yaml
+
+import make_midoss_forcing
+from make_midoss_forcing import forcing_paths, make_hdf5, mohid_interpolate
+
+
+# Shapes of the real grids: (depth, y, x) for SalishSeaCast NEMO, and (y, x) for the
+# HRDPS and WaveWatch3 source grids
+SALISHSEACAST_SHAPE = (40, 898, 398)
+HRDPS_SHAPE = (266, 256)
+WAVEWATCH3_SHAPE = (661, 572)
+
+# Date of the first day of the synthetic source files
+FIXTURE_DATE = datetime(2019, 1, 1)
+
+# SalishSeaCast NEMO file types and the variables that are generated in them
+SALISHSEACAST_FILES = {
+    "grid_U": ("vozocrtx",),
+    "grid_V": ("vomecrty",),
+    "grid_T": ("vosaline", "votemper", "sossheig"),
+    "grid_W": ("vovecrtz", "vert_eddy_diff"),
+    "carp_T": ("e3t",),
+}
+
+
+def make_fixtures(fixture_dir, hours=6, n_days=2, seed=42):
+    """Generate synthetic source and interpolation weights files in a directory.
+
+    The files for the first day are filled with random values.
+    The files for the other days are hard links to them,
+    so that path resolution can be benchmarked without generating more data.
+
+    :arg str fixture_dir: Directory to generate the files in.
+
+    :arg int hours: Number of hours in each source file;
+                    WaveWatch3 files have twice as many half-hourly time steps.
+
+    :arg int n_days: Number of days of source files.
+
+    :arg int seed: Random number generator seed.
+    """
+    rng = numpy.random.default_rng(seed)
+    nz, ny, nx = SALISHSEACAST_SHAPE
+    paths = fixture_paths(fixture_dir)
+    times = numpy.arange(
+        FIXTURE_DATE,
+        FIXTURE_DATE + timedelta(hours=hours),
+        timedelta(hours=1),
+        dtype="datetime64[m]",
+    )
+    first_files = {}
+    for day in range(n_days):
+        datestamp = FIXTURE_DATE + timedelta(days=day)
+        ymd = datestamp.strftime("%Y%m%d")
+        ssc_dir = f"{paths['salishseacast']}{datestamp.strftime('%d%b%y').lower()}/"
+        ww3_dir = f"{paths['wavewatch3']}{datestamp.strftime('%d%b%y').lower()}/"
+        for directory in (ssc_dir, paths["hrdps"], ww3_dir):
+            os.makedirs(directory, exist_ok=True)
+        day_files = {
+            filetype: f"{ssc_dir}SalishSea_1h_{ymd}_{ymd}_{filetype}.nc"
+            for filetype in SALISHSEACAST_FILES
+        }
+        day_files["hrdps"] = (
+            f"{paths['hrdps']}ops_y{datestamp.year}m{datestamp.month:02d}"
+            f"d{datestamp.day:02d}.nc"
+        )
+        day_files["wavewatch3"] = f"{ww3_dir}SoG_ww3_fields_{ymd}.nc"
+        if first_files:
+            for key, file_path in day_files.items():
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                os.link(first_files[key], file_path)
+            continue
+        first_files = day_files
+        for filetype, variables in SALISHSEACAST_FILES.items():
+            data_vars = {}
+            for variable in variables:
+                if variable == "sossheig":
+                    values = rng.standard_normal((hours, ny, nx), dtype="float32")
+                    data_vars[variable] = (("time_counter", "y", "x"), values)
+                else:
+                    values = rng.standard_normal((hours, nz, ny, nx), dtype="float32")
+                    # Land
+                    values[:, :, : ny // 4, : nx // 4] = numpy.nan
+                    data_vars[variable] = (("time_counter", "depth", "y", "x"), values)
+            xarray.Dataset(
+                data_vars, coords={"time_counter": times + numpy.timedelta64(30, "m")}
+            ).to_netcdf(day_files[filetype])
+        xarray.Dataset(
+            {
+                variable: (
+                    ("time_counter", "y", "x"),
+                    rng.standard_normal((hours,) + HRDPS_SHAPE, dtype="float32"),
+                )
+                for variable in ("u_wind", "v_wind")
+            },
+            coords={"time_counter": times},
+        ).to_netcdf(day_files["hrdps"])
+        ww3_times = numpy.arange(
+            FIXTURE_DATE,
+            FIXTURE_DATE + timedelta(hours=hours),
+            timedelta(minutes=30),
+            dtype="datetime64[m]",
+        )
+        ww3_vars = {}
+        for variable in ("t02", "lm", "hs", "wcc", "uuss", "vuss"):
+            values = rng.random((2 * hours,) + WAVEWATCH3_SHAPE, dtype="float32")
+            values[
+                :, : WAVEWATCH3_SHAPE[0] // 4, : WAVEWATCH3_SHAPE[1] // 4
+            ] = numpy.nan
+            ww3_vars[variable] = (("time", "y", "x"), values)
+        xarray.Dataset(ww3_vars, coords={"time": ww3_times}).to_netcdf(
+            day_files["wavewatch3"]
+        )
+    _make_weights(rng, paths["wind_weights"], HRDPS_SHAPE, 0)
+    _make_weights(rng, paths["wave_weights"], WAVEWATCH3_SHAPE, 0.3)
+    with open(os.path.join(fixture_dir, "fixture.yaml"), "w") as f:
+        yaml.safe_dump({"hours": hours, "n_days": n_days, "seed": seed}, f)
+
+
+def _make_weights(rng, path, source_shape, missing_fraction):
+    target_shape = (4,) + SALISHSEACAST_SHAPE[1:]
+    y = rng.integers(0, source_shape[0], target_shape).astype(float)
+    x = rng.integers(0, source_shape[1], target_shape).astype(float)
+    weights = rng.random(target_shape)
+    missing = rng.random(target_shape) < missing_fraction
+    for values in (y, x, weights):
+        values[missing] = numpy.nan
+    xarray.Dataset(
+        {
+            name: (("index", "y", "x"), values)
+            for name, values in (("y", y), ("x", x), ("weights", weights))
+        }
+    ).to_netcdf(path)
+
+
+def fixture_paths(fixture_dir):
+    """Calculate the paths of the synthetic source collections and interpolation
+    weights files in a fixture directory.
+
+    :arg str fixture_dir: Fixture directory.
+
+    :rtype: dict
+    """
+    fixture_dir = os.path.abspath(fixture_dir)
+    return {
+        "salishseacast": f"{fixture_dir}/ssc/",
+        "hrdps": f"{fixture_dir}/hrdps/",
+        "wavewatch3": f"{fixture_dir}/ww3/",
+        "wind_weights": f"{fixture_dir}/wind_weights.nc",
+        "wave_weights": f"{fixture_dir}/wave_weights.nc",
+    }
+
+
+def time_stage(func, repeat, setup=None):
+    """Time repeated calls of a benchmark stage.
+
+    :arg func: Function that runs the stage.
+    :type func: callable
+
+    :arg int repeat: Number of times to run the stage.
+
+    :arg setup: Function to call before each run of the stage, outside of the timing.
+    :type setup: callable
+
+    :return: Elapsed times in seconds.
+    :rtype: list
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t_start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t_start)
+    return times
+
+
+def run_benchmarks(fixture_dir, repeat=3):
+    """Time each stage of HDF5 forcing file creation on the synthetic files in a
+    fixture directory.
+
+    :arg str fixture_dir: Directory of files generated by :py:func:`make_fixtures`.
+
+    :arg int repeat: Number of times to run each stage.
+
+    :return: Elapsed times of each stage keyed by stage name.
+    :rtype: dict
+    """
+    with open(os.path.join(fixture_dir, "fixture.yaml"), "r") as f:
+        fixture = yaml.safe_load(f)
+    paths = fixture_paths(fixture_dir)
+    date_end = FIXTURE_DATE + timedelta(days=fixture["n_days"] - 1)
+    ymd = FIXTURE_DATE.strftime("%Y%m%d")
+    ssc_dir = f"{paths['salishseacast']}{FIXTURE_DATE.strftime('%d%b%y').lower()}/"
+    stages = {}
+
+    def resolve_paths():
+        for filetype in SALISHSEACAST_FILES:
+            forcing_paths.salishseacast_paths(
+                FIXTURE_DATE, date_end, paths["salishseacast"], filetype
+            )
+        forcing_paths.hrdps_paths(FIXTURE_DATE, date_end, paths["hrdps"])
+        forcing_paths.ww3_paths(FIXTURE_DATE, date_end, paths["wavewatch3"])
+
+    stages["path_resolution"] = time_stage(resolve_paths, repeat)
+
+    def index_paths():
+        archive_index = forcing_paths.archive_index(paths)
+        archive_index.refresh()
+        for filetype in SALISHSEACAST_FILES:
+            archive_index.find("salishseacast", FIXTURE_DATE, date_end, filetype)
+        archive_index.find("hrdps", FIXTURE_DATE, date_end)
+        archive_index.find("wavewatch3", FIXTURE_DATE, date_end)
+
+    stages["archive_index"] = time_stage(index_paths, repeat)
+
+    stages["weighting_matrix_load"] = time_stage(
+        lambda: mohid_interpolate.weighting_matrix(paths["wind_weights"]), repeat
+    )
+    # Compile the operators before timing their loading from the cache
+    mohid_interpolate.load_operator(paths["wind_weights"])
+    mohid_interpolate.load_operator(paths["wave_weights"])
+    stages["operator_load"] = time_stage(
+        lambda: mohid_interpolate.load_operator(paths["wind_weights"]),
+        repeat,
+        setup=mohid_interpolate.load_operator.cache_clear,
+    )
+
+    wind_operator = mohid_interpolate.load_operator(paths["wind_weights"])
+    with xarray.open_dataset(
+        f"{paths['hrdps']}ops_y{FIXTURE_DATE.year}m{FIXTURE_DATE.month:02d}"
+        f"d{FIXTURE_DATE.day:02d}.nc"
+    ) as data:
+        wind = data.u_wind.values
+    stages["hrdps_interpolation"] = time_stage(
+        lambda: mohid_interpolate.hrdps(wind, wind_operator), repeat
+    )
+    del wind
+
+    wave_operator = mohid_interpolate.load_operator(paths["wave_weights"])
+    with xarray.open_dataset(
+        f"{paths['wavewatch3']}{FIXTURE_DATE.strftime('%d%b%y').lower()}/"
+        f"SoG_ww3_fields_{ymd}.nc"
+    ) as data:
+        waves = data.hs.values[1::2]
+    stages["wavewatch_interpolation"] = time_stage(
+        lambda: mohid_interpolate.wavewatch(waves, wave_operator), repeat
+    )
+    del waves
+
+    with xarray.open_dataset(f"{ssc_dir}SalishSea_1h_{ymd}_{ymd}_grid_U.nc") as data:
+        u_velocity = data.vozocrtx.load()
+    stages["unstagger_dataarray"] = time_stage(
+        lambda: make_hdf5.unstagger_dataarray(u_velocity, "x").values, repeat
+    )
+    stages["unstagger_mung_array"] = time_stage(
+        lambda: make_hdf5.unstagger_mung_array(u_velocity.values, "x"), repeat
+    )
+    del u_velocity
+
+    with xarray.open_dataset(f"{ssc_dir}SalishSea_1h_{ymd}_{ymd}_grid_T.nc") as data:
+        salinity = data.vosaline.values
+        datearrays = make_hdf5.read_datearrays(data, "salinity")
+    stages["mung_array"] = time_stage(
+        lambda: make_hdf5.mung_array(salinity, "3D"), repeat
+    )
+    grid = make_hdf5.mung_array(salinity, "3D")
+    del salinity
+    hdf5_path = os.path.join(fixture_dir, "benchmark_write_grid.hdf5")
+
+    def remove_hdf5():
+        if os.path.exists(hdf5_path):
+            os.remove(hdf5_path)
+
+    stages["write_grid"] = time_stage(
+        lambda: make_hdf5.write_grid(
+            grid, datearrays, make_hdf5.METADATA["salinity"], hdf5_path, "salinity", 1
+        ),
+        repeat,
+        setup=remove_hdf5,
+    )
+    remove_hdf5()
+    return stages
+
+
+def _git_commit():
+    package_dir = os.path.dirname(os.path.abspath(make_midoss_forcing.__file__))
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=package_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return
+
+
+def compare_results(results, previous, tolerance=1.25):
+    """Print a comparison of benchmark results with those of a previous run.
+
+    :arg dict results: Benchmark results.
+
+    :arg dict previous: Previous benchmark results.
+
+    :arg float tolerance: Ratio of the minimum times of a stage above which it is
+                          reported as slower.
+
+    :return: Names of the stages that are slower.
+    :rtype: list
+    """
+    slower = []
+    print(
+        f"\n{'stage':<26} {'previous (s)':>12} {'current (s)':>12} {'ratio':>7}"
+        f"   (previous: {previous.get('commit')})"
+    )
+    for stage, timing in results["stages"].items():
+        previous_timing = previous["stages"].get(stage)
+        if previous_timing is None:
+            print(f"{stage:<26} {'':>12} {timing['min']:>12.4f}")
+            continue
+        ratio = timing["min"] / previous_timing["min"]
+        flag = ""
+        if ratio > tolerance:
+            flag = "  SLOWER"
+            slower.append(stage)
+        print(
+            f"{stage:<26} {previous_timing['min']:>12.4f} {timing['min']:>12.4f} "
+            f"{ratio:>7.2f}{flag}"
+        )
+    return slower
+
+
+def benchmark(
+    fixture_dir,
+    results_json,
+    hours=6,
+    n_days=2,
+    repeat=3,
+    previous_json=None,
+    tolerance=1.25,
+):
+    """Run the benchmark suite and store the results in a JSON file.
+
+    The synthetic files are generated in the fixture directory if they are not
+    there already with the same number of hours and days.
+
+    :arg str fixture_dir: Directory for the synthetic files.
+
+    :arg str results_json: File path/name of JSON file to store the results in.
+
+    :arg int hours: Number of hours in each source file.
+
+    :arg int n_days: Number of days of source files.
+
+    :arg int repeat: Number of times to run each stage.
+
+    :arg str previous_json: File path/name of JSON file of previous results to
+                            compare with.
+
+    :arg float tolerance: Ratio of the minimum times of a stage above which it is
+                          reported as slower.
+
+    :return: Names of the stages that are slower than in the previous results.
+    :rtype: list
+    """
+    fixture_yaml = os.path.join(fixture_dir, "fixture.yaml")
+    fixture = None
+    if os.path.exists(fixture_yaml):
+        with open(fixture_yaml, "r") as f:
+            fixture = yaml.safe_load(f)
+    if fixture is None or (fixture["hours"], fixture["n_days"]) != (hours, n_days):
+        print(f"Generating synthetic files in {fixture_dir}...")
+        os.makedirs(fixture_dir, exist_ok=True)
+        make_fixtures(fixture_dir, hours, n_days)
+    stages = run_benchmarks(fixture_dir, repeat)
+    results = {
+        "version": make_midoss_forcing.__version__,
+        "commit": _git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "h5py": h5py.__version__,
+        "fixture": {
+            "hours": hours,
+            "n_days": n_days,
+            "salishseacast_shape": SALISHSEACAST_SHAPE,
+            "hrdps_shape": HRDPS_SHAPE,
+            "wavewatch3_shape": WAVEWATCH3_SHAPE,
+        },
+        "stages": {
+            stage: {
+                "times": times,
+                "min": min(times),
+                "median": statistics.median(times),
+            }
+            for stage, times in stages.items()
+        },
+    }
+    print(f"\n{'stage':<26} {'min (s)':>10} {'median (s)':>10}")
+    for stage, timing in results["stages"].items():
+        print(f"{stage:<26} {timing['min']:>10.4f} {timing['median']:>10.4f}")
+    with open(results_json, "w") as f:
+        json.dump(results, f, indent=2)
+    if previous_json is None:
+        return []
+    with open(previous_json, "r") as f:
+        previous = json.load(f)
+    return compare_results(results, previous, tolerance)
@@ -16,7 +16,13 @@
 """
 import click
 
-from make_midoss_forcing import make_hdf5
+from make_midoss_forcing import (
+    benchmark,
+    make_forcing_statistics,
+    make_hdf5,
+    shards,
+    storage_benchmark,
+)
 
 
 @click.command(help=make_hdf5.create_hdf5.__doc__)
@@ -24,7 +30,40 @@ from make_midoss_forcing import make_hdf5
 @click.argument("yaml_filename", type=click.Path(exists=True))
 @click.argument("start_date", type=click.DateTime(formats=("%Y-%m-%d",)))
 @click.argument("n_days", default=0, type=click.IntRange(min=0))
-def make_hdf5_cli(yaml_filename, start_date, n_days):
+@click.option(
+    "--interpolation-threads",
+    type=click.IntRange(min=1),
+    help="Number of threads to use for HRDPS and WaveWatch3 interpolation. "
+    "Overrides the interpolation threads setting in the YAML file.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Resume an interrupted run, keeping the work that it completed.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes to write the HDF5 files with. "
+    "Variables that are written to the same HDF5 files, or calculated from the same "
+    "source files, are processed by one worker so that each source file is read once.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    help="File path/name of JSON lines file to write the processing metrics of each "
+    "variable and source file to.",
+)
+def make_hdf5_cli(
+    yaml_filename,
+    start_date,
+    n_days,
+    interpolation_threads,
+    resume,
+    workers,
+    metrics_file,
+):
     """Command-line interface for :py:mod:`make_midoss_forcing.make_hdf5`.
 
     Please see:
@@ -39,5 +78,593 @@ def make_hdf5_cli(yaml_filename, start_date, n_days):
     :param int n_days: Number of days plus 1 of HDF5 forcing to create in each file.
                        Use 1 to create 2 days of forcing which is what is required for a
                        1 day MOHID run.
+
+    :param int interpolation_threads: Number of threads to use for HRDPS and WaveWatch3
+                                      interpolation.
+
+    :param boolean resume: Resume an interrupted run.
+
+    :param int workers: Number of worker processes to write the HDF5 files with.
+
+    :param str metrics_file: File path/name of JSON lines file to write the processing
+                             metrics to.
+    """
+    make_hdf5.create_hdf5(
+        yaml_filename,
+        start_date,
+        n_days,
+        interpolation_threads=interpolation_threads,
+        resume=resume,
+        workers=workers,
+        metrics_file=metrics_file,
+    )
+
+
+@click.command(help=make_hdf5.create_hdf5_batch.__doc__)
+@click.version_option()
+@click.argument("yaml_filename", type=click.Path(exists=True))
+@click.argument("windows_filename", type=click.Path(exists=True))
+@click.option(
+    "--interpolation-threads",
+    type=click.IntRange(min=1),
+    help="Number of threads to use for HRDPS and WaveWatch3 interpolation. "
+    "Overrides the interpolation threads setting in the YAML file.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Resume an interrupted run, keeping the work that it completed.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes to write the HDF5 files with. "
+    "Variables that are written to the same HDF5 files, or calculated from the same "
+    "source files, are processed by one worker so that each source file is read once.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    help="File path/name of JSON lines file to write the processing metrics of each "
+    "variable and source file to.",
+)
+def make_hdf5_batch_cli(
+    yaml_filename,
+    windows_filename,
+    interpolation_threads,
+    resume,
+    workers,
+    metrics_file,
+):
+    """Command-line interface for :py:func:`make_midoss_forcing.make_hdf5.create_hdf5_batch`.
+
+    Please see:
+
+        make-hdf5-batch --help
+
+    :param str yaml_filename: File path/name of YAML file to control HDF5 forcing files creation.
+
+    :param str windows_filename: File path/name of CSV or YAML file of the start dates
+                                 and numbers of days plus 1 of the run windows.
+
+    :param int interpolation_threads: Number of threads to use for HRDPS and WaveWatch3
+                                      interpolation.
+
+    :param boolean resume: Resume an interrupted run.
+
+    :param int workers: Number of worker processes to write the HDF5 files with.
+
+    :param str metrics_file: File path/name of JSON lines file to write the processing
+                             metrics to.
+    """
+    make_hdf5.create_hdf5_batch(
+        yaml_filename,
+        windows_filename,
+        interpolation_threads=interpolation_threads,
+        resume=resume,
+        workers=workers,
+        metrics_file=metrics_file,
+    )
+
+
+@click.command(help=storage_benchmark.run_benchmark.__doc__)
+@click.version_option()
+@click.argument("hdf5_path", type=click.Path(exists=True))
+@click.argument("settings_yaml", type=click.Path(exists=True))
+@click.option(
+    "--work-dir",
+    default=".",
+    type=click.Path(file_okay=False),
+    help="Directory in which to write the benchmark files.",
+)
+@click.option(
+    "--results-json",
+    type=click.Path(dir_okay=False),
+    help="File path/name of JSON file to store the results in.",
+)
+def storage_benchmark_cli(hdf5_path, settings_yaml, work_dir, results_json):
+    """Command-line interface for :py:mod:`make_midoss_forcing.storage_benchmark`.
+
+    Please see:
+
+        make-hdf5-storage-benchmark --help
+
+    :param str hdf5_path: File path/name of HDF5 forcing file to benchmark.
+
+    :param str settings_yaml: File path/name of YAML file of storage settings keyed by
+                              a name for each setting.
+
+    :param str work_dir: Directory in which to write the benchmark files.
+
+    :param str results_json: File path/name of JSON file to store the results in.
+    """
+    storage_benchmark.run_benchmark(
+        hdf5_path, settings_yaml, work_dir, results_json=results_json
+    )
+
+
+@click.command(help=benchmark.benchmark.__doc__)
+@click.version_option()
+@click.argument("fixture_dir", type=click.Path(file_okay=False))
+@click.argument("results_json", type=click.Path(dir_okay=False))
+@click.option(
+    "--hours",
+    default=6,
+    type=click.IntRange(min=1),
+    help="Number of hours in each synthetic source file.",
+)
+@click.option(
+    "--days",
+    "n_days",
+    default=2,
+    type=click.IntRange(min=1),
+    help="Number of days of synthetic source files.",
+)
+@click.option(
+    "--repeat",
+    default=3,
+    type=click.IntRange(min=1),
+    help="Number of times to run each stage.",
+)
+@click.option(
+    "--compare",
+    "previous_json",
+    type=click.Path(exists=True, dir_okay=False),
+    help="File path/name of JSON file of previous results to compare with.",
+)
+@click.option(
+    "--tolerance",
+    default=1.25,
+    type=click.FloatRange(min=1),
+    help="Ratio of the minimum times of a stage above which it is reported as slower.",
+)
+def benchmark_cli(
+    fixture_dir, results_json, hours, n_days, repeat, previous_json, tolerance
+):
+    """Command-line interface for :py:mod:`make_midoss_forcing.benchmark`.
+
+    Please see:
+
+        make-hdf5-benchmark --help
+
+    The exit status is 1 if any stage is slower than in the previous results.
+
+    :param str fixture_dir: Directory for the synthetic files.
+
+    :param str results_json: File path/name of JSON file to store the results in.
+
+    :param int hours: Number of hours in each synthetic source file.
+
+    :param int n_days: Number of days of synthetic source files.
+
+    :param int repeat: Number of times to run each stage.
+
+    :param str previous_json: File path/name of JSON file of previous results to
+                              compare with.
+
+    :param float tolerance: Ratio of the minimum times of a stage above which it is
+                            reported as slower.
+    """
+    slower = benchmark.benchmark(
+        fixture_dir,
+        results_json,
+        hours=hours,
+        n_days=n_days,
+        repeat=repeat,
+        previous_json=previous_json,
+        tolerance=tolerance,
+    )
+    if slower:
+        raise SystemExit(1)
+
+
+@click.command(help=make_forcing_statistics.write_forcing_statistics.__doc__)
+@click.version_option()
+@click.argument("path", type=click.Path(exists=True, file_okay=False))
+@click.argument("stats_file", type=click.Path(dir_okay=False))
+@click.option(
+    "--location",
+    "locations",
+    required=True,
+    multiple=True,
+    nargs=2,
+    type=click.IntRange(min=0),
+    metavar="GRIDX GRIDY",
+    help="Grid indices of a location to calculate statistics at. "
+    "Repeat for more locations.",
+)
+@click.option(
+    "--window",
+    "windows",
+    multiple=True,
+    nargs=2,
+    type=click.IntRange(min=0),
+    default=[(0, hours) for hours in make_forcing_statistics.DEFAULT_WINDOW_HOURS],
+    show_default=True,
+    metavar="START_HOUR HOURS",
+    help="Start hour and number of hours of a time window to calculate statistics "
+    "over. Repeat for more windows.",
+)
+def make_forcing_statistics_cli(path, stats_file, locations, windows):
+    """Command-line interface for :py:mod:`make_midoss_forcing.make_forcing_statistics`.
+
+    Please see:
+
+        make-forcing-statistics --help
+
+    :param str path: Directory of HDF5 forcing files.
+
+    :param str stats_file: File path/name of YAML file to write the statistics to.
+
+    :param tuple locations: (GridX, GridY) grid indices of the locations.
+
+    :param tuple windows: (start hour, number of hours) of each window.
+    """
+    make_forcing_statistics.write_forcing_statistics(
+        path, locations, windows, stats_file
+    )
+
+
+@click.command(help=make_forcing_statistics.write_statistics_maps.__doc__)
+@click.version_option()
+@click.argument("path", type=click.Path(exists=True, file_okay=False))
+@click.argument("maps_file", type=click.Path(dir_okay=False))
+@click.option(
+    "--window",
+    "windows",
+    multiple=True,
+    nargs=2,
+    type=click.IntRange(min=0),
+    default=[(0, hours) for hours in make_forcing_statistics.DEFAULT_WINDOW_HOURS],
+    show_default=True,
+    metavar="START_HOUR HOURS",
+    help="Start hour and number of hours of a time window to calculate statistics "
+    "over. Repeat for more windows.",
+)
+@click.option(
+    "--threshold",
+    "thresholds",
+    multiple=True,
+    type=(str, float),
+    metavar="VARIABLE VALUE",
+    help="Variable and value above which to calculate the fraction of time steps "
+    "that exceed it. Repeat for more variables.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes to calculate the maps with.",
+)
+@click.option(
+    "--chunk-rows",
+    default=64,
+    type=click.IntRange(min=1),
+    help="Number of grid rows that each worker process reduces at a time.",
+)
+def make_forcing_statistics_maps_cli(
+    path, maps_file, windows, thresholds, workers, chunk_rows
+):
+    """Command-line interface for :py:func:`make_midoss_forcing.make_forcing_statistics.write_statistics_maps`.
+
+    Please see:
+
+        make-forcing-statistics-maps --help
+
+    :param str path: Directory of HDF5 forcing files.
+
+    :param str maps_file: File path/name of HDF5 file to write the statistics maps to.
+
+    :param tuple windows: (start hour, number of hours) of each window.
+
+    :param tuple thresholds: (variable, value) exceedance thresholds.
+
+    :param int workers: Number of worker processes.
+
+    :param int chunk_rows: Number of grid rows in each band.
+    """
+    make_forcing_statistics.write_statistics_maps(
+        path,
+        maps_file,
+        windows,
+        dict(thresholds),
+        workers=workers,
+        chunk_rows=chunk_rows,
+    )
+
+
+@click.command(help=make_forcing_statistics.catalog_forcing_statistics.__doc__)
+@click.version_option()
+@click.argument("path", type=click.Path(exists=True, file_okay=False))
+@click.argument("catalog_path", type=click.Path(dir_okay=False))
+@click.argument("stats_file", type=click.Path(dir_okay=False))
+@click.option(
+    "--location",
+    "locations",
+    required=True,
+    multiple=True,
+    nargs=2,
+    type=click.IntRange(min=0),
+    metavar="GRIDX GRIDY",
+    help="Grid indices of a location to calculate statistics at. "
+    "Repeat for more locations.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes to summarize the HDF5 files with.",
+)
+def make_forcing_statistics_catalog_cli(
+    path, catalog_path, stats_file, locations, workers
+):
+    """Command-line interface for :py:func:`make_midoss_forcing.make_forcing_statistics.catalog_forcing_statistics`.
+
+    Please see:
+
+        make-forcing-statistics-catalog --help
+
+    :param str path: Directory tree of run window directories of HDF5 forcing files.
+
+    :param str catalog_path: File path/name of JSON file to cache the per-file
+                             summaries in.
+
+    :param str stats_file: File path/name of YAML file to write the statistics to.
+
+    :param tuple locations: (GridX, GridY) grid indices of the locations.
+
+    :param int workers: Number of worker processes.
+    """
+    make_forcing_statistics.catalog_forcing_statistics(
+        path, locations, catalog_path, stats_file, workers=workers
+    )
+
+
+def run_windows_options(func):
+    """Add the options that give the run windows of an array job as a date range to a
+    command that takes an optional WINDOWS_FILENAME argument.
+    """
+    options = [
+        click.argument(
+            "windows_filename", required=False, type=click.Path(exists=True)
+        ),
+        click.option(
+            "--start-date",
+            type=click.DateTime(formats=("%Y-%m-%d",)),
+            help="Start date of the first run window of a date range of run windows.",
+        ),
+        click.option(
+            "--end-date",
+            type=click.DateTime(formats=("%Y-%m-%d",)),
+            help="Latest start date of a run window of the date range. "
+            "Defaults to --start-date.",
+        ),
+        click.option(
+            "--n-days",
+            default=0,
+            type=click.IntRange(min=0),
+            help="Number of days plus 1 of each run window of the date range.",
+        ),
+        click.option(
+            "--step-days",
+            type=click.IntRange(min=1),
+            help="Number of days between the start dates of the run windows of the "
+            "date range. Defaults to --n-days.",
+        ),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+@click.command(
+    help="""Create the HDF5 forcing files for one shard of a collection of run windows
+    in a task of an array job.
+
+    YAML_FILENAME: File path/name of YAML file to control HDF5 forcing files creation.
+
+    WINDOWS_FILENAME: File path/name of CSV or YAML file of the start dates and numbers
+    of days plus 1 of the run windows, like make-hdf5-batch reads.
+    Use the --start-date, --end-date, --n-days, and --step-days options instead to
+    give the run windows as a date range.
+
+    The run windows are split deterministically into --task-count shards of contiguous
+    windows with about the same number of days, and the windows of shard --task-index
+    are processed. The task index and count are read from the SLURM_ARRAY_TASK_ID,
+    SLURM_ARRAY_TASK_MIN, SLURM_ARRAY_TASK_STEP, and SLURM_ARRAY_TASK_COUNT
+    environment variables when the options are not given.
+    """
+)
+@click.version_option()
+@click.argument("yaml_filename", type=click.Path(exists=True))
+@run_windows_options
+@click.option(
+    "--task-index",
+    type=click.IntRange(min=0),
+    help="Index of the task, from 0. Defaults to SLURM_ARRAY_TASK_ID minus "
+    "SLURM_ARRAY_TASK_MIN, divided by SLURM_ARRAY_TASK_STEP.",
+)
+@click.option(
+    "--task-count",
+    type=click.IntRange(min=1),
+    help="Number of tasks. Defaults to SLURM_ARRAY_TASK_COUNT.",
+)
+@click.option(
+    "--interpolation-threads",
+    type=click.IntRange(min=1),
+    help="Number of threads to use for HRDPS and WaveWatch3 interpolation. "
+    "Overrides the interpolation threads setting in the YAML file.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Resume an interrupted task, keeping the work that it completed.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of worker processes to write the HDF5 files with. "
+    "Variables that are written to the same HDF5 files, or calculated from the same "
+    "source files, are processed by one worker so that each source file is read once.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False),
+    help="File path/name of JSON lines file to write the processing metrics of each "
+    "variable and source file to. {task_index} in it is replaced by the task index.",
+)
+def make_hdf5_shard_cli(
+    yaml_filename,
+    windows_filename,
+    start_date,
+    end_date,
+    n_days,
+    step_days,
+    task_index,
+    task_count,
+    interpolation_threads,
+    resume,
+    workers,
+    metrics_file,
+):
+    """Command-line interface for :py:func:`make_midoss_forcing.shards.create_hdf5_shard`.
+
+    Please see:
+
+        make-hdf5-shard --help
+
+    :param str yaml_filename: File path/name of YAML file to control HDF5 forcing files creation.
+
+    :param str windows_filename: File path/name of CSV or YAML file of the start dates
+                                 and numbers of days plus 1 of the run windows.
+
+    :param start_date: Start date of the first run window of a date range.
+    :type start_date: :py:class:`datetime.datetime`
+
+    :param end_date: Latest start date of a run window of the date range.
+    :type end_date: :py:class:`datetime.datetime`
+
+    :param int n_days: Number of days plus 1 of each run window of the date range.
+
+    :param int step_days: Number of days between the start dates of the run windows.
+
+    :param int task_index: Index of the task.
+
+    :param int task_count: Number of tasks.
+
+    :param int interpolation_threads: Number of threads to use for HRDPS and WaveWatch3
+                                      interpolation.
+
+    :param boolean resume: Resume an interrupted task.
+
+    :param int workers: Number of worker processes to write the HDF5 files with.
+
+    :param str metrics_file: File path/name of JSON lines file to write the processing
+                             metrics to.
+    """
+    windows = shards.read_run_windows(
+        windows_filename, start_date, end_date, n_days, step_days
+    )
+    if windows is None:
+        raise SystemExit(1)
+    dirnames = shards.create_hdf5_shard(
+        yaml_filename,
+        windows,
+        task_index,
+        task_count,
+        interpolation_threads=interpolation_threads,
+        resume=resume,
+        workers=workers,
+        metrics_file=metrics_file,
+    )
+    if dirnames is None:
+        raise SystemExit(1)
+
+
+@click.command(
+    help="""Verify that the HDF5 forcing files of all of the shards of a collection of
+    run windows are complete, and merge the processing metrics of the shards.
+
+    YAML_FILENAME: File path/name of YAML file to control HDF5 forcing files creation.
+
+    WINDOWS_FILENAME: File path/name of CSV or YAML file of the start dates and numbers
+    of days plus 1 of the run windows, like make-hdf5-batch reads.
+    Use the --start-date, --end-date, --n-days, and --step-days options instead to
+    give the run windows as a date range.
+
+    The exit status is 1 if the HDF5 forcing files of any run window are incomplete.
+    """
+)
+@click.version_option()
+@click.argument("yaml_filename", type=click.Path(exists=True))
+@run_windows_options
+@click.option(
+    "--metrics-file",
+    "metrics_files",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="File path/name of JSON lines processing metrics file of a shard to include "
+    "in the merged metrics summary. Repeat for more shards.",
+)
+def make_hdf5_verify_cli(
+    yaml_filename,
+    windows_filename,
+    start_date,
+    end_date,
+    n_days,
+    step_days,
+    metrics_files,
+):
+    """Command-line interface for :py:func:`make_midoss_forcing.shards.verify_shards`.
+
+    Please see:
+
+        make-hdf5-verify --help
+
+    :param str yaml_filename: File path/name of YAML file to control HDF5 forcing files creation.
+
+    :param str windows_filename: File path/name of CSV or YAML file of the start dates
+                                 and numbers of days plus 1 of the run windows.
+
+    :param start_date: Start date of the first run window of a date range.
+    :type start_date: :py:class:`datetime.datetime`
+
+    :param end_date: Latest start date of a run window of the date range.
+    :type end_date: :py:class:`datetime.datetime`
+
+    :param int n_days: Number of days plus 1 of each run window of the date range.
+
+    :param int step_days: Number of days between the start dates of the run windows.
+
+    :param tuple metrics_files: File paths/names of the JSON lines processing metrics
+                                files of the shards.
     """
-    make_hdf5.create_hdf5(yaml_filename, start_date, n_days)
+    windows = shards.read_run_windows(
+        windows_filename, start_date, end_date, n_days, step_days
+    )
+    if windows is None or not shards.verify_shards(
+        yaml_filename, windows, metrics_files
+    ):
+        raise SystemExit(1)
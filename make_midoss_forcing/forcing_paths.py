@@ -13,8 +13,10 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import json
 import os
-from datetime import timedelta
+import re
+from datetime import datetime, timedelta
 
 import numpy
 
@@ -153,3 +155,146 @@ def ww3_paths(timestart, timeend, path):
         wave_files.append(wave_path)
 
     return wave_files
+
+
+class archive_index:
+    """Index of the SalishSeaCast NEMO, HRDPS, and WaveWatch3 files in the forcing
+    archive trees.
+
+    The trees are scanned once into a table of (source, file type, date) to file path
+    entries, so that the files for ranges of dates can be found without checking for
+    each of them on the file system.
+    The table, and the modification times of the directories that were scanned,
+    are stored in a JSON file so that subsequent refreshes only rescan the directories
+    that have changed.
+
+    :arg dict source_paths: Paths of the :kbd:`salishseacast`, :kbd:`hrdps`, and
+                            :kbd:`wavewatch3` archive trees
+
+    :arg str index_path: File path/name of JSON file to store the index in
+    """
+
+    def __init__(self, source_paths, index_path=None):
+        self.source_paths = source_paths
+        self.index_path = index_path
+        # Directory path: {"mtime": modification time in ns,
+        #                  "files": [[source, file type, YYYYMMDD date, file path], ...]}
+        self.directories = {}
+        if index_path is not None and os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                stored = json.load(f)
+            if stored.get("source_paths") == source_paths:
+                self.directories = stored["directories"]
+        self.files = {}
+        self._build_table()
+
+    def _build_table(self):
+        self.files = {}
+        for directory in self.directories.values():
+            for source, filetype, date, file_path in directory["files"]:
+                # The first file name pattern of a day takes precedence,
+                # like in ww3_paths()
+                self.files.setdefault((source, filetype, date), file_path)
+
+    def refresh(self):
+        """Rescan the archive directories that are new or have changed since the
+        index was last refreshed, and store the index if it has a JSON file.
+        """
+        directories = {}
+        salishseacast_path = self.source_paths.get("salishseacast")
+        hrdps_path = self.source_paths.get("hrdps")
+        wavewatch3_path = self.source_paths.get("wavewatch3")
+        if hrdps_path is not None and os.path.isdir(hrdps_path):
+            self._scan(directories, hrdps_path, hrdps_path, _hrdps_file)
+        for source, path, parse_file in (
+            ("salishseacast", salishseacast_path, _salishseacast_file),
+            ("wavewatch3", wavewatch3_path, _ww3_file),
+        ):
+            if path is None or not os.path.isdir(path):
+                continue
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir() and _parse_dirname(entry.name) is not None:
+                        self._scan(
+                            directories, f"{path}{entry.name}/", entry.path, parse_file
+                        )
+        self.directories = directories
+        self._build_table()
+        if self.index_path is not None:
+            tmp_path = f"{self.index_path}.tmp{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {"source_paths": self.source_paths, "directories": directories}, f
+                )
+            os.replace(tmp_path, self.index_path)
+
+    def _scan(self, directories, prefix, dir_path, parse_file):
+        mtime = os.stat(dir_path).st_mtime_ns
+        previous = self.directories.get(prefix)
+        if previous is not None and previous["mtime"] == mtime:
+            directories[prefix] = previous
+            return
+        files = []
+        for name in sorted(os.listdir(dir_path)):
+            parsed = parse_file(name)
+            if parsed is not None:
+                files.append([*parsed, f"{prefix}{name}"])
+        # Sort the file names of each day in order of precedence
+        files.sort(key=lambda file: (file[1], file[2], len(file[3])))
+        directories[prefix] = {"mtime": mtime, "files": files}
+
+    def find(self, source, timestart, timeend, filetype=""):
+        """Find the files of a source for a range of dates.
+
+        :arg str source: :kbd:`salishseacast`, :kbd:`hrdps`, or :kbd:`wavewatch3`
+
+        :arg timestart: First date
+        :type timestart: :py:class:`datetime.datetime`
+
+        :arg timeend: Last date
+        :type timeend: :py:class:`datetime.datetime`
+
+        :arg str filetype: SalishSeaCast NEMO file type (e.g. :kbd:`grid_T`)
+
+        :return: File paths keyed by date, and a list of the dates for which there are
+                 no files
+        :rtype: tuple
+        """
+        found = {}
+        missing = []
+        for day in range((timeend - timestart).days + 1):
+            datestamp = timestart + timedelta(days=day)
+            file_path = self.files.get((source, filetype, datestamp.strftime("%Y%m%d")))
+            if file_path is None:
+                missing.append(datestamp)
+            else:
+                found[datestamp] = file_path
+        return found, missing
+
+
+def _parse_dirname(name):
+    try:
+        return datetime.strptime(name, "%d%b%y")
+    except ValueError:
+        return
+
+
+def _salishseacast_file(name):
+    match = re.fullmatch(r"SalishSea_1h_(\d{8})_(\d{8})_(\w+)\.nc", name)
+    if match is None or match.group(1) != match.group(2):
+        return
+    return "salishseacast", match.group(3), match.group(1)
+
+
+def _hrdps_file(name):
+    match = re.fullmatch(r"ops_y(\d{4})m(\d{2})d(\d{2})\.nc", name)
+    if match is None:
+        return
+    return "hrdps", "", "".join(match.groups())
+
+
+def _ww3_file(name):
+    match = re.fullmatch(r"SoG_ww3_fields_(\d{8})(?:_(\d{8}))?\.nc", name)
+    if match is None or match.group(2) not in (None, match.group(1)):
+        return
+    return "wavewatch3", "", match.group(1)
@@ -13,11 +13,39 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import concurrent.futures
+import json
+import sys
+from datetime import datetime
+
 import numpy as np
 import h5py
 import os
 import yaml
 
+# HDF5 group names of the u and v components of the vectors whose speed and direction
+# statistics are calculated, keyed by the prefix of the speed and direction variable names
+VECTOR_COMPONENTS = {
+    'wind': ('wind velocity X', 'wind velocity Y'),
+    'currents': ('velocity U', 'velocity V'),
+    'stokes': ('Stokes U', 'Stokes V'),
+}
+
+# Statistics periods of make_forcing_statistics(); number of hours
+DEFAULT_WINDOW_HOURS = (24, 168)
+
+# Version of the per-file summaries in statistics catalogs;
+# catalogs with other versions are discarded
+CATALOG_VERSION = 1
+
+# HDF5 dataset creation keyword arguments for statistics maps
+MAPS_STORAGE = {'dtype': 'float32', 'compression': 'gzip', 'compression_opts': 4,
+                'shuffle': True, 'fillvalue': np.nan}
+
+# Maximum number of bytes to read at once from the consolidated (time, [depth,] x, y)
+# datasets of consolidated layout HDF5 forcing files
+SERIES_READ_BYTES = 2**26
+
 def wind_speed_dir(u_wind, v_wind):
     """Calculate wind speed and direction from u and v wind components.
 
@@ -40,71 +68,836 @@ def wind_speed_dir(u_wind, v_wind):
     dir = np.rad2deg(dir + (dir < 0) * 2 * np.pi)
     return speed, dir
 
-def add_to_dict(group, timeseries, dict24, dict168, start_hour):
-    dict24[group] = {'min': "%.4g" % np.min(timeseries[start_hour:start_hour+24]),
-                         'max': "%.4g" % np.max(timeseries[start_hour:start_hour+24]),
-                         'mean': "%.4g" % np.mean(timeseries[start_hour:start_hour+24]),
-                         'std': "%.4g" % np.std(timeseries[start_hour:start_hour+24])}
+def hdf5_files(path):
+    """Find the HDF5 forcing files in a directory tree.
 
-    dict168[group] = {'min': "%.4g" % np.min(timeseries[start_hour:start_hour+168]),
-                         'max': "%.4g" % np.max(timeseries[start_hour:start_hour+168]),
-                         'mean': "%.4g" % np.mean(timeseries[start_hour:start_hour+168]),
-                         'std': "%.4g" % np.std(timeseries[start_hour:start_hour+168])}
+    :arg str path: Directory to search.
 
-    return dict24, dict168
-
-def make_forcing_statistics(path, GridX, GridY, start_hour):
-    files =[]
+    :returns: File paths.
+    :rtype: list
+    """
+    files = []
     for r, d, f in os.walk(path):
         for file in f:
-            if '.hdf5' in file:
+            if file.endswith('.hdf5'):
                 files.append(os.path.join(r, file))
-    stats24_dict = {'variable':{'mean':2, 'min':1, 'max':5, 'std':6}}
-    stats168_dict = {'variable':{'mean':2, 'min':1, 'max':5, 'std':6}}
+    return files
+
+def point_selection(locations):
+    """Calculate the grid indices of a collection of locations, and the slices of the
+    hyperslab that bounds them.
+
+    :arg locations: (GridX, GridY) grid indices of the locations.
+    :type locations: sequence of 2-tuples
+
+    :returns: GridX indices, GridY indices, GridX slice, GridY slice
+    :rtype: tuple
+    """
+    locations = np.asarray(locations, dtype=int).reshape(-1, 2)
+    gridx, gridy = locations[:, 0], locations[:, 1]
+    x_slice = slice(gridx.min(), gridx.max() + 1)
+    y_slice = slice(gridy.min(), gridy.max() + 1)
+    return gridx, gridy, x_slice, y_slice
+
+def read_points(dataset, points):
+    """Read the values at a collection of locations from the surface level of an
+    HDF5 forcing time step dataset.
+
+    :arg dataset: Time step dataset.
+    :type dataset: :py:class:`h5py.Dataset`
+
+    :arg tuple points: Point selection from :py:func:`point_selection`.
+
+    :returns: float64 values at the locations.
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    gridx, gridy, x_slice, y_slice = points
+    if dataset.ndim == 3:
+        hyperslab = dataset[-1, x_slice, y_slice]
+    else:
+        hyperslab = dataset[x_slice, y_slice]
+    return hyperslab[gridx - x_slice.start, gridy - y_slice.start].astype(float)
+
+def consolidated_dataset(f, group):
+    """Get the consolidated (time, [depth,] x, y) dataset of a variable in an HDF5
+    forcing file that has the consolidated layout.
+
+    :arg f: HDF5 forcing file.
+    :type f: :py:class:`h5py.File`
+
+    :arg str group: HDF5 group name of the variable.
+
+    :returns: Consolidated dataset, or None if the file has the per time step layout.
+    :rtype: :py:class:`h5py.Dataset`
+    """
+    if 'Consolidated' in f and group in f['Consolidated']:
+        return f['Consolidated'][group]
+    return None
+
+def read_consolidated_points(dataset, points, n_times):
+    """Read the time series at a collection of locations from the surface level of a
+    consolidated (time, [depth,] x, y) HDF5 forcing dataset.
+
+    The hyperslab that bounds the locations is read for all of the time steps at
+    once, or in blocks of time steps if it is larger than SERIES_READ_BYTES.
+
+    :arg dataset: Consolidated dataset.
+    :type dataset: :py:class:`h5py.Dataset`
+
+    :arg tuple points: Point selection from :py:func:`point_selection`.
+
+    :arg int n_times: Number of time steps to read.
+
+    :returns: float64 values with dimensions (time, location).
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    gridx, gridy, x_slice, y_slice = points
+    hyperslab_bytes = ((x_slice.stop - x_slice.start) * (y_slice.stop - y_slice.start)
+                       * dataset.dtype.itemsize)
+    block = max(1, SERIES_READ_BYTES // hyperslab_bytes)
+    values = np.empty((n_times, len(gridx)))
+    for start in range(0, n_times, block):
+        stop = min(start + block, n_times)
+        if dataset.ndim == 4:
+            hyperslab = dataset[start:stop, -1, x_slice, y_slice]
+        else:
+            hyperslab = dataset[start:stop, x_slice, y_slice]
+        values[start:stop] = hyperslab[:, gridx - x_slice.start, gridy - y_slice.start]
+    return values
+
+class running_stats:
+    """Streaming minimum, maximum, mean, and standard deviation of a variable at a
+    collection of locations.
+
+    Values are added one time step at a time with Welford's algorithm,
+    or in blocks of time steps that are merged with Chan et al.'s parallel algorithm,
+    so the statistics are calculated in one pass without storing the time series.
+    The standard deviation is the population standard deviation, like :py:func:`numpy.std`.
+
+    :arg tuple shape: Shape of the values of each time step.
+
+    :arg float threshold: Value above which to count the time steps that exceed it.
+    """
+
+    def __init__(self, shape=(), threshold=None):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.threshold = threshold
+        self.exceedances = None if threshold is None else np.zeros(shape, dtype=int)
+
+    def add(self, values):
+        """Add the values of one time step.
+
+        :arg values: Values with the accumulator's shape.
+        :type values: :py:class:`numpy.ndarray`
+        """
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+        self.min = np.minimum(self.min, values)
+        self.max = np.maximum(self.max, values)
+        if self.threshold is not None:
+            self.exceedances += values > self.threshold
+
+    def add_block(self, values):
+        """Add the values of a block of time steps.
+
+        :arg values: Values with time as the first dimension.
+        :type values: :py:class:`numpy.ndarray`
+        """
+        if len(values) == 0:
+            return
+        block = running_stats(values.shape[1:], self.threshold)
+        block.count = len(values)
+        block.mean = np.mean(values, axis=0)
+        block.m2 = np.sum((values - block.mean) ** 2, axis=0)
+        block.min = np.min(values, axis=0)
+        block.max = np.max(values, axis=0)
+        if self.threshold is not None:
+            block.exceedances = np.sum(values > self.threshold, axis=0)
+        self.merge(block)
+
+    def merge(self, other):
+        """Merge the statistics of another accumulator into this one.
+
+        :arg other: Accumulator of the same shape.
+        :type other: :py:class:`running_stats`
+        """
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        if self.threshold is not None:
+            self.exceedances = self.exceedances + other.exceedances
+
+    @property
+    def std(self):
+        if self.count == 0:
+            return np.full_like(self.m2, np.nan)
+        return np.sqrt(self.m2 / self.count)
+
+    def arrays(self):
+        """Return the statistics as arrays, including the fraction of time steps that
+        exceed the threshold if there is one.
+        The statistics are NaN if no values have been added.
+
+        :returns: Statistics arrays keyed by statistic name.
+        :rtype: dict
+        """
+        if self.count == 0:
+            nan = np.full_like(self.m2, np.nan)
+            stats = dict.fromkeys(('min', 'max', 'mean', 'std'), nan)
+            if self.threshold is not None:
+                stats['exceedance_fraction'] = nan
+            return stats
+        stats = {'min': self.min, 'max': self.max, 'mean': self.mean, 'std': self.std}
+        if self.threshold is not None:
+            stats['exceedance_fraction'] = self.exceedances / self.count
+        return stats
+
+    def summary(self, index=()):
+        """Return the partial moments, minimum, and maximum at one location as a
+        JSON-serializable dict, so that they can be merged later.
+
+        :arg index: Index of the location.
+
+        :rtype: dict
+        """
+        return {'count': self.count,
+                'mean': float(self.mean[index]),
+                'm2': float(self.m2[index]),
+                'min': float(self.min[index]),
+                'max': float(self.max[index])}
+
+    @classmethod
+    def from_summary(cls, summary):
+        """Create an accumulator from a dict returned by :py:meth:`summary`.
+
+        :arg dict summary: Partial moments, minimum, and maximum.
+
+        :rtype: :py:class:`running_stats`
+        """
+        stats = cls()
+        stats.count = summary['count']
+        for name in ('mean', 'm2', 'min', 'max'):
+            setattr(stats, name, np.array(summary[name]))
+        return stats
+
+    def as_dict(self, index=()):
+        """Format the statistics at one location as 4 significant digit strings.
+
+        :arg index: Index of the location.
+
+        :rtype: dict
+        """
+        if self.count == 0:
+            return dict.fromkeys(('min', 'max', 'mean', 'std'), 'nan')
+        return {'min': "%.4g" % self.min[index],
+                'max': "%.4g" % self.max[index],
+                'mean': "%.4g" % self.mean[index],
+                'std': "%.4g" % self.std[index]}
+
+class window_statistics:
+    """Streaming statistics of forcing variables over a collection of time windows.
+
+    Each time step of a variable is added to the accumulators of all of the windows
+    that include it, so the statistics of any number of windows, of any length,
+    are calculated in one pass over the time series.
+
+    :arg list windows: (start hour, number of hours) of each window.
+                       Hours are indices of the time steps of each variable.
+
+    :arg shape: Shape of the values of each time step;
+                the number of locations for statistics at points.
+    :type shape: int or tuple
+
+    :arg dict thresholds: Values above which to count the time steps that exceed them,
+                          keyed by variable name.
+    """
+
+    def __init__(self, windows, shape, thresholds=None):
+        self.windows = [(int(start), int(hours)) for start, hours in windows]
+        self.shape = shape
+        self.thresholds = thresholds or {}
+        # Variable: [running_stats of each window]
+        self.stats = {}
+
+    def _window_stats(self, variable):
+        if variable not in self.stats:
+            self.stats[variable] = [
+                running_stats(self.shape, self.thresholds.get(variable))
+                for _ in self.windows]
+        return self.stats[variable]
+
+    def add(self, variable, time_index, values):
+        """Add the values of one time step of a variable.
+
+        :arg str variable: Variable name.
+
+        :arg int time_index: Index of the time step.
+
+        :arg values: Values at the locations.
+        :type values: :py:class:`numpy.ndarray`
+        """
+        for (start, hours), stats in zip(self.windows, self._window_stats(variable)):
+            if start <= time_index < start + hours:
+                stats.add(values)
+
+    def add_block(self, variable, time_index, values):
+        """Add a block of time steps of a variable.
+
+        :arg str variable: Variable name.
+
+        :arg int time_index: Index of the first time step of the block.
+
+        :arg values: Values at the locations with time as the first dimension.
+        :type values: :py:class:`numpy.ndarray`
+        """
+        for (start, hours), stats in zip(self.windows, self._window_stats(variable)):
+            first = max(start - time_index, 0)
+            last = max(start + hours - time_index, 0)
+            stats.add_block(values[first:last])
+
+    def add_vector(self, name, time_index, u_values, v_values, block=False,
+                   directions=True):
+        """Add the speed and direction of one time step, or a block of time steps,
+        of a vector variable.
+
+        :arg str name: Prefix of the speed and direction variable names.
+
+        :arg int time_index: Index of the (first) time step.
+
+        :arg u_values: u-direction components at the locations.
+        :type u_values: :py:class:`numpy.ndarray`
+
+        :arg v_values: v-direction components at the locations.
+        :type v_values: :py:class:`numpy.ndarray`
+
+        :arg boolean block: The values are a block of time steps.
+
+        :arg boolean directions: Add the directions as well as the speeds.
+        """
+        add = self.add_block if block else self.add
+        if directions:
+            speed, dir = wind_speed_dir(u_values, v_values)
+            add(f'{name} direction', time_index, dir)
+        else:
+            speed = np.sqrt(u_values**2 + v_values**2)
+        add(f'{name} speed', time_index, speed)
+
+    def statistics(self, window_index, location_index):
+        """Format the statistics of all of the variables for one window and location
+        as 4 significant digit strings.
+
+        :arg int window_index: Index of the window.
+
+        :arg int location_index: Index of the location.
+
+        :returns: Statistics keyed by variable name.
+        :rtype: dict
+        """
+        return {variable: stats[window_index].as_dict(location_index)
+                for variable, stats in self.stats.items()}
+
+def accumulate_forcing_statistics(files, read_values, accumulator, directions=True,
+                                  read_series=None):
+    """Add the time steps of the variables in HDF5 forcing files to a
+    :py:class:`window_statistics` accumulator, reading each time step dataset once.
+
+    The time steps of all of the variables in a file are read together so that the
+    speeds and directions of vectors are calculated on the fly.
+    The components of vectors that are split between files are kept until both of
+    them have been read.
 
+    :arg list files: HDF5 forcing file paths.
+
+    :arg read_values: Function that reads the values to accumulate from a time step
+                      dataset.
+    :type read_values: callable
+
+    :arg accumulator: Accumulator to add the values to.
+    :type accumulator: :py:class:`window_statistics`
+
+    :arg boolean directions: Accumulate the directions of vectors as well as their
+                             speeds.
+
+    :arg read_series: Function that reads the values to accumulate for a number of
+                      time steps from a consolidated dataset;
+                      if it is given, the variables of consolidated layout files are
+                      accumulated in one block each instead of one time step at a time.
+    :type read_series: callable
+
+    :rtype: :py:class:`window_statistics`
+    """
+    # Components of vectors that are split between files
+    components = {}
     for file in files:
         with h5py.File(file, 'r') as f:
-            for group in list(f['Results'].keys()):
-                timeseries = np.array([])
-                for time in list(f['Results'][group].keys()):
-                    if np.ndim(f['Results'][group][time][:]) == 3:
-                        timeseries = np.append(timeseries, f['Results'][group][time][-1, GridX, GridY])
-                    else:
-                        timeseries = np.append(timeseries, f['Results'][group][time][GridX, GridY])
-                stats24_dict, stats168_dict = add_to_dict(group, timeseries, stats24_dict, stats168_dict, start_hour)
-                if group == 'wind velocity X':
-                    windx = timeseries
-                if group == 'wind velocity Y':
-                    windy = timeseries
-                if group == 'velocity U':
-                    currentsu = timeseries
-                if group == 'velocity V':
-                    currentsv = timeseries
-                if group == 'Stokes U':
-                    stokesu = timeseries
-                if group == 'Stokes V':
-                    stokesv = timeseries
-
-    windspeed, winddir = wind_speed_dir(windx, windy)
-    stats24_dict, stats168_dict = add_to_dict('wind speed', windspeed, stats24_dict, stats168_dict, start_hour)
-    stats24_dict, stats168_dict = add_to_dict('wind direction', winddir, stats24_dict, stats168_dict, start_hour)
-
-    currentsspeed, currentsdir = wind_speed_dir(currentsu, currentsv)
-    stats24_dict, stats168_dict = add_to_dict('currents speed', currentsspeed, stats24_dict, stats168_dict, start_hour)
-    stats24_dict, stats168_dict = add_to_dict('currents direction', currentsdir, stats24_dict, stats168_dict, start_hour)
-    
-    stokesspeed, stokesdir = wind_speed_dir(stokesu, stokesv)
-    stats24_dict, stats168_dict = add_to_dict('stokes speed', stokesspeed, stats24_dict, stats168_dict, start_hour)
-    stats24_dict, stats168_dict = add_to_dict('stokes direction', stokesdir, stats24_dict, stats168_dict, start_hour)
-    
-    del stats24_dict['variable']
-    del stats168_dict['variable']
-    
+            datasets = {group: f['Results'][group] for group in f['Results'].keys()}
+            times = {group: list(group_datasets.keys())
+                     for group, group_datasets in datasets.items()}
+            vectors = {name: (u, v) for name, (u, v) in VECTOR_COMPONENTS.items()
+                       if u in datasets and v in datasets}
+            split = {group: None
+                     for (u, v) in VECTOR_COMPONENTS.values() for group in (u, v)
+                     if group in datasets and (u in datasets) != (v in datasets)}
+            consolidated = {group: consolidated_dataset(f, group) for group in datasets}
+            if read_series is not None and None not in consolidated.values():
+                values = {}
+                for group, dataset in consolidated.items():
+                    values[group] = read_series(dataset, len(times[group]))
+                    accumulator.add_block(group, 0, values[group])
+                    if group in split:
+                        split[group] = values[group]
+                for name, (u, v) in vectors.items():
+                    n_times = min(len(values[u]), len(values[v]))
+                    accumulator.add_vector(
+                        name, 0, values[u][:n_times], values[v][:n_times],
+                        block=True, directions=directions)
+                components.update(split)
+                continue
+            for time_index in range(max(map(len, times.values()), default=0)):
+                values = {}
+                for group, group_datasets in datasets.items():
+                    if time_index >= len(times[group]):
+                        continue
+                    values[group] = read_values(
+                        group_datasets[times[group][time_index]])
+                    accumulator.add(group, time_index, values[group])
+                    if group in split:
+                        if split[group] is None:
+                            split[group] = np.empty(
+                                (len(times[group]),) + values[group].shape)
+                        split[group][time_index] = values[group]
+                for name, (u, v) in vectors.items():
+                    if u in values and v in values:
+                        accumulator.add_vector(
+                            name, time_index, values[u], values[v],
+                            directions=directions)
+            components.update(split)
+    for name, (u, v) in VECTOR_COMPONENTS.items():
+        if components.get(u) is not None and components.get(v) is not None:
+            n_times = min(len(components[u]), len(components[v]))
+            accumulator.add_vector(
+                name, 0, components[u][:n_times], components[v][:n_times],
+                block=True, directions=directions)
+    return accumulator
+
+def calculate_forcing_statistics(path, locations, windows):
+    """Calculate the statistics of the forcing variables at a collection of locations
+    over a collection of time windows, with one pass over each of the HDF5 forcing
+    files in a directory tree.
+
+    :arg str path: Directory of HDF5 forcing files.
+
+    :arg locations: (GridX, GridY) grid indices of the locations.
+    :type locations: sequence of 2-tuples
+
+    :arg list windows: (start hour, number of hours) of each window.
+
+    :rtype: :py:class:`window_statistics`
+    """
+    points = point_selection(locations)
+    return accumulate_forcing_statistics(
+        hdf5_files(path),
+        lambda dataset: read_points(dataset, points),
+        window_statistics(windows, len(points[0])),
+        read_series=lambda dataset, n_times: read_consolidated_points(
+            dataset, points, n_times),
+    )
+
+def read_rows(dataset, x_slice):
+    """Read a band of GridX rows from the surface level of an HDF5 forcing time step
+    dataset.
+
+    :arg dataset: Time step dataset.
+    :type dataset: :py:class:`h5py.Dataset`
+
+    :arg slice x_slice: GridX rows to read.
+
+    :returns: float64 values of the rows.
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    if dataset.ndim == 3:
+        return dataset[-1, x_slice, :].astype(float)
+    return dataset[x_slice, :].astype(float)
+
+def _rows_statistics(files, x_slice, n_y, windows, thresholds):
+    accumulator = accumulate_forcing_statistics(
+        files,
+        lambda dataset: read_rows(dataset, x_slice),
+        window_statistics(windows, (x_slice.stop - x_slice.start, n_y), thresholds),
+        directions=False,
+    )
+    return x_slice, {
+        (window_index, variable): stats[window_index].arrays()
+        for variable, stats in accumulator.stats.items()
+        for window_index in range(len(windows))}
+
+def write_statistics_maps(path, maps_file, windows, thresholds=None, workers=1,
+                          chunk_rows=64):
+    """Calculate maps of the statistics of the forcing variables over the whole domain
+    over a collection of time windows, and write them to an HDF5 file.
+
+    \b
+    PATH: Directory of HDF5 forcing files.
+    MAPS_FILE: File path/name of HDF5 file to write the statistics maps to.
+    \f
+
+    The minimum, maximum, mean, and standard deviation of each variable,
+    and of the wind, currents, and Stokes drift speeds,
+    are calculated at each grid cell, at the surface for 3-D variables.
+    The fraction of the time steps that exceed a threshold is also calculated for the
+    variables that have one.
+    The domain is divided into bands of GridX rows that are reduced in parallel on a
+    pool of worker processes, reading each time step dataset once in total,
+    so memory use is bounded by the size of the bands.
+    The maps are stored as compressed float32 datasets in
+    :kbd:`/<hours>h_from_<start hour>/<variable>/<statistic>`.
+
+    :arg str path: Directory of HDF5 forcing files.
+
+    :arg str maps_file: File path/name of HDF5 file to write the statistics maps to.
+
+    :arg list windows: (start hour, number of hours) of each window.
+
+    :arg dict thresholds: Values above which to count the time steps that exceed them,
+                          keyed by variable name.
+
+    :arg int workers: Number of worker processes.
+
+    :arg int chunk_rows: Number of GridX rows in each band.
+    """
+    files = hdf5_files(path)
+    if not files:
+        print(f'No HDF5 forcing files found in {path}')
+        return
+    windows = [(int(start), int(hours)) for start, hours in windows]
+    with h5py.File(files[0], 'r') as f:
+        group = next(iter(f['Results'].values()))
+        domain_shape = next(iter(group.values())).shape[-2:]
+    bands = [slice(x, min(x + chunk_rows, domain_shape[0]))
+             for x in range(0, domain_shape[0], chunk_rows)]
+    with h5py.File(maps_file, 'w') as maps:
+        maps.attrs['forcing_path'] = path
+
+        def write_band(x_slice, band_stats):
+            for (window_index, variable), stats in band_stats.items():
+                start, hours = windows[window_index]
+                window_group = maps.require_group(f'{hours}h_from_{start}')
+                window_group.attrs['start_hour'] = start
+                window_group.attrs['hours'] = hours
+                variable_group = window_group.require_group(variable)
+                if thresholds and variable in thresholds:
+                    variable_group.attrs['threshold'] = thresholds[variable]
+                for name, values in stats.items():
+                    dataset = variable_group.require_dataset(
+                        name, shape=domain_shape,
+                        chunks=(min(chunk_rows, domain_shape[0]), domain_shape[1]),
+                        **MAPS_STORAGE)
+                    dataset[x_slice] = values
+
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(
+                        _rows_statistics, files, x_slice, domain_shape[1], windows,
+                        thresholds)
+                    for x_slice in bands]
+                for future in concurrent.futures.as_completed(futures):
+                    write_band(*future.result())
+        else:
+            for x_slice in bands:
+                write_band(*_rows_statistics(
+                    files, x_slice, domain_shape[1], windows, thresholds))
+
+def write_forcing_statistics(path, locations, windows, stats_file):
+    """Calculate the statistics of the forcing variables at a collection of locations
+    over a collection of time windows, and write them to a YAML file.
+
+    \b
+    PATH: Directory of HDF5 forcing files.
+    STATS_FILE: File path/name of YAML file to write the statistics to.
+    \f
+
+    The statistics are keyed by location (GridX_GridY), then by window
+    (<hours>h_from_<start hour>), then by variable.
+
+    :arg str path: Directory of HDF5 forcing files.
+
+    :arg locations: (GridX, GridY) grid indices of the locations.
+    :type locations: sequence of 2-tuples
+
+    :arg list windows: (start hour, number of hours) of each window.
+
+    :arg str stats_file: File path/name of YAML file to write the statistics to.
+    """
+    accumulator = calculate_forcing_statistics(path, locations, windows)
+    stats = {}
+    for i, (GridX, GridY) in enumerate(locations):
+        stats[f'{GridX}_{GridY}'] = {
+            f'{hours}h_from_{start}': accumulator.statistics(j, i)
+            for j, (start, hours) in enumerate(accumulator.windows)}
+    with open(stats_file, 'w') as outfile:
+        yaml.dump(stats, outfile, default_flow_style=False)
+
+def location_key(GridX, GridY):
+    return f'{GridX}_{GridY}'
+
+def time_range(f):
+    """Read the first and last times, and the number of time records, of an open
+    HDF5 forcing file.
+
+    :arg f: HDF5 forcing file.
+    :type f: :py:class:`h5py.File`
+
+    :returns: ISO format first and last times, and number of time records.
+    :rtype: tuple
+    """
+    times = list(f['Time'].keys())
+    if not times:
+        return None, None, 0
+    first, last = (
+        datetime(*f['Time'][time][()].astype(int)).isoformat() for time in (times[0], times[-1]))
+    return first, last, len(times)
+
+def summarize_file(hdf5_file, locations):
+    """Summarize the variables in an HDF5 forcing file at a collection of locations
+    with their partial moments, minima, and maxima over all of the time steps in the
+    file, and the time range of the file.
+
+    The summaries include the speeds and directions of the vectors whose components
+    are both in the file.
+
+    :arg str hdf5_file: HDF5 forcing file path.
+
+    :arg locations: (GridX, GridY) grid indices of the locations.
+    :type locations: sequence of 2-tuples
+
+    :returns: Summary with :kbd:`time_range`, :kbd:`n_records`, and :kbd:`locations`
+              items; the latter are dicts of :py:meth:`running_stats.summary` dicts
+              keyed by variable name, keyed by location.
+    :rtype: dict
+    """
+    points = point_selection(locations)
+    accumulator = accumulate_forcing_statistics(
+        [hdf5_file],
+        lambda dataset: read_points(dataset, points),
+        window_statistics([(0, sys.maxsize)], len(points[0])),
+        read_series=lambda dataset, n_times: read_consolidated_points(
+            dataset, points, n_times),
+    )
+    with h5py.File(hdf5_file, 'r') as f:
+        first, last, n_records = time_range(f)
+    return {
+        'time_range': [first, last],
+        'n_records': n_records,
+        'locations': {
+            location_key(GridX, GridY): {
+                variable: stats[0].summary(i) for variable, stats in accumulator.stats.items()}
+            for i, (GridX, GridY) in enumerate(locations)},
+    }
+
+def _summarize_files(files_locations):
+    summaries = []
+    for file, locations in files_locations:
+        # The status is taken first so that changes during summarizing are detected
+        stat = os.stat(file)
+        summaries.append((file, stat, summarize_file(file, locations)))
+    return summaries
+
+class statistics_catalog:
+    """Cache of the summaries of the HDF5 forcing files of a campaign of run windows.
+
+    Each summary is keyed by the file path, and is reused for as long as the size and
+    modification time of the file are unchanged.
+    The summaries at each location are added to a file's entry as they are calculated,
+    so only the locations that are new for a file have to be calculated.
+    The catalog is stored in a JSON file.
+
+    :arg str catalog_path: File path/name of JSON file to store the catalog in.
+    """
+
+    def __init__(self, catalog_path):
+        self.catalog_path = catalog_path
+        # File path: {"size": bytes, "mtime": modification time in ns,
+        #             "time_range": [first, last], "n_records": number of time records,
+        #             "locations": {GridX_GridY: {variable: summary}}}
+        self.files = {}
+        if os.path.exists(catalog_path):
+            with open(catalog_path, 'r') as f:
+                stored = json.load(f)
+            if stored.get('version') == CATALOG_VERSION:
+                self.files = stored['files']
+
+    def missing(self, file, locations):
+        """Find the locations that a file has to be summarized at because they are not
+        in the catalog, or because the file has changed.
+
+        :arg str file: HDF5 forcing file path.
+
+        :arg locations: (GridX, GridY) grid indices of the locations.
+        :type locations: sequence of 2-tuples
+
+        :rtype: list
+        """
+        entry = self.files.get(file)
+        stat = os.stat(file)
+        if entry is None or (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime_ns):
+            return list(locations)
+        return [(GridX, GridY) for GridX, GridY in locations
+                if location_key(GridX, GridY) not in entry['locations']]
+
+    def update(self, file, stat, summary):
+        """Add the summary of a file to the catalog.
+
+        :arg str file: HDF5 forcing file path.
+
+        :arg stat: Status of the file when it was summarized.
+        :type stat: :py:class:`os.stat_result`
+
+        :arg dict summary: Summary from :py:func:`summarize_file`.
+        """
+        entry = self.files.get(file)
+        if entry is None or (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime_ns):
+            entry = self.files[file] = {
+                'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'locations': {}}
+        entry['time_range'] = summary['time_range']
+        entry['n_records'] = summary['n_records']
+        entry['locations'].update(summary['locations'])
+
+    def save(self):
+        """Store the catalog in its JSON file."""
+        tmp_path = f'{self.catalog_path}.tmp{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': CATALOG_VERSION, 'files': self.files}, f)
+        os.replace(tmp_path, self.catalog_path)
+
+    def merged(self, files, GridX, GridY):
+        """Merge the summaries of a collection of files at a location.
+
+        :arg list files: HDF5 forcing file paths.
+
+        :arg int GridX: GridX index of the location.
+
+        :arg int GridY: GridY index of the location.
+
+        :returns: Accumulators keyed by variable name.
+        :rtype: dict
+        """
+        merged = {}
+        for file in files:
+            summaries = self.files[file]['locations'][location_key(GridX, GridY)]
+            for variable, summary in summaries.items():
+                stats = running_stats.from_summary(summary)
+                if variable in merged:
+                    merged[variable].merge(stats)
+                else:
+                    merged[variable] = stats
+        return merged
+
+def catalog_forcing_statistics(path, locations, catalog_path, stats_file, workers=1):
+    """Calculate the statistics of the forcing variables at a collection of locations
+    for each of the run window directories of a campaign, and for the campaign as a
+    whole, and write them to a YAML file.
+
+    \b
+    PATH: Directory tree of run window directories of HDF5 forcing files.
+    CATALOG_PATH: File path/name of JSON file to cache the per-file summaries in.
+    STATS_FILE: File path/name of YAML file to write the statistics to.
+    \f
+
+    A summary of each HDF5 forcing file is cached in a catalog,
+    so that only the files that are new or have changed,
+    and the locations that are new for a file,
+    are processed when the command is run again.
+    The directories that have files to process are fanned out on a pool of worker
+    processes.
+    The statistics are calculated over all of the time steps in each directory by
+    merging the cached summaries.
+    The speeds and directions of vectors whose components are written to different
+    files are not included.
+
+    :arg str path: Directory tree of run window directories of HDF5 forcing files.
+
+    :arg locations: (GridX, GridY) grid indices of the locations.
+    :type locations: sequence of 2-tuples
+
+    :arg str catalog_path: File path/name of JSON file to cache the per-file summaries
+                           in.
+
+    :arg str stats_file: File path/name of YAML file to write the statistics to.
+
+    :arg int workers: Number of worker processes.
+    """
+    locations = [(int(GridX), int(GridY)) for GridX, GridY in locations]
+    directories = {}
+    for file in hdf5_files(path):
+        directories.setdefault(os.path.dirname(file), []).append(file)
+    catalog = statistics_catalog(catalog_path)
+    jobs = {}
+    for directory, files in directories.items():
+        files_locations = [(file, catalog.missing(file, locations)) for file in files]
+        files_locations = [(file, missing) for file, missing in files_locations if missing]
+        if files_locations:
+            jobs[directory] = files_locations
+    n_files = sum(len(files_locations) for files_locations in jobs.values())
+    print(f'Summarizing {n_files} of {sum(map(len, directories.values()))} files '
+          f'in {len(jobs)} of {len(directories)} directories...')
+    try:
+        if workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_summarize_files, files_locations)
+                           for files_locations in jobs.values()]
+                for future in concurrent.futures.as_completed(futures):
+                    for file, stat, summary in future.result():
+                        catalog.update(file, stat, summary)
+        else:
+            for files_locations in jobs.values():
+                for file, stat, summary in _summarize_files(files_locations):
+                    catalog.update(file, stat, summary)
+    finally:
+        catalog.save()
+
+    stats = {}
+    for GridX, GridY in locations:
+        location_stats = stats[location_key(GridX, GridY)] = {}
+        for directory in sorted(directories):
+            files = directories[directory]
+            merged = catalog.merged(files, GridX, GridY)
+            time_ranges = [catalog.files[file]['time_range'] for file in files]
+            location_stats[os.path.relpath(directory, path)] = {
+                'time_range': [
+                    min((first for first, _ in time_ranges if first is not None), default=None),
+                    max((last for _, last in time_ranges if last is not None), default=None)],
+                'statistics': {variable: variable_stats.as_dict()
+                               for variable, variable_stats in merged.items()},
+            }
+        merged = catalog.merged(
+            [file for files in directories.values() for file in files], GridX, GridY)
+        location_stats['all'] = {
+            'statistics': {variable: variable_stats.as_dict()
+                           for variable, variable_stats in merged.items()},
+        }
+    with open(stats_file, 'w') as outfile:
+        yaml.dump(stats, outfile, default_flow_style=False)
+
+def make_forcing_statistics(path, GridX, GridY, start_hour):
+    accumulator = calculate_forcing_statistics(
+        path, [(GridX, GridY)], [(start_hour, hours) for hours in DEFAULT_WINDOW_HOURS])
+    stats24_dict, stats168_dict = (accumulator.statistics(j, 0) for j in range(2))
+
     with open(path + '24h_forcing_stats.yaml', 'w') as outfile:
         yaml.dump(stats24_dict,outfile, default_flow_style=False)
 
     with open(path + '168h_forcing_stats.yaml', 'w') as outfile:
         yaml.dump(stats168_dict, outfile, default_flow_style=False)
-
-    
-make_forcing_statistics('/ocean/vdo/MIDOSS/mohid-forcing/zero_winds/04jan20-11jan20/', 249, 342, 2)
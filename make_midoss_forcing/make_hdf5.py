@@ -13,8 +13,16 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import concurrent.futures
+import contextlib
+import csv
 import functools
+import hashlib
+import io
+import json
+import math
 import os
+import resource
 import sys
 import time
 from datetime import datetime, timedelta
@@ -28,6 +36,199 @@ from dateutil.parser import parse
 from make_midoss_forcing import forcing_paths, mohid_interpolate
 
 
+# Names of the variables in the source files from which each datatype is calculated
+SOURCE_VARIABLES = {
+    "ocean_velocity_u": "vozocrtx",
+    "ocean_velocity_v": "vomecrty",
+    "ocean_velocity_w": "vovecrtz",
+    "vert_eddy_diff": "vert_eddy_diff",
+    "salinity": "vosaline",
+    "temperature": "votemper",
+    "e3t": "e3t",
+    "sea_surface_height": "sossheig",
+    "wind_velocity_u": "u_wind",
+    "wind_velocity_v": "v_wind",
+    "mean_wave_period": "t02",
+    "mean_wave_length": "lm",
+    "significant_wave_height": "hs",
+    "whitecap_coverage": "wcc",
+    "stokesU": "uuss",
+    "stokesV": "vuss",
+}
+
+HRDPS_DATATYPES = ("wind_velocity_u", "wind_velocity_v")
+
+WAVEWATCH3_DATATYPES = (
+    "mean_wave_period",
+    "mean_wave_length",
+    "significant_wave_height",
+    "whitecap_coverage",
+    "stokesU",
+    "stokesV",
+)
+
+# HDF5 dataset attributes for each datatype
+METADATA = {
+    "ocean_velocity_u": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([5.0]),
+        "Minimum": numpy.array([-5.0]),
+        "Units": b"m/s",
+    },
+    "ocean_velocity_v": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([5.0]),
+        "Minimum": numpy.array([-5.0]),
+        "Units": b"m/s",
+    },
+    "ocean_velocity_w": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([5.0]),
+        "Minimum": numpy.array([-5.0]),
+        "Units": b"m/s",
+    },
+    "vert_eddy_diff": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([5.0]),
+        "Minimum": numpy.array([0.0]),
+        "Units": b"m2/s",
+    },
+    "salinity": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([100.0]),
+        "Minimum": numpy.array([-100.0]),
+        "Units": b"psu",
+    },
+    "temperature": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([100.0]),
+        "Minimum": numpy.array([-100.0]),
+        "Units": b"?C",
+    },
+    "e3t": {"FillValue": numpy.array([0.0]), "Units": b"m"},
+    "sea_surface_height": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([5.0]),
+        "Minimum": numpy.array([-5.0]),
+        "Units": b"m",
+    },
+    "wind_velocity_u": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([100.0]),
+        "Minimum": numpy.array([-100.0]),
+        "Units": b"m/s",
+    },
+    "wind_velocity_v": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([100.0]),
+        "Minimum": numpy.array([-100.0]),
+        "Units": b"m/s",
+    },
+    "mean_wave_period": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([100000.0]),
+        "Minimum": numpy.array([0.0]),
+        "Units": b"s",
+    },
+    "mean_wave_length": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([3200.0]),
+        "Minimum": numpy.array([0.0]),
+        "Units": b"m",
+    },
+    "significant_wave_height": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([100.0]),
+        "Minimum": numpy.array([-100.0]),
+        "Units": b"m",
+    },
+    "whitecap_coverage": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([1.0]),
+        "Minimum": numpy.array([0.0]),
+        "Units": b"1",
+    },
+    "stokesU": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([9900.0]),
+        "Minimum": numpy.array([-9900.0]),
+        "Units": b"m/s",
+    },
+    "stokesV": {
+        "FillValue": numpy.array([0.0]),
+        "Maximum": numpy.array([9900.0]),
+        "Minimum": numpy.array([-9900.0]),
+        "Units": b"m/s",
+    },
+}
+
+
+# Run description YAML (forcing, section) in which the settings for each datatype are given
+YAML_SECTIONS = {
+    "ocean_velocity_u": ("salish_seacast_forcing", "currents"),
+    "ocean_velocity_v": ("salish_seacast_forcing", "currents"),
+    "ocean_velocity_w": ("salish_seacast_forcing", "vertical_velocity"),
+    "vert_eddy_diff": ("salish_seacast_forcing", "diffusivity"),
+    "salinity": ("salish_seacast_forcing", "salinity"),
+    "temperature": ("salish_seacast_forcing", "temperature"),
+    "e3t": ("salish_seacast_forcing", "e3t"),
+    "sea_surface_height": ("salish_seacast_forcing", "sea_surface_height"),
+    "wind_velocity_u": ("hrdps_forcing", "winds"),
+    "wind_velocity_v": ("hrdps_forcing", "winds"),
+    "mean_wave_period": ("wavewatch3_forcing", "mean_wave_period"),
+    "mean_wave_length": ("wavewatch3_forcing", "mean_wave_length"),
+    "significant_wave_height": ("wavewatch3_forcing", "significant_wave_height"),
+    "whitecap_coverage": ("wavewatch3_forcing", "whitecap_coverage"),
+    "stokesU": ("wavewatch3_forcing", "stokesU"),
+    "stokesV": ("wavewatch3_forcing", "stokesV"),
+}
+
+
+# SalishSeaCast NEMO datatypes with depth levels, which are streamed through the
+# calculations in blocks of time steps when a memory budget is set
+THREE_D_DATATYPES = (
+    "ocean_velocity_u",
+    "ocean_velocity_v",
+    "ocean_velocity_w",
+    "vert_eddy_diff",
+    "salinity",
+    "temperature",
+    "e3t",
+)
+
+# Number of arrays the size of one time step of a 3-D source variable that are held
+# in memory at once while it is unstaggered and transformed to the MOHID grid
+STREAMING_COPIES = 2
+
+# Suffix of the name of the file next to each HDF5 forcing file that records the
+# completed units of work in it, so that interrupted runs can be resumed
+MANIFEST_SUFFIX = ".manifest.jsonl"
+
+# Processing stages that are timed for each datatype and source file
+METRICS_STAGES = ("read", "interpolate", "transform", "write")
+
+# HDF5 forcing file layouts:
+#   per_time_step: a dataset for each time record of each datatype
+#   consolidated: a (time, [depth,] y, x) dataset for each datatype in the
+#                 CONSOLIDATED_GROUP group, exposed as the per time record datasets by
+#                 virtual datasets
+HDF5_LAYOUTS = ("per_time_step", "consolidated")
+CONSOLIDATED_GROUP = "/Consolidated"
+
+
+def format_elapsed(elapsed):
+    """Format an elapsed time as HH:MM:SS.
+
+    :arg float elapsed: Elapsed time in seconds
+
+    :rtype: str
+    """
+    hours = int(elapsed / 3600)
+    mins = int((elapsed - (hours * 3600)) / 60)
+    secs = int((elapsed - (hours * 3600) - (mins * 60)))
+    return f"{hours:02d}:{mins:02d}:{secs:02d}"
+
+
 def function_timer(func):
     @functools.wraps(func)
     def wrapper_function_timer(*args, **kwargs):
@@ -35,16 +236,230 @@ def function_timer(func):
         return_value = func(*args, **kwargs)
         t_end = time.time()
         elapsed = t_end - t_start
-        hours = int(elapsed / 3600)
-        mins = int((elapsed - (hours * 3600)) / 60)
-        secs = int((elapsed - (hours * 3600) - (mins * 60)))
-        print(f"\nTime elapsed: {hours:02d}:{mins:02d}:{secs:02d}\n")
+        print(f"\nTime elapsed: {format_elapsed(elapsed)}\n")
         return return_value
 
     return wrapper_function_timer
 
 
-def mung_array(SSC_gridded_array, array_slice_type):
+class stage_metrics:
+    """Timings and data volumes of the processing of one datatype from one source file.
+
+    :arg str datatype: Datatype
+
+    :arg str source_file: Source file path
+    """
+
+    def __init__(self, datatype, source_file):
+        self.datatype = datatype
+        self.source_file = source_file
+        self.times = dict.fromkeys(METRICS_STAGES, 0.0)
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.n_records = 0
+        # Maximum absolute error, sum of squared errors, and number of values of
+        # reduced precision stored values relative to the float32 values
+        self.errors = None
+
+    def add_errors(self, errors):
+        """Add the errors of a batch of reduced precision stored values.
+
+        :arg tuple errors: Maximum absolute error, sum of squared errors, and number of
+                           values from :py:func:`precision_errors`,
+                           or :py:obj:`None` if the precision of the values was not
+                           reduced
+        """
+        if errors is None:
+            return
+        if self.errors is None:
+            self.errors = errors
+            return
+        self.errors = (
+            max(self.errors[0], errors[0]),
+            self.errors[1] + errors[1],
+            self.errors[2] + errors[2],
+        )
+
+    @contextlib.contextmanager
+    def timing(self, stage):
+        """Context manager that adds the time spent in its block to a stage.
+
+        :arg str stage: Processing stage; one of :py:data:`METRICS_STAGES`
+        """
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[stage] += time.perf_counter() - t_start
+
+    def as_dict(self):
+        """Return the metrics as a JSON-serializable dict, including the throughput
+        of the source data and the peak resident set size of the process so far.
+
+        :rtype: dict
+        """
+        elapsed = sum(self.times.values())
+        record = {
+            "datatype": self.datatype,
+            "source_file": self.source_file,
+            "n_records": self.n_records,
+        }
+        record.update({f"{stage}_time": self.times[stage] for stage in METRICS_STAGES})
+        record.update(
+            {
+                "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written,
+                "throughput_mb_s": (
+                    self.bytes_read / 2 ** 20 / elapsed if elapsed else None
+                ),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+        )
+        if self.errors is not None:
+            max_error, sum_squares, n_values = self.errors
+            record.update(
+                {
+                    "max_error": max_error,
+                    "rms_error": math.sqrt(sum_squares / n_values) if n_values else 0.0,
+                    "error_values": n_values,
+                }
+            )
+        return record
+
+
+def peak_rss_mb():
+    """Get the peak resident set size of the process.
+
+    :return: Peak resident set size in MB
+    :rtype: float
+    """
+    # ru_maxrss is in kB on Linux, and in bytes on macOS
+    scale = 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+class run_metrics:
+    """Collection of the per-datatype and source file metrics of a run.
+
+    Each record is appended to a JSON lines file and/or passed to a callback function
+    as it is added, and a summary table of the records by datatype can be printed at
+    the end of the run.
+
+    :arg str filename: File path/name of JSON lines file to write the records to
+
+    :arg callback: Function to call with each record dict
+    :type callback: callable
+
+    :arg boolean append: Append the records to an existing JSON lines file instead of
+                         starting a new one
+    """
+
+    def __init__(self, filename=None, callback=None, append=False):
+        self.filename = filename
+        self.callback = callback
+        self.records = []
+        if filename is not None and not append:
+            open(filename, "w").close()
+
+    def record(self, record):
+        """Add a record.
+
+        :arg record: Metrics of the processing of one datatype from one source file
+        :type record: :py:class:`stage_metrics` or dict
+        """
+        if isinstance(record, stage_metrics):
+            record = record.as_dict()
+        self.records.append(record)
+        if self.filename is not None:
+            with open(self.filename, "a") as f:
+                f.write(f"{json.dumps(record)}\n")
+        if self.callback is not None:
+            self.callback(record)
+
+    def read(self, filename):
+        """Add the records from a JSON lines metrics file,
+        e.g. one that was written by another task of an array job,
+        without writing them to the file or passing them to the callback.
+
+        :arg str filename: File path/name of JSON lines file to read the records from
+        """
+        with open(filename, "r") as f:
+            self.records.extend(json.loads(line) for line in f if line.strip())
+
+    def summary(self):
+        """Print a table of the stage times, data volumes, throughput,
+        and peak resident set size of the records, totalled by datatype.
+        """
+        if not self.records:
+            return
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(
+                record["datatype"],
+                dict.fromkeys(
+                    ["units"]
+                    + [f"{stage}_time" for stage in METRICS_STAGES]
+                    + ["bytes_read", "bytes_written", "peak_rss_mb"],
+                    0,
+                ),
+            )
+            total["units"] += 1
+            for key in total:
+                if key == "peak_rss_mb":
+                    total[key] = max(total[key], record[key])
+                elif key != "units":
+                    total[key] += record[key]
+        overall = {
+            key: max(total[key] for total in totals.values())
+            if key == "peak_rss_mb"
+            else sum(total[key] for total in totals.values())
+            for key in next(iter(totals.values()))
+        }
+        totals["total"] = overall
+        print(
+            f"\n{'datatype':<24} {'units':>5} {'read (s)':>9} {'interp (s)':>10} "
+            f"{'transf (s)':>10} {'write (s)':>9} {'read (MB)':>10} {'write (MB)':>10} "
+            f"{'MB/s':>7} {'RSS (MB)':>9}"
+        )
+        for datatype, total in totals.items():
+            elapsed = sum(total[f"{stage}_time"] for stage in METRICS_STAGES)
+            throughput = total["bytes_read"] / 2 ** 20 / elapsed if elapsed else 0
+            print(
+                f"{datatype:<24} {total['units']:>5} {total['read_time']:>9.2f} "
+                f"{total['interpolate_time']:>10.2f} {total['transform_time']:>10.2f} "
+                f"{total['write_time']:>9.2f} {total['bytes_read'] / 2 ** 20:>10.1f} "
+                f"{total['bytes_written'] / 2 ** 20:>10.1f} {throughput:>7.1f} "
+                f"{total['peak_rss_mb']:>9.0f}"
+            )
+        self.precision_summary()
+
+    def precision_summary(self):
+        """Print a table of the maximum and RMS errors of the reduced precision stored
+        values relative to the float32 values, by datatype.
+        """
+        errors = {}
+        for record in self.records:
+            if record.get("max_error") is None:
+                continue
+            max_error, sum_squares, n_values = errors.get(
+                record["datatype"], (0.0, 0.0, 0)
+            )
+            errors[record["datatype"]] = (
+                max(max_error, record["max_error"]),
+                sum_squares + record["rms_error"] ** 2 * record["error_values"],
+                n_values + record["error_values"],
+            )
+        if not errors:
+            return
+        print(
+            f"\n{'reduced precision datatype':<28} {'max error':>12} {'RMS error':>12}"
+        )
+        for datatype, (max_error, sum_squares, n_values) in errors.items():
+            rms_error = math.sqrt(sum_squares / n_values) if n_values else 0.0
+            print(f"{datatype:<28} {max_error:>12.4g} {rms_error:>12.4g}")
+
+
+def mung_array(SSC_gridded_array, array_slice_type, out=None):
     """Transform an array containing SalishSeaCast-gridded data and transform it
        into a MOHID-gridded array by:
          1) Cutting off the grid edges
@@ -58,6 +473,10 @@ def mung_array(SSC_gridded_array, array_slice_type):
         :arg array_slice_type: str, one of '2D' or '3D'
         :type str: :py:class:'str'
 
+        :arg out: Optional float32 array to write the MOHID-gridded values into,
+                  so that a buffer can be reused across calls
+        :type numpy.ndarray: :py:class:'ndarray'
+
         :return MOHID_gridded_array: MOHID-gridded array produced by applying operation
                                      1-4 on SSC_gridded_array
         :type numpy.ndarray: :py:class:'ndarray'
@@ -96,11 +515,80 @@ def mung_array(SSC_gridded_array, array_slice_type):
             MOHID_gridded_array = numpy.transpose(MOHID_gridded_array, [0, 1, 3, 2])
             MOHID_gridded_array = numpy.flip(MOHID_gridded_array, axis=1)
 
-    MOHID_gridded_array = numpy.nan_to_num(MOHID_gridded_array).astype("float32")
+    # The slicing, transposing, and flipping above only create views, so the values
+    # are copied and converted to float32 once, and then cleaned up in place
+    if out is None:
+        out = numpy.empty(MOHID_gridded_array.shape, dtype="float32")
+    numpy.copyto(out, MOHID_gridded_array, casting="unsafe")
+    MOHID_gridded_array = fill_nans(out)
 
     return MOHID_gridded_array
 
 
+def fill_nans(array):
+    """Clip infinities and convert NaNs to 0 in place, like :py:func:`numpy.nan_to_num`.
+
+    The NaNs are found one slice of the first dimension at a time so that the
+    NaN mask is small.
+
+    :arg array: Floating point array
+    :type array: :py:class:`numpy.ndarray`
+
+    :return: :kbd:`array`
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    finfo = numpy.finfo(array.dtype)
+    numpy.clip(array, finfo.min, finfo.max, out=array)
+    for array_slice in array:
+        numpy.copyto(array_slice, 0, where=numpy.isnan(array_slice))
+    return array
+
+
+def unstagger_mung_array(vel_component, coordinate, out=None):
+    """Interpolate u or v velocity component values to values at grid cell centres and
+    transform them into a MOHID-gridded array in one pass.
+
+    The result is the same as
+    :kbd:`mung_array(unstagger_dataarray(vel_component, coordinate).values, "3D")`,
+    but only the interior grid cells that :py:func:`mung_array` keeps are calculated,
+    and their values are written directly into the MOHID-gridded array.
+
+    :arg vel_component: SalishSeaCast-gridded u or v component values with
+                        dimensions (depth, y, x) or (time, depth, y, x)
+    :type vel_component: :py:class:`numpy.ndarray`
+
+    :arg str coordinate: Name of coordinate along which to centre; :kbd:`x` for u,
+                         or :kbd:`y` for v
+
+    :arg out: Optional float32 array to write the MOHID-gridded values into
+    :type out: :py:class:`numpy.ndarray`
+
+    :return: MOHID-gridded values
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    interior = vel_component[..., 1:-1, 1:-1]
+    if coordinate == "x":
+        neighbours = vel_component[..., 1:-1, :-2]
+    else:
+        neighbours = vel_component[..., :-2, 1:-1]
+    if out is None:
+        shape = interior.shape[:-2] + interior.shape[:-3:-1]
+        out = numpy.empty(shape, dtype="float32")
+    # SalishSeaCast-gridded view of the MOHID-gridded array;
+    # i.e. with the x and y axes transposed back and the depth dimension flipped back
+    ssc_gridded_out = numpy.swapaxes(numpy.flip(out, axis=-3), -1, -2)
+    # Averaging and cleaning up each (y, x) slice in a small contiguous array before
+    # copying it into the transposed view is about twice as fast as averaging into the
+    # view directly
+    level = numpy.empty(interior.shape[-2:], dtype=interior.dtype)
+    for index in numpy.ndindex(interior.shape[:-2]):
+        numpy.add(interior[index], neighbours[index], out=level)
+        level /= 2
+        fill_nans(level[numpy.newaxis])
+        numpy.copyto(ssc_gridded_out[index], level, casting="unsafe")
+    return out
+
+
 def produce_datearray(datetimelist):
     """Produce a list of date arrays from a list of datetime objects
     """
@@ -132,16 +620,54 @@ def unstagger_dataarray(vel_component, coordinate):
     return vel_component
 
 
-def process_grid(
-    file_paths,
-    datatype,
-    filename,
-    groupname,
-    salishseacast_grid_path,
-    weighting_matrix_obj=None,
-):
-    accumulator = 1
-    print(f"Writing {groupname} to {filename}...")
+class grid_geometry:
+    """Static SalishSeaCast NEMO grid fields in MOHID layout that are shared by all of
+    the datatypes processed in a run.
+
+    :arg tmask: MOHID-gridded tmask
+    :type tmask: :py:class:`numpy.ndarray`
+    """
+
+    def __init__(self, tmask):
+        self.tmask = tmask
+        self.shape = tmask.shape
+        # The depth dimension is flipped in MOHID layout, so the surface is the last level
+        surface = tmask[-1] != 0
+        self.water_points = numpy.flatnonzero(surface)
+        self.land_points = numpy.flatnonzero(~surface)
+        # SalishSeaCast-gridded (y, x) surface mask that is True at water points;
+        # the grid edges are cut off by mung_array() so they are excluded
+        self.grid_shape = (surface.shape[1] + 2, surface.shape[0] + 2)
+        self.water_mask = numpy.zeros(self.grid_shape, dtype=bool)
+        self.water_mask[1:-1, 1:-1] = surface.T
+
+
+@functools.lru_cache(maxsize=None)
+def load_grid_geometry(salishseacast_grid_path, cache_dir=None):
+    """Load the SalishSeaCast grid geometry.
+
+    The geometry is loaded once per process.
+    If :kbd:`cache_dir` is given the MOHID-gridded tmask is stored there in a
+    :kbd:`.npy` file that is memory-mapped on subsequent loads,
+    so that the mesh mask is only read once for all runs and worker processes.
+    The cache file of a mesh mask file is keyed by its path, size, and modification
+    time, so that a mesh mask that is regenerated in place is read again.
+
+    :arg str salishseacast_grid_path: URL or path of SalishSeaCast NEMO mesh mask
+
+    :arg str cache_dir: Directory to store the MOHID-gridded tmask in
+
+    :rtype: :py:class:`make_midoss_forcing.make_hdf5.grid_geometry`
+    """
+    if cache_dir is not None:
+        key_source = salishseacast_grid_path
+        if os.path.exists(salishseacast_grid_path):
+            stat = os.stat(salishseacast_grid_path)
+            key_source = f"{key_source}:{stat.st_size}:{stat.st_mtime_ns}"
+        key = hashlib.sha256(key_source.encode()).hexdigest()[:16]
+        cache_path = os.path.join(cache_dir, f"tmask_{key}.npy")
+        if os.path.exists(cache_path):
+            return grid_geometry(numpy.load(cache_path, mmap_mode="r"))
     tmask = mung_array(
         # Exclude the time coordinate from tmask via array indexing so that we don't have to
         # know the name of the time variable because it differs between file and ERDDAP data
@@ -149,238 +675,855 @@ def process_grid(
         xarray.open_dataset(salishseacast_grid_path).tmask[0].values,
         "3D",
     )
-    for file_path in file_paths:
-        data = xarray.open_dataset(file_path)
-        if datatype in (
-            "mean_wave_period",
-            "mean_wave_length",
-            "significant_wave_height",
-            "whitecap_coverage",
-            "stokesU",
-            "stokesV",
-        ):
-            datetimelist = (
-                data.time.values[1::2].astype("datetime64[s]").astype(datetime)
-            )
+    if cache_dir is None:
+        return grid_geometry(tmask)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+    numpy.save(tmp_path, tmask)
+    os.replace(tmp_path, cache_path)
+    return grid_geometry(numpy.load(cache_path, mmap_mode="r"))
+
+
+def read_datearrays(data, datatype):
+    """Read the date arrays of the time steps that are used from a source dataset.
+
+    WaveWatch3 results are half-hourly, so only every other time step is used.
+
+    :arg data: Source dataset
+    :type data: :py:class:`xarray.Dataset`
+
+    :arg str datatype: Datatype that is being processed
+
+    :rtype: list
+    """
+    if datatype in WAVEWATCH3_DATATYPES:
+        datetimelist = data.time.values[1::2].astype("datetime64[s]").astype(datetime)
+    else:
+        datetimelist = data.time_counter.values.astype("datetime64[s]").astype(datetime)
+    return produce_datearray(datetimelist)
+
+
+def read_source_values(data, datatype):
+    """Read the values of the time steps that are used for a datatype from a source dataset.
+
+    :arg data: Source dataset
+    :type data: :py:class:`xarray.Dataset`
+
+    :arg str datatype: Datatype that is being processed
+
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    if datatype in WAVEWATCH3_DATATYPES:
+        return data[SOURCE_VARIABLES[datatype]].values[1::2, :, :]
+    return data[SOURCE_VARIABLES[datatype]].values
+
+
+def calculate_grid(
+    data,
+    datatype,
+    tmask=None,
+    weighting_matrix_obj=None,
+    interpolation_method="vectorized",
+    water_mask=None,
+    interpolation_threads=1,
+    out=None,
+    metrics=None,
+):
+    """Calculate the MOHID-gridded values of a datatype from a source dataset.
+
+    :arg data: Source dataset
+    :type data: :py:class:`xarray.Dataset`
+
+    :arg str datatype: Datatype to calculate
+
+    :arg tmask: MOHID-gridded SalishSeaCast tmask; required for :kbd:`e3t`
+    :type tmask: :py:class:`numpy.ndarray`
+
+    :arg weighting_matrix_obj: Interpolation weights; required for HRDPS and WaveWatch3
+                               datatypes
+
+    :arg str interpolation_method: Interpolation engine to use
+
+    :arg water_mask: SalishSeaCast grid water points mask to restrict interpolation to
+    :type water_mask: :py:class:`numpy.ndarray`
+
+    :arg int interpolation_threads: Number of threads to use for interpolation
+
+    :arg out: float32 array to write the MOHID-gridded values of 3-D datatypes into
+    :type out: :py:class:`numpy.ndarray`
+
+    :arg metrics: Metrics to add the read, interpolation, and transform times,
+                  and the number of bytes read, to
+    :type metrics: :py:class:`stage_metrics`
+
+    :return: MOHID-gridded values
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    if metrics is None:
+        metrics = stage_metrics(datatype, None)
+    with metrics.timing("read"):
+        grid = read_source_values(data, datatype)
+    metrics.bytes_read += data[SOURCE_VARIABLES[datatype]].nbytes
+    if datatype in HRDPS_DATATYPES + WAVEWATCH3_DATATYPES:
+        if datatype in HRDPS_DATATYPES:
+            interpolate = mohid_interpolate.hrdps
         else:
-            datetimelist = data.time_counter.values.astype("datetime64[s]").astype(
-                datetime
+            interpolate = mohid_interpolate.wavewatch
+        with metrics.timing("interpolate"):
+            grid = interpolate(
+                grid,
+                weighting_matrix_obj,
+                interpolation_method,
+                water_mask,
+                threads=interpolation_threads,
             )
-        datearrays = produce_datearray(datetimelist)
-        del datetimelist
+    with metrics.timing("transform"):
         if datatype == "ocean_velocity_u":
-            data = unstagger_dataarray(data.vozocrtx, "x").values
-            data = mung_array(data, "3D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([5.0]),
-                "Minimum": numpy.array([-5.0]),
-                "Units": b"m/s",
-            }
+            grid = unstagger_mung_array(grid, "x", out)
         elif datatype == "ocean_velocity_v":
-            data = unstagger_dataarray(data.vomecrty, "y").values
-            data = mung_array(data, "3D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([5.0]),
-                "Minimum": numpy.array([-5.0]),
-                "Units": b"m/s",
-            }
-        elif datatype == "ocean_velocity_w":
-            data = data.vovecrtz.values
-            data = mung_array(data, "3D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([5.0]),
-                "Minimum": numpy.array([-5.0]),
-                "Units": b"m/s",
-            }
-        elif datatype == "vert_eddy_diff":
-            data = data.vert_eddy_diff.values
-            data = mung_array(data, "3D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([5.0]),
-                "Minimum": numpy.array([0.0]),
-                "Units": b"m2/s",
-            }
-        elif datatype == "salinity":
-            data = data.vosaline.values
-            data = mung_array(data, "3D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([100.0]),
-                "Minimum": numpy.array([-100.0]),
-                "Units": b"psu",
-            }
-        elif datatype == "temperature":
-            data = data.votemper.values
-            data = mung_array(data, "3D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([100.0]),
-                "Minimum": numpy.array([-100.0]),
-                "Units": b"?C",
-            }
-
+            grid = unstagger_mung_array(grid, "y", out)
         elif datatype == "e3t":
-            data = data.e3t.values
-            data = mung_array(data, "3D")
-            data = data * tmask
-            metadata = {"FillValue": numpy.array([0.0]), "Units": b"m"}
-
-        elif datatype == "sea_surface_height":
-            data = data.sossheig.values
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([5.0]),
-                "Minimum": numpy.array([-5.0]),
-                "Units": b"m",
-            }
-        elif datatype == "wind_velocity_u":
-            data = data.u_wind.values
-            data = mohid_interpolate.hrdps(data, weighting_matrix_obj)
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([100.0]),
-                "Minimum": numpy.array([-100.0]),
-                "Units": b"m/s",
-            }
-        elif datatype == "wind_velocity_v":
-            data = data.v_wind.values
-            data = mohid_interpolate.hrdps(data, weighting_matrix_obj)
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([100.0]),
-                "Minimum": numpy.array([-100.0]),
-                "Units": b"m/s",
-            }
-        elif datatype == "mean_wave_period":
-            data = data.t02.values[1::2, :, :]
-            data = mohid_interpolate.wavewatch(data, weighting_matrix_obj)
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([100000.0]),
-                "Minimum": numpy.array([0.0]),
-                "Units": b"s",
-            }
-        elif datatype == "mean_wave_length":
-            data = data.lm.values[1::2, :, :]
-            data = mohid_interpolate.wavewatch(data, weighting_matrix_obj)
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([3200.0]),
-                "Minimum": numpy.array([0.0]),
-                "Units": b"m",
-            }
-        elif datatype == "significant_wave_height":
-            data = data.hs.values[1::2, :, :]
-            data = mohid_interpolate.wavewatch(data, weighting_matrix_obj)
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([100.0]),
-                "Minimum": numpy.array([-100.0]),
-                "Units": b"m",
-            }
-        elif datatype == "whitecap_coverage":
-            data = data.wcc.values[1::2, :, :]
-            data = mohid_interpolate.wavewatch(data, weighting_matrix_obj)
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([1.0]),
-                "Minimum": numpy.array([0.0]),
-                "Units": b"1",
-            }
-        elif datatype == "stokesU":
-            data = data.uuss.values[1::2, :, :]
-            data = mohid_interpolate.wavewatch(data, weighting_matrix_obj)
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([9900.0]),
-                "Minimum": numpy.array([-9900.0]),
-                "Units": b"m/s",
-            }
-        elif datatype == "stokesV":
-            data = data.vuss.values[1::2, :, :]
-            data = mohid_interpolate.wavewatch(data, weighting_matrix_obj)
-            data = mung_array(data, "2D")
-            metadata = {
-                "FillValue": numpy.array([0.0]),
-                "Maximum": numpy.array([9900.0]),
-                "Minimum": numpy.array([-9900.0]),
-                "Units": b"m/s",
-            }
-        write_grid(data, datearrays, metadata, filename, groupname, accumulator)
-        accumulator += len(datearrays)
+            grid = mung_array(grid, "3D", out)
+            grid *= tmask
+        elif datatype in THREE_D_DATATYPES:
+            grid = mung_array(grid, "3D", out)
+        else:
+            grid = mung_array(grid, "2D")
+    return grid
 
 
-def write_grid(data, datearrays, metadata, filename, groupname, accumulator):
-    shape = data[0].shape
-    with h5py.File(filename, "a") as f:
-        time_group = f.get("/Time")
-        if time_group is None:
-            time_group = f.create_group("/Time")
-        data_group_path = f"/Results/{groupname}"
-        data_group = f.get(data_group_path)
-        if data_group is None:
-            data_group = f.create_group(data_group_path)
-
-        for i, datearray in enumerate(datearrays):
-            child_name = f"Time_{i + accumulator:05d}"
-            timestamp = time_group.get(child_name)
-            if timestamp is None:
-                dataset = time_group.create_dataset(
-                    child_name, shape=(6,), data=datearray
+def source_file_grids(
+    data,
+    datatypes,
+    tmask=None,
+    weighting_matrix_obj=None,
+    interpolation_method="vectorized",
+    water_mask=None,
+    interpolation_threads=1,
+    batch_variables=True,
+    memory_budget_mb=None,
+    buffers=None,
+    metrics=None,
+):
+    """Generate the MOHID-gridded values of the datatypes that are calculated from a
+    source dataset, in the order of :kbd:`datatypes`.
+
+    The values are calculated one datatype at a time, as they are consumed,
+    except that HRDPS or WaveWatch3 datatypes, which share interpolation weights,
+    are stacked and interpolated with a single application of the weights when
+    :kbd:`batch_variables` is :py:obj:`True`.
+    When :kbd:`memory_budget_mb` is given, 3-D datatypes are read, unstaggered,
+    and transformed in blocks of time steps that fit in the budget,
+    so that peak memory use does not depend on the number of time steps in the
+    source dataset.
+    The values of 3-D datatypes are written into float32 buffers that are reused for
+    each datatype and block of the same shape, so they must be consumed before the
+    next values are generated.
+
+    :arg data: Source dataset
+    :type data: :py:class:`xarray.Dataset`
+
+    :arg list datatypes: Datatypes to calculate
+
+    :arg tmask: MOHID-gridded SalishSeaCast tmask; required for :kbd:`e3t`
+    :type tmask: :py:class:`numpy.ndarray`
+
+    :arg weighting_matrix_obj: Interpolation weights; required for HRDPS and WaveWatch3
+                               datatypes
+
+    :arg str interpolation_method: Interpolation engine to use
+
+    :arg water_mask: SalishSeaCast grid water points mask to restrict interpolation to
+    :type water_mask: :py:class:`numpy.ndarray`
+
+    :arg int interpolation_threads: Number of threads to use for interpolation
+
+    :arg boolean batch_variables: Interpolate all of the HRDPS or WaveWatch3 datatypes
+                                  together
+
+    :arg float memory_budget_mb: Memory budget in MB for the calculation of each 3-D
+                                 datatype
+
+    :arg dict buffers: float32 buffers for the values of 3-D datatypes keyed by shape,
+                       to reuse across source datasets
+
+    :arg dict metrics: :py:class:`stage_metrics` objects keyed by datatype to add the
+                       read, interpolation, and transform times, and the numbers of
+                       bytes read, to.
+                       The time of the batched interpolation is shared equally between
+                       the datatypes.
+
+    :return: (datatype, index of first time step, MOHID-gridded values) tuples
+    :rtype: generator
+    """
+    interpolated = [
+        datatype
+        for datatype in datatypes
+        if datatype in HRDPS_DATATYPES + WAVEWATCH3_DATATYPES
+    ]
+    if interpolated and interpolated[0] in WAVEWATCH3_DATATYPES:
+        interpolate = mohid_interpolate.wavewatch
+    else:
+        interpolate = mohid_interpolate.hrdps
+    if buffers is None:
+        buffers = {}
+    if metrics is None:
+        metrics = {}
+    for datatype in datatypes:
+        metrics.setdefault(datatype, stage_metrics(datatype, None))
+    batched = {}
+    if batch_variables and len(interpolated) > 1:
+        values = []
+        for datatype in interpolated:
+            with metrics[datatype].timing("read"):
+                values.append(read_source_values(data, datatype))
+            metrics[datatype].bytes_read += data[SOURCE_VARIABLES[datatype]].nbytes
+        t_start = time.perf_counter()
+        stacked = interpolate(
+            numpy.stack(values),
+            weighting_matrix_obj,
+            interpolation_method,
+            water_mask,
+            threads=interpolation_threads,
+        )
+        elapsed = time.perf_counter() - t_start
+        for datatype in interpolated:
+            metrics[datatype].times["interpolate"] += elapsed / len(interpolated)
+        batched = dict(zip(interpolated, stacked))
+        del values, stacked
+    for datatype in datatypes:
+        if datatype in batched:
+            with metrics[datatype].timing("transform"):
+                grid = mung_array(batched.pop(datatype), "2D")
+            yield datatype, 0, grid
+        elif datatype in THREE_D_DATATYPES:
+            variable = data[SOURCE_VARIABLES[datatype]]
+            time_dim = variable.dims[0]
+            n_steps = variable.shape[0]
+            block_size = n_steps
+            if memory_budget_mb is not None:
+                block_size = time_block_size(variable, memory_budget_mb)
+            # MOHID grid has the grid edges cut off and the x and y axes transposed
+            nz, ny, nx = variable.shape[1:]
+            shape = (block_size, nz, nx - 2, ny - 2)
+            if shape not in buffers:
+                buffers[shape] = numpy.empty(shape, dtype="float32")
+            for block_start in range(0, n_steps, block_size):
+                block = data
+                if block_size < n_steps:
+                    block = data.isel(
+                        {time_dim: slice(block_start, block_start + block_size)}
+                    )
+                out = buffers[shape][: min(block_size, n_steps - block_start)]
+                yield datatype, block_start, calculate_grid(
+                    block, datatype, tmask, out=out, metrics=metrics[datatype]
                 )
-                time_metadata = {
-                    "Maximum": numpy.array(datearray[0]),
-                    "Minimum": numpy.array([-0.0]),
-                    "Units": b"YYYY/MM/DD HH:MM:SS",
-                }
-                dataset.attrs.update(time_metadata)
-            else:
-                assert (
-                    numpy.asarray(timestamp) == datearray
-                ).all(), f"Time record {child_name} exists and does not match with {datearray}"
+        else:
+            yield datatype, 0, calculate_grid(
+                data,
+                datatype,
+                tmask,
+                weighting_matrix_obj,
+                interpolation_method,
+                water_mask,
+                interpolation_threads,
+                metrics=metrics[datatype],
+            )
+
+
+def time_block_size(variable, memory_budget_mb):
+    """Calculate the number of time steps of a 3-D source variable that can be
+    unstaggered and transformed to the MOHID grid at once within a memory budget.
+
+    :arg variable: Source variable with time as the first dimension
+    :type variable: :py:class:`xarray.DataArray`
+
+    :arg float memory_budget_mb: Memory budget in MB
+
+    :return: Number of time steps; at least 1
+    :rtype: int
+    """
+    n_steps = variable.shape[0]
+    step_size = variable.size // max(n_steps, 1)
+    step_bytes = step_size * max(variable.dtype.itemsize, 4) * STREAMING_COPIES
+    return max(1, min(n_steps, int(memory_budget_mb * 2 ** 20 // step_bytes)))
 
+
+def storage_settings(run_description, datatype):
+    """Get the HDF5 storage settings for a datatype from a run description.
+
+    The top level :kbd:`hdf5_storage` settings apply to all datatypes,
+    and are updated by the :kbd:`hdf5_storage` settings in the datatype's section.
+    The top level :kbd:`compression_opts` are dropped if the datatype's section
+    sets a different :kbd:`compression`.
+
+    :arg dict run_description: Run description
+
+    :arg str datatype: Datatype
+
+    :rtype: dict
+    """
+    forcing, section = YAML_SECTIONS[datatype]
+    settings = dict(run_description.get("hdf5_storage") or {})
+    section_settings = (
+        ((run_description.get(forcing) or {}).get(section) or {}).get("hdf5_storage")
+    ) or {}
+    if "compression" in section_settings:
+        # Compression options are specific to the compression filter
+        settings.pop("compression_opts", None)
+    settings.update(section_settings)
+    return settings
+
+
+def dataset_storage_kwargs(settings):
+    """Translate HDF5 storage settings into :py:meth:`h5py.Group.create_dataset`
+    keyword arguments.
+
+    :kbd:`compression` may be :kbd:`gzip`, :kbd:`lzf`, or the name of a filter class
+    in the optional :kbd:`hdf5plugin` package (e.g. :kbd:`Zstd`, :kbd:`Blosc`);
+    :kbd:`compression_opts` is the gzip level, or a dict of keyword arguments for a
+    plugin filter class.
+    :kbd:`shuffle` enables the byte shuffle filter.
+    :kbd:`chunks` is a list giving the chunk shape, or :py:obj:`True` for automatic
+    chunking.
+
+    The precision of the stored values is reduced by:
+    :kbd:`scaleoffset`, the number of decimal digits to keep with the HDF5 scale-offset
+    filter;
+    :kbd:`dtype`, the storage type (e.g. :kbd:`float16`) that the float32 values
+    are converted to;
+    and :kbd:`keep_bits`, the number of float32 mantissa bits to round the values to
+    before they are written so that they compress better.
+    :kbd:`keep_bits` is not a :py:meth:`h5py.Group.create_dataset` keyword argument;
+    it is applied by :py:meth:`hdf5_writer.write`.
+
+    :arg dict settings: HDF5 storage settings
+
+    :rtype: dict
+    """
+    kwargs = {}
+    compression = settings.get("compression")
+    if compression in ("gzip", "lzf"):
+        kwargs["compression"] = compression
+        if settings.get("compression_opts") is not None:
+            kwargs["compression_opts"] = settings["compression_opts"]
+    elif compression is not None:
+        try:
+            import hdf5plugin
+        except ImportError:
+            print(
+                f"hdf5plugin package is required for {compression} compression; "
+                f"writing uncompressed datasets"
+            )
+        else:
+            kwargs.update(
+                getattr(hdf5plugin, compression)(
+                    **(settings.get("compression_opts") or {})
+                )
+            )
+    if settings.get("shuffle"):
+        kwargs["shuffle"] = True
+    chunks = settings.get("chunks")
+    if chunks is not None:
+        kwargs["chunks"] = chunks if chunks is True else tuple(chunks)
+    for key in ("scaleoffset", "dtype", "keep_bits"):
+        if settings.get(key) is not None:
+            kwargs[key] = settings[key]
+    return kwargs
+
+
+def round_bits(values, keep_bits):
+    """Round float32 values to a number of mantissa bits, with ties rounded to even.
+
+    The dropped mantissa bits are set to zero so that the values compress much better,
+    and the relative error of each value is at most :kbd:`2**-(keep_bits + 1)`.
+    NaN and infinite values are returned unchanged.
+
+    :arg values: float32 values
+    :type values: :py:class:`numpy.ndarray`
+
+    :arg int keep_bits: Number of mantissa bits to keep; 0 to 23
+
+    :return: Rounded copy of the values
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    values = numpy.array(values, dtype="float32")
+    drop_bits = 23 - keep_bits
+    if drop_bits <= 0:
+        return values
+    # Rounding the mantissa bits of NaN can carry into the sign bit
+    non_finite = ~numpy.isfinite(values)
+    special_values = values[non_finite]
+    bits = values.view("uint32")
+    half = numpy.uint32((1 << (drop_bits - 1)) - 1)
+    bits += ((bits >> numpy.uint32(drop_bits)) & numpy.uint32(1)) + half
+    bits &= numpy.uint32(~((1 << drop_bits) - 1) & 0xFFFFFFFF)
+    values[non_finite] = special_values
+    return values
+
+
+def scale_offset_values(values, digits, chunks):
+    """Get the values that the HDF5 scale-offset filter stores with decimal
+    (D-scaling) precision.
+
+    The values are written to an in-memory HDF5 file that is closed before they are
+    read back, because values that are read from a file that is open for writing
+    come from the HDF5 chunk cache, before the filter is applied to them.
+
+    :arg values: Values
+    :type values: :py:class:`numpy.ndarray`
+
+    :arg int digits: Number of decimal digits to keep
+
+    :arg tuple chunks: Chunk shape of the dataset that the values are stored in
+
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    buffer = io.BytesIO()
+    with h5py.File(buffer, "w") as f:
+        f.create_dataset(
+            "values", data=values, chunks=tuple(chunks), scaleoffset=digits
+        )
+    with h5py.File(buffer, "r") as f:
+        return f["values"][()]
+
+
+def precision_errors(reference, stored):
+    """Calculate the errors of reduced precision stored values relative to the float32
+    values that they were calculated from.
+
+    The values are compared one (y, x) slice at a time to bound the memory used.
+
+    :arg reference: float32 values
+    :type reference: :py:class:`numpy.ndarray`
+
+    :arg stored: Values that were read back from the HDF5 file
+    :type stored: :py:class:`numpy.ndarray`
+
+    :return: Maximum absolute error, sum of squared errors, and number of values
+    :rtype: tuple
+    """
+    max_error, sum_squares = 0.0, 0.0
+    slice_shape = (-1,) + reference.shape[-2:]
+    for ref, value in zip(reference.reshape(slice_shape), stored.reshape(slice_shape)):
+        diff = (value.astype("float64") - ref).ravel()
+        if diff.size:
+            max_error = max(max_error, float(numpy.abs(diff).max()))
+            sum_squares += float(numpy.dot(diff, diff))
+    return max_error, sum_squares, reference.size
+
+
+class hdf5_writer:
+    """Writer that keeps an HDF5 forcing file open for a whole run.
+
+    The names and values of the existing :kbd:`/Time` records, and the names of the
+    existing datasets in each :kbd:`/Results` group, are read once when they are first
+    needed so that each batch of time records can be validated without further reads
+    from the file.
+
+    In the :kbd:`consolidated` layout the values of each datatype are stored in one
+    extendable (time, [depth,] y, x) dataset in the :kbd:`/Consolidated` group,
+    and the :kbd:`/Time` records in a (time, 6) dataset,
+    so that time series can be read with one hyperslab read.
+    The :kbd:`/Time/Time_xxxxx` and :kbd:`/Results/<group>/<group>_xxxxx` datasets
+    that MOHID reads are virtual datasets that map to the time records of the
+    consolidated datasets.
+
+    :arg str filename: HDF5 file path/name
+
+    :arg str mode: :py:class:`h5py.File` mode;
+                   :kbd:`w` to create the file, :kbd:`a` to add to it
+
+    :arg str layout: HDF5 forcing file layout; one of :py:data:`HDF5_LAYOUTS`
+    """
+
+    def __init__(self, filename, mode="a", layout="per_time_step"):
+        self.filename = filename
+        self.layout = layout
+        self.file = h5py.File(filename, mode)
+        self.time_group = self.file.require_group("/Time")
+        self.time_index = {
+            name: numpy.asarray(dataset) for name, dataset in self.time_group.items()
+        }
+        self.data_groups = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def flush(self):
+        self.file.flush()
+
+    def _data_group(self, groupname):
+        if groupname not in self.data_groups:
+            data_group = self.file.require_group(f"/Results/{groupname}")
+            self.data_groups[groupname] = (data_group, set(data_group.keys()))
+        return self.data_groups[groupname]
+
+    def has_records(self, groupname, accumulator, n_records):
+        """Check whether the datasets and :kbd:`/Time` records of a batch of time
+        records of a datatype are in the file.
+
+        :arg str groupname: HDF5 group name of the datatype
+
+        :arg int accumulator: Index of the first time record
+
+        :arg int n_records: Number of time records
+
+        :rtype: boolean
+        """
+        _, existing = self._data_group(groupname)
+        return all(
+            f"{groupname}_{i:05d}" in existing and f"Time_{i:05d}" in self.time_index
+            for i in range(accumulator, accumulator + n_records)
+        )
+
+    def discard_records(self, groupname, accumulator, n_records):
+        """Delete the datasets of a batch of time records of a datatype that may have
+        been left incomplete by an interrupted run.
+
+        :arg str groupname: HDF5 group name of the datatype
+
+        :arg int accumulator: Index of the first time record
+
+        :arg int n_records: Number of time records
+        """
+        data_group, existing = self._data_group(groupname)
+        for i in range(accumulator, accumulator + n_records):
+            child_name = f"{groupname}_{i:05d}"
+            if child_name in existing:
+                del data_group[child_name]
+                existing.discard(child_name)
+
+    def write(self, data, datearrays, metadata, groupname, accumulator, storage=None):
+        """Write a batch of time records of a datatype.
+
+        :arg data: MOHID-gridded values with time as the first dimension
+        :type data: :py:class:`numpy.ndarray`
+
+        :arg list datearrays: Date arrays of the time records
+
+        :arg dict metadata: HDF5 attributes for the datatype datasets
+
+        :arg str groupname: HDF5 group name to write the datatype to
+
+        :arg int accumulator: Index of the first time record
+
+        :arg dict storage: :py:meth:`h5py.Group.create_dataset` keyword arguments for
+                           the chunking, filters, and precision of the datatype
+                           datasets, and optionally :kbd:`keep_bits` to round the
+                           values to before they are written
+
+        :return: Maximum absolute error, sum of squared errors, and number of values
+                 of the stored values relative to :kbd:`data` if the storage settings
+                 reduce their precision, otherwise :py:obj:`None`
+        :rtype: tuple
+        """
+        self.write_times(datearrays, accumulator)
+        storage = dict(storage or {})
+        keep_bits = storage.pop("keep_bits", None)
+        reduced = (
+            keep_bits is not None or "scaleoffset" in storage or "dtype" in storage
+        )
+        values = data if keep_bits is None else round_bits(data, keep_bits)
+        if self.layout == "consolidated":
+            written = self._write_consolidated(
+                values, metadata, groupname, accumulator, storage, len(datearrays)
+            )
+        else:
+            written = self._write_per_time_step(
+                values, metadata, groupname, accumulator, storage, len(datearrays)
+            )
+        if not reduced:
+            return None
+        errors = [0.0, 0.0, 0]
+        for i, chunks in written:
+            stored = values[i]
+            if "dtype" in storage:
+                stored = stored.astype(storage["dtype"])
+            if "scaleoffset" in storage:
+                stored = scale_offset_values(stored, storage["scaleoffset"], chunks)
+            max_error, sum_squares, n_values = precision_errors(data[i], stored)
+            errors = [
+                max(errors[0], max_error),
+                errors[1] + sum_squares,
+                errors[2] + n_values,
+            ]
+        return tuple(errors)
+
+    def _write_per_time_step(
+        self, data, metadata, groupname, accumulator, storage, n_records
+    ):
+        data_group, existing = self._data_group(groupname)
+        written = []
+        for i in range(n_records):
+            child_name = f"{groupname}_{i + accumulator:05d}"
+            if child_name in existing:
+                print(f"Dataset already exists at {child_name}")
+                continue
+            dataset = data_group.create_dataset(child_name, data=data[i], **storage)
+            dataset.attrs.update(metadata)
+            existing.add(child_name)
+            written.append((i, dataset.chunks or dataset.shape))
+        return written
+
+    def _write_consolidated(
+        self, data, metadata, groupname, accumulator, storage, n_records
+    ):
+        data_group, existing = self._data_group(groupname)
+        missing = []
+        for i in range(n_records):
             child_name = f"{groupname}_{i + accumulator:05d}"
-            if data_group.get(child_name) is not None:
+            if child_name in existing:
                 print(f"Dataset already exists at {child_name}")
             else:
-                dataset = data_group.create_dataset(
-                    child_name, shape=shape, data=data[i]
+                missing.append(i)
+        if not missing:
+            return []
+        storage = dict(storage)
+        chunks = consolidated_chunks(data.shape[1:], storage.pop("chunks", None))
+        dtype = storage.pop("dtype", data.dtype)
+        dataset = self._consolidated_dataset(
+            groupname, data.shape[1:], dtype, chunks=chunks, **storage
+        )
+        start = accumulator - 1
+        if len(missing) == n_records:
+            dataset[start : start + n_records] = data[:n_records]
+        else:
+            for i in missing:
+                dataset[start + i] = data[i]
+        written = []
+        for i in missing:
+            child_name = f"{groupname}_{i + accumulator:05d}"
+            self._write_virtual(data_group, child_name, dataset, start + i, metadata)
+            existing.add(child_name)
+            written.append((i, dataset.chunks[1:]))
+        return written
+
+    def _consolidated_dataset(self, name, record_shape, dtype, **kwargs):
+        """Get a consolidated dataset, creating it if necessary, with its time
+        dimension extended to hold all of the time records that have been written to
+        the file.
+        """
+        group = self.file.require_group(CONSOLIDATED_GROUP)
+        n_records = len(self.time_index)
+        if name in group:
+            dataset = group[name]
+            if dataset.shape[0] < n_records:
+                dataset.resize(n_records, axis=0)
+            return dataset
+        return group.create_dataset(
+            name,
+            shape=(n_records,) + tuple(record_shape),
+            maxshape=(None,) + tuple(record_shape),
+            dtype=dtype,
+            **kwargs,
+        )
+
+    @staticmethod
+    def _write_virtual(group, name, dataset, index, attrs):
+        layout = h5py.VirtualLayout(shape=dataset.shape[1:], dtype=dataset.dtype)
+        # "." is the file that contains the virtual dataset
+        layout[...] = h5py.VirtualSource(".", dataset.name, shape=dataset.shape)[index]
+        virtual = group.create_virtual_dataset(name, layout)
+        virtual.attrs.update(attrs)
+
+    def write_times(self, datearrays, accumulator):
+        """Write the :kbd:`/Time` records for a batch of time records that aren't in the
+        file yet, and confirm that the ones that are match :kbd:`datearrays`.
+
+        :arg list datearrays: Date arrays of the time records
+
+        :arg int accumulator: Index of the first time record
+        """
+        names = [f"Time_{i + accumulator:05d}" for i in range(len(datearrays))]
+        existing = [i for i, name in enumerate(names) if name in self.time_index]
+        if existing:
+            matches = (
+                numpy.array([self.time_index[names[i]] for i in existing])
+                == numpy.array([datearrays[i] for i in existing])
+            ).all(axis=1)
+            if not matches.all():
+                i = existing[numpy.argmin(matches)]
+                raise AssertionError(
+                    f"Time record {names[i]} exists and does not match with {datearrays[i]}"
                 )
-                dataset.attrs.update(metadata)
+        for i, (name, datearray) in enumerate(zip(names, datearrays)):
+            if name in self.time_index:
+                continue
+            attrs = {
+                "Maximum": numpy.array(datearray[0]),
+                "Minimum": numpy.array([-0.0]),
+                "Units": b"YYYY/MM/DD HH:MM:SS",
+            }
+            if self.layout == "consolidated":
+                index = accumulator - 1 + i
+                self.time_index[name] = datearray
+                times = self._consolidated_dataset(
+                    "Time", (6,), numpy.asarray(datearray).dtype, chunks=(1024, 6)
+                )
+                if times.shape[0] <= index:
+                    times.resize(index + 1, axis=0)
+                times[index] = datearray
+                self._write_virtual(self.time_group, name, times, index, attrs)
+                continue
+            dataset = self.time_group.create_dataset(name, shape=(6,), data=datearray)
+            dataset.attrs.update(attrs)
+            self.time_index[name] = datearray
 
 
-@function_timer
-def create_hdf5(yaml_filename, start_date, n_days):
-    """Create HDF5 forcing files for a MIDOSS-MOHID run.
+def consolidated_chunks(record_shape, chunks=None):
+    """Calculate the chunk shape of a consolidated (time, [depth,] y, x) dataset.
 
-    YAML_FILENAME: File path/name of YAML file to control HDF5 forcing files creation.
+    The default chunks are one time record, one depth level, and up to 128 by 128
+    grid points, so that reading a time series at a point, or a time record of the
+    whole grid, only reads the chunks that are needed.
+    The grid dimensions are split into chunks of equal size so that no space is
+    wasted in partly filled chunks at the edges of the grid.
 
-    [%Y-%m-%d]: Date on which to start HDF5 forcing files creation.
+    :arg tuple record_shape: Shape of one time record
 
-    N_DAYS: Number of days plus 1 of HDF5 forcing to create in each file.
-            Use 1 to create 2 days of forcing which is what is required for a 1 day MOHID run.
-    \f
+    :arg chunks: Chunk shape from the HDF5 storage settings of the datatype;
+                 the shape of one time record's chunks,
+                 or :py:obj:`True` for automatic chunking
+    :type chunks: tuple or boolean
 
-    :type yaml_filename: str
-    :type start_date: :py:class:`datetime.datetime`
-    :type n_days: int
+    :rtype: tuple or boolean
+    """
+    if chunks is True:
+        return True
+    if chunks is not None:
+        chunks = tuple(chunks)
+        return (1,) + chunks if len(chunks) == len(record_shape) else chunks
+    depth = (1,) * (len(record_shape) - 2)
+    return (1,) + depth + tuple(-(-n // -(-n // 128)) for n in record_shape[-2:])
+
+
+def write_grid(data, datearrays, metadata, filename, groupname, accumulator):
+    with hdf5_writer(filename) as writer:
+        writer.write(data, datearrays, metadata, groupname, accumulator)
+
+
+class progress_manifest:
+    """Record of the units of work that have been completed in an HDF5 forcing file.
+
+    A unit is the time records of one datatype that are calculated from one source
+    file. Each completed unit is appended to the manifest file as a JSON line after
+    the HDF5 file that it was written to has been flushed, so that the units that
+    were completed before a run was interrupted can be skipped when it is resumed.
+    A manifest is written for every HDF5 forcing file, whether or not the run is
+    resumed, so that any run can be resumed or verified.
+
+    :arg str filename: Manifest file path/name
+
+    :arg boolean resume: Read the units that are recorded in an existing manifest file
+                         instead of starting a new one
+    """
+
+    def __init__(self, filename, resume=False):
+        self.filename = filename
+        self.units = {}
+        if resume and os.path.exists(filename):
+            with open(filename, "r") as f:
+                for line in f:
+                    try:
+                        unit = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Incomplete last line from an interrupted run
+                        continue
+                    self.units[unit["datatype"], unit["source_file"]] = unit
+        else:
+            open(filename, "w").close()
+
+    def completed(self, datatype, source_file, accumulator):
+        """Get the number of time records of a completed unit.
+
+        :arg str datatype: Datatype
+
+        :arg str source_file: Source file path
+
+        :arg int accumulator: Index of the first time record of the unit
+
+        :return: Number of time records, or :py:obj:`None` if the unit is not recorded
+                 as completed at :kbd:`accumulator`
+        :rtype: int
+        """
+        unit = self.units.get((datatype, source_file))
+        if unit is None or unit["accumulator"] != accumulator:
+            return
+        return unit["n_records"]
+
+    def record(self, datatype, source_file, hdf5_file, accumulator, n_records):
+        """Record a completed unit.
+
+        :arg str datatype: Datatype
+
+        :arg str source_file: Source file path
+
+        :arg str hdf5_file: HDF5 file name that the unit was written to
+
+        :arg int accumulator: Index of the first time record of the unit
+
+        :arg int n_records: Number of time records of the unit
+        """
+        unit = {
+            "datatype": datatype,
+            "source_file": source_file,
+            "hdf5_file": hdf5_file,
+            "accumulator": accumulator,
+            "n_records": n_records,
+        }
+        with open(self.filename, "a") as f:
+            f.write(f"{json.dumps(unit)}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.units[datatype, source_file] = unit
+
+
+def open_window_writer(hdf5_path, resume=False, layout="per_time_step"):
+    """Open an HDF5 forcing file of a run window for writing.
+
+    :arg str hdf5_path: HDF5 file path/name
+
+    :arg boolean resume: Add to an existing file instead of creating a new one
+
+    :arg str layout: HDF5 forcing file layout; one of :py:data:`HDF5_LAYOUTS`
+
+    :return: Writer, and whether the file was created
+    :rtype: tuple
+    """
+    if resume and os.path.exists(hdf5_path):
+        try:
+            writer = hdf5_writer(hdf5_path, "a", layout)
+            print(f"{hdf5_path} opened to resume")
+            return writer, False
+        except OSError:
+            print(f"{hdf5_path} could not be opened to resume; recreating it")
+    writer = hdf5_writer(hdf5_path, "w", layout)
+    print(f"{hdf5_path} created")
+    return writer, True
+
+
+def prepare_run(yaml_filename, interpolation_threads=None):
+    """Read and check the run description YAML file for the creation of HDF5 forcing
+    files, and load the interpolation weights.
+
+    :arg str yaml_filename: File path/name of YAML file to control HDF5 forcing files
+                            creation.
+
+    :arg int interpolation_threads: Number of threads to use for HRDPS and WaveWatch3
+                                    interpolation; overrides the run YAML setting.
+
+    :return: Run settings, or :py:obj:`None` if the run description is not valid
+    :rtype: dict
     """
     with open(yaml_filename, "r") as f:
         run_description = yaml.safe_load(f)
-    date_begin = start_date
-    date_end = date_begin + timedelta(days=n_days)
 
     try:
         paths = run_description["paths"]
@@ -402,12 +1545,32 @@ def create_hdf5(yaml_filename, start_date, n_days):
         os.path.expanduser(paths.get("wave_weights"))
     )
     output_path = os.path.expandvars(os.path.expanduser(paths.get("output")))
+    grid_cache_dir = paths.get("grid geometry cache")
+    if grid_cache_dir is not None:
+        grid_cache_dir = os.path.expandvars(os.path.expanduser(grid_cache_dir))
+    archive_index_path = paths.get("archive index")
+    if archive_index_path is not None:
+        archive_index_path = os.path.expandvars(os.path.expanduser(archive_index_path))
 
     salish_seacast_forcing = run_description.get("salish_seacast_forcing")
     hrdps_forcing = run_description.get("hrdps_forcing")
     wavewatch3_forcing = run_description.get("wavewatch3_forcing")
+    interpolation = run_description.get("interpolation", {})
+    interpolation_method = interpolation.get("method", "vectorized")
+    batch_variables = interpolation.get("batch_variables", True)
+    land_mask = interpolation.get("land_mask", False)
+    if interpolation_threads is None:
+        interpolation_threads = interpolation.get("threads", 1)
+    hdf5_layout = run_description.get("hdf5_layout", "per_time_step")
+    if hdf5_layout not in HDF5_LAYOUTS:
+        print(
+            f"Unknown hdf5_layout: {hdf5_layout}; must be one of {', '.join(HDF5_LAYOUTS)}"
+        )
+        return
 
     hdf5_files = set()
+    wind_weights = None
+    wave_weights = None
 
     if salish_seacast_forcing is not None:
         currents_u = salish_seacast_forcing.get("currents").get(
@@ -478,7 +1641,9 @@ def create_hdf5(yaml_filename, start_date, n_days):
                 )
                 return
             else:
-                wind_weights = mohid_interpolate.weighting_matrix(wind_weights_path)
+                wind_weights = mohid_interpolate.load_weights(
+                    wind_weights_path, interpolation_method
+                )
 
     whitecap_coverage = wavewatch3_forcing.get("whitecap_coverage").get("hdf5_filename")
     hdf5_files.add(whitecap_coverage)
@@ -524,109 +1689,137 @@ def create_hdf5(yaml_filename, start_date, n_days):
                 )
                 return
             else:
-                wave_weights = mohid_interpolate.weighting_matrix(wave_weights_path)
+                wave_weights = mohid_interpolate.load_weights(
+                    wave_weights_path, interpolation_method
+                )
 
-    # Make sure all the source files are available
+    # Datatypes to calculate, grouped by the collection of source files that they are
+    # calculated from, as (datatype, HDF5 file name, HDF5 group name) tuples
+    source_jobs = {}
     if salish_seacast_forcing is not None:
-        if currents_u is not None:
-            currents_u_list = forcing_paths.salishseacast_paths(
-                date_begin, date_end, salishseacast_path, "grid_U"
-            )
-            if not currents_u_list:
-                return
-        if currents_v is not None:
-            currents_v_list = forcing_paths.salishseacast_paths(
-                date_begin, date_end, salishseacast_path, "grid_V"
-            )
-            if not currents_v_list:
-                return
-        if vertical_velocity is not None:
-            vertical_velocity_list = forcing_paths.salishseacast_paths(
-                date_begin, date_end, salishseacast_path, "grid_W"
-            )
-            if not vertical_velocity_list:
-                return
-        if diffusivity is not None:
-            diffusivity_list = forcing_paths.salishseacast_paths(
-                date_begin, date_end, salishseacast_path, "grid_W"
-            )
-            if not diffusivity_list:
-                return
-        if temperature is not None:
-            temperature_list = forcing_paths.salishseacast_paths(
-                date_begin, date_end, salishseacast_path, "grid_T"
-            )
-            if not temperature_list:
-                return
-        if salinity is not None:
-            salinity_list = forcing_paths.salishseacast_paths(
-                date_begin, date_end, salishseacast_path, "grid_T"
-            )
-            if not salinity_list:
-                return
-        if sea_surface_height is not None:
-            sea_surface_height_list = forcing_paths.salishseacast_paths(
-                date_begin, date_end, salishseacast_path, "grid_T"
-            )
-            if not sea_surface_height_list:
-                return
-        if e3t is not None:
-            e3t_list = forcing_paths.salishseacast_paths(
-                date_begin, date_end, salishseacast_path, "carp_T"
-            )
-            if not e3t_list:
-                return
+        for hdf5_file, filetype, datatype, groupname in (
+            (currents_u, "grid_U", "ocean_velocity_u", "velocity U"),
+            (currents_v, "grid_V", "ocean_velocity_v", "velocity V"),
+            (vertical_velocity, "grid_W", "ocean_velocity_w", "velocity W"),
+            (diffusivity, "grid_W", "vert_eddy_diff", "Diffusivity"),
+            (temperature, "grid_T", "temperature", "temperature"),
+            (salinity, "grid_T", "salinity", "salinity"),
+            (sea_surface_height, "grid_T", "sea_surface_height", "water level"),
+            (e3t, "carp_T", "e3t", "vvl"),
+        ):
+            if hdf5_file is not None:
+                source_jobs.setdefault(filetype, []).append(
+                    (datatype, hdf5_file, groupname)
+                )
     if hrdps_forcing is not None:
-        if wind_u is not None:
-            wind_u_list = forcing_paths.hrdps_paths(date_begin, date_end, hrdps_path)
-            if not wind_u_list:
-                return
-        if wind_v is not None:
-            wind_v_list = forcing_paths.hrdps_paths(date_begin, date_end, hrdps_path)
-            if not wind_v_list:
-                return
+        for hdf5_file, datatype, groupname in (
+            (wind_u, "wind_velocity_u", "wind velocity X"),
+            (wind_v, "wind_velocity_v", "wind velocity Y"),
+        ):
+            if hdf5_file is not None:
+                source_jobs.setdefault("hrdps", []).append(
+                    (datatype, hdf5_file, groupname)
+                )
     if wavewatch3_forcing is not None:
-        if whitecap_coverage is not None:
-            whitecap_coverage_list = forcing_paths.ww3_paths(
-                date_begin, date_end, wavewatch3_path
-            )
-            if not whitecap_coverage_list:
-                return
-        if mean_wave_period is not None:
-            mean_wave_period_list = forcing_paths.ww3_paths(
-                date_begin, date_end, wavewatch3_path
-            )
-            if not mean_wave_period_list:
-                return
-        if mean_wave_length is not None:
-            mean_wave_length_list = forcing_paths.ww3_paths(
-                date_begin, date_end, wavewatch3_path
-            )
-            if not mean_wave_length_list:
-                return
-        if significant_wave_height is not None:
-            significant_wave_height_list = forcing_paths.ww3_paths(
-                date_begin, date_end, wavewatch3_path
-            )
-            if not significant_wave_height_list:
-                return
-        if stokesU is not None:
-            stokesU_list = forcing_paths.ww3_paths(
-                date_begin, date_end, wavewatch3_path
-            )
-            if not stokesU_list:
-                return
-        if stokesV is not None:
-            stokesV_list = forcing_paths.ww3_paths(
-                date_begin, date_end, wavewatch3_path
-            )
-            if not stokesV_list:
-                return
+        for hdf5_file, datatype, groupname in (
+            (whitecap_coverage, "whitecap_coverage", "whitecap coverage"),
+            (mean_wave_period, "mean_wave_period", "mean wave period"),
+            (mean_wave_length, "mean_wave_length", "mean wave length"),
+            (
+                significant_wave_height,
+                "significant_wave_height",
+                "significant wave height",
+            ),
+            (stokesU, "stokesU", "Stokes U"),
+            (stokesV, "stokesV", "Stokes V"),
+        ):
+            if hdf5_file is not None:
+                source_jobs.setdefault("wavewatch3", []).append(
+                    (datatype, hdf5_file, groupname)
+                )
 
     if output_path is None:
         print("No output file path provided")
         return
 
+    water_mask = None
+    if land_mask and (hrdps_forcing is not None or wavewatch3_forcing is not None):
+        water_mask = load_grid_geometry(
+            salishseacast_grid_path, grid_cache_dir
+        ).water_mask
+
+    source_paths = {
+        "salishseacast": salishseacast_path,
+        "hrdps": hrdps_path,
+        "wavewatch3": wavewatch3_path,
+    }
+    archive_index = None
+    if archive_index_path is not None:
+        archive_index = forcing_paths.archive_index(source_paths, archive_index_path)
+
+    return {
+        "run_description": run_description,
+        "source_paths": source_paths,
+        "archive_index": archive_index,
+        "archive_index_path": archive_index_path,
+        "salishseacast_grid_path": salishseacast_grid_path,
+        "grid_cache_dir": grid_cache_dir,
+        "output_path": output_path,
+        "hdf5_files": hdf5_files,
+        "source_jobs": source_jobs,
+        "weights": {"hrdps": wind_weights, "wavewatch3": wave_weights},
+        "weights_paths": {"hrdps": wind_weights_path, "wavewatch3": wave_weights_path},
+        "interpolation_method": interpolation_method,
+        "batch_variables": batch_variables,
+        "memory_budget_mb": (run_description.get("streaming") or {}).get(
+            "memory_budget_mb"
+        ),
+        "interpolation_threads": interpolation_threads,
+        "water_mask": water_mask,
+        "hdf5_layout": hdf5_layout,
+    }
+
+
+def source_day_path(run, source, day):
+    """Find the path of the source file for a day.
+
+    :arg dict run: Run settings from :py:func:`prepare_run`
+
+    :arg str source: Source file collection; :kbd:`hrdps`, :kbd:`wavewatch3`,
+                     or a SalishSeaCast NEMO file type (e.g. :kbd:`grid_T`)
+
+    :arg day: Date of the source file
+    :type day: :py:class:`datetime.datetime`
+
+    :return: Source file path, or :py:obj:`None` if it does not exist
+    :rtype: str
+    """
+    if source == "hrdps":
+        file_list = forcing_paths.hrdps_paths(day, day, run["source_paths"]["hrdps"])
+    elif source == "wavewatch3":
+        file_list = forcing_paths.ww3_paths(day, day, run["source_paths"]["wavewatch3"])
+    else:
+        file_list = forcing_paths.salishseacast_paths(
+            day, day, run["source_paths"]["salishseacast"], source
+        )
+    if not file_list:
+        return
+    return file_list[0]
+
+
+def window_dirname(run, date_begin, date_end):
+    """Calculate the output directory of the HDF5 forcing files of a run window.
+
+    :arg dict run: Run settings from :py:func:`prepare_run`
+
+    :arg date_begin: First day of the run window
+    :type date_begin: :py:class:`datetime.datetime`
+
+    :arg date_end: Last day of the run window
+    :type date_end: :py:class:`datetime.datetime`
+
+    :rtype: str
+    """
     startfolder, endfolder = date_begin, date_end
     folder = (
         str(
@@ -641,156 +1834,555 @@ def create_hdf5(yaml_filename, start_date, n_days):
             .lower()
         )
     )
+    return os.path.join(run["output_path"], folder)
 
-    # create output directory
-    dirname = os.path.join(output_path, folder)
-    os.makedirs(dirname, exist_ok=True)
-    print(f"\nOutput directory {dirname} created")
-    for hdf5_file in hdf5_files:
-        hdf5_path = os.path.join(dirname, hdf5_file)
-        with h5py.File(hdf5_path, "w"):
-            print(f"{hdf5_path} created")
 
-    # Now that everything is in place, we can start generating the .hdf5 files
-    if salish_seacast_forcing is not None:
-        if currents_u is not None:
-            process_grid(
-                currents_u_list,
-                "ocean_velocity_u",
-                os.path.join(dirname, currents_u),
-                "velocity U",
-                salishseacast_grid_path,
-            )
-        if currents_v is not None:
-            process_grid(
-                currents_v_list,
-                "ocean_velocity_v",
-                os.path.join(dirname, currents_v),
-                "velocity V",
-                salishseacast_grid_path,
-            )
-        if vertical_velocity is not None:
-            process_grid(
-                vertical_velocity_list,
-                "ocean_velocity_w",
-                os.path.join(dirname, vertical_velocity),
-                "velocity W",
-                salishseacast_grid_path,
-            )
-        if diffusivity is not None:
-            process_grid(
-                diffusivity_list,
-                "vert_eddy_diff",
-                os.path.join(dirname, diffusivity),
-                "Diffusivity",
-                salishseacast_grid_path,
-            )
-        if temperature is not None:
-            process_grid(
-                temperature_list,
-                "temperature",
-                os.path.join(dirname, temperature),
-                "temperature",
-                salishseacast_grid_path,
-            )
-        if salinity is not None:
-            process_grid(
-                salinity_list,
-                "salinity",
-                os.path.join(dirname, salinity),
-                "salinity",
-                salishseacast_grid_path,
-            )
-        if sea_surface_height is not None:
-            process_grid(
-                sea_surface_height_list,
-                "sea_surface_height",
-                os.path.join(dirname, sea_surface_height),
-                "water level",
-                salishseacast_grid_path,
-            )
-        if e3t is not None:
-            process_grid(
-                e3t_list,
-                "e3t",
-                os.path.join(dirname, e3t),
-                "vvl",
-                salishseacast_grid_path,
-            )
-    if hrdps_forcing is not None:
-        if wind_u is not None:
-            process_grid(
-                wind_u_list,
-                "wind_velocity_u",
-                os.path.join(dirname, wind_u),
-                "wind velocity X",
-                salishseacast_grid_path,
-                wind_weights,
-            )
-        if wind_v is not None:
-            process_grid(
-                wind_v_list,
-                "wind_velocity_v",
-                os.path.join(dirname, wind_v),
-                "wind velocity Y",
-                salishseacast_grid_path,
-                wind_weights,
-            )
-    if wavewatch3_forcing is not None:
-        if whitecap_coverage is not None:
-            process_grid(
-                whitecap_coverage_list,
-                "whitecap_coverage",
-                os.path.join(dirname, whitecap_coverage),
-                "whitecap coverage",
-                salishseacast_grid_path,
-                wave_weights,
-            )
-        if mean_wave_period is not None:
-            process_grid(
-                mean_wave_period_list,
-                "mean_wave_period",
-                os.path.join(dirname, mean_wave_period),
-                "mean wave period",
-                salishseacast_grid_path,
-                wave_weights,
+def window_days(windows):
+    """Calculate the distinct run windows, and the days that they include.
+
+    :arg list windows: (start date, number of days plus 1) tuples of the run windows
+
+    :return: Date ordered lists of (first day, last day) tuples of the distinct run
+             windows, and of the days that they include
+    :rtype: tuple
+    """
+    windows = sorted(
+        {
+            (date_begin, date_begin + timedelta(days=n_days))
+            for date_begin, n_days in windows
+        }
+    )
+    days = sorted(
+        {
+            date_begin + timedelta(days=day)
+            for date_begin, date_end in windows
+            for day in range((date_end - date_begin).days + 1)
+        }
+    )
+    return windows, days
+
+
+def find_source_files(run, days):
+    """Make sure that the source files of all of the days are available.
+
+    :arg dict run: Run settings from :py:func:`prepare_run`
+
+    :arg list days: Days to find the source files for
+
+    If the run has an archive index the source files are found in it,
+    and all of the missing source files are reported together;
+    otherwise the file system is checked for each of them.
+    The archive index is trusted, and only refreshed when it is missing some of the
+    source files;
+    files that are moved or removed after they are indexed are found again by
+    :py:func:`refind_source_file` when they can't be opened.
+
+    :return: Source file paths keyed by (source, day), or :py:obj:`None` if any of
+             the source files are missing
+    :rtype: dict
+    """
+    source_files = {}
+    archive_index = run.get("archive_index")
+    if archive_index is None:
+        for source in run["source_jobs"]:
+            for day in days:
+                file_path = source_day_path(run, source, day)
+                if file_path is None:
+                    return
+                source_files[source, day] = file_path
+        return source_files
+    any_missing = False
+    refreshed = False
+    for source in run["source_jobs"]:
+        archive_source, filetype = _archive_source(source)
+        found, missing = archive_index.find(archive_source, days[0], days[-1], filetype)
+        missing = sorted(set(missing).intersection(days))
+        if missing and not refreshed:
+            archive_index.refresh()
+            refreshed = True
+            found, missing = archive_index.find(
+                archive_source, days[0], days[-1], filetype
             )
-        if mean_wave_length is not None:
-            process_grid(
-                mean_wave_length_list,
-                "mean_wave_length",
-                os.path.join(dirname, mean_wave_length),
-                "mean wave length",
-                salishseacast_grid_path,
-                wave_weights,
+            missing = sorted(set(missing).intersection(days))
+        if missing:
+            dates = ", ".join(day.strftime("%Y-%m-%d") for day in missing)
+            print(
+                f"{source} files not found in {run['source_paths'][archive_source]} "
+                f"for {len(missing)} days: {dates}"
             )
-        if significant_wave_height is not None:
-            process_grid(
-                significant_wave_height_list,
-                "significant_wave_height",
-                os.path.join(dirname, significant_wave_height),
-                "significant wave height",
-                salishseacast_grid_path,
-                wave_weights,
-            )
-        if stokesU is not None:
-            process_grid(
-                stokesU_list,
-                "stokesU",
-                os.path.join(dirname, stokesU),
-                "Stokes U",
-                salishseacast_grid_path,
-                wave_weights,
+            any_missing = True
+            continue
+        for day in days:
+            source_files[source, day] = found[day]
+    if any_missing:
+        print("Check Directory and/or Date Range.")
+        return
+    return source_files
+
+
+def refind_source_file(run, source, day):
+    """Find the source file of a day again after refreshing the archive index,
+    for a source file that was moved or removed after the index was refreshed.
+
+    :arg dict run: Run settings from :py:func:`prepare_run`
+
+    :arg str source: Source of the file; :kbd:`hrdps`, :kbd:`wavewatch3`, or a
+                     SalishSeaCast NEMO file type (e.g. :kbd:`grid_T`)
+
+    :arg day: Day to find the source file for
+    :type day: :py:class:`datetime.datetime`
+
+    :return: Source file path, or :py:obj:`None` if the run has no archive index or
+             the file is not in the refreshed index
+    :rtype: str
+    """
+    archive_index = run.get("archive_index")
+    if archive_index is None and run.get("archive_index_path") is not None:
+        # Worker processes aren't sent the index, so they load it from its JSON file
+        archive_index = forcing_paths.archive_index(
+            run["source_paths"], run["archive_index_path"]
+        )
+        run["archive_index"] = archive_index
+    if archive_index is None:
+        return
+    archive_index.refresh()
+    archive_source, filetype = _archive_source(source)
+    found, _ = archive_index.find(archive_source, day, day, filetype)
+    return found.get(day)
+
+
+def _archive_source(source):
+    # Archive index source and file type of a source of datatypes
+    if source in ("hrdps", "wavewatch3"):
+        return source, ""
+    return "salishseacast", source
+
+
+def process_windows(run, windows, resume=False, metrics=None, source_files=None):
+    """Create the HDF5 forcing files for a collection of run windows.
+
+    The distinct source days of all of the windows are processed in date order.
+    Each source file is read, and each of its datatypes is calculated, exactly once,
+    and the values are written into every window that includes the day.
+    The HDF5 files of a window are open from its first day until its last day.
+
+    The units of work that are completed in each HDF5 file are recorded in a
+    :py:class:`progress_manifest` next to it.
+    When :kbd:`resume` is :py:obj:`True` the existing HDF5 files are added to,
+    and the units that are recorded in the manifest and present in the HDF5 files
+    are skipped.
+
+    :arg dict run: Run settings from :py:func:`prepare_run`
+
+    :arg list windows: (start date, number of days plus 1) tuples of the run windows
+
+    :arg boolean resume: Resume an interrupted run
+
+    :arg metrics: Run metrics to record the processing of each datatype from each
+                  source file in
+    :type metrics: :py:class:`run_metrics`
+
+    :arg dict source_files: Source file paths keyed by (source, day) from
+                            :py:func:`find_source_files`; they are found if they
+                            are not given.
+
+    :return: Output directories of the run windows, or :py:obj:`None` if any of the
+             source files are missing
+    :rtype: list
+    """
+    windows, days = window_days(windows)
+    source_jobs = run["source_jobs"]
+    if source_files is None:
+        source_files = find_source_files(run, days)
+    if source_files is None:
+        return
+
+    storage = {
+        datatype: dataset_storage_kwargs(
+            storage_settings(run["run_description"], datatype)
+        )
+        for jobs in source_jobs.values()
+        for datatype, _, _ in jobs
+    }
+    tmask = None
+    if "e3t" in storage:
+        tmask = load_grid_geometry(
+            run["salishseacast_grid_path"], run["grid_cache_dir"]
+        ).tmask
+    dirnames = {window: window_dirname(run, *window) for window in windows}
+
+    # The HDF5 files of each window are kept open until all of their days have been
+    # written, and the index of the next time record of each source is tracked for
+    # each window
+    writers = {}
+    manifests = {}
+    accumulators = {}
+    buffers = {}
+    try:
+        for day in days:
+            active = [window for window in windows if window[0] <= day <= window[1]]
+            for window in active:
+                if window[0] != day:
+                    continue
+                dirname = dirnames[window]
+                os.makedirs(dirname, exist_ok=True)
+                print(f"\nOutput directory {dirname} created")
+                for hdf5_file in run["hdf5_files"]:
+                    hdf5_path = os.path.join(dirname, hdf5_file)
+                    writers[hdf5_path], created = open_window_writer(
+                        hdf5_path, resume, run["hdf5_layout"]
+                    )
+                    manifests[hdf5_path] = progress_manifest(
+                        f"{hdf5_path}{MANIFEST_SUFFIX}", not created
+                    )
+                for jobs in source_jobs.values():
+                    for _, hdf5_file, groupname in jobs:
+                        print(
+                            f"Writing {groupname} to {os.path.join(dirname, hdf5_file)}..."
+                        )
+            for source, jobs in source_jobs.items():
+                source_file = source_files[source, day]
+                # Numbers of time records of the units that are already complete,
+                # and the jobs that are still to be done, in each window
+                n_records = set()
+                pending = {}
+                for window in active:
+                    accumulator = accumulators.get((window, source), 1)
+                    pending[window] = []
+                    for job in jobs:
+                        datatype, hdf5_file, groupname = job
+                        hdf5_path = os.path.join(dirnames[window], hdf5_file)
+                        n_completed = manifests[hdf5_path].completed(
+                            datatype, source_file, accumulator
+                        )
+                        writer = writers[hdf5_path]
+                        if n_completed is not None and writer.has_records(
+                            groupname, accumulator, n_completed
+                        ):
+                            n_records.add(n_completed)
+                        else:
+                            pending[window].append(job)
+                if any(pending.values()):
+                    try:
+                        data = xarray.open_dataset(source_file)
+                    except FileNotFoundError:
+                        source_file = refind_source_file(run, source, day)
+                        if source_file is None:
+                            raise
+                        data = xarray.open_dataset(source_file)
+                    with data:
+                        datearrays = read_datearrays(data, jobs[0][0])
+                        n_records = {len(datearrays)}
+                        pending_jobs = {
+                            job[0]: job
+                            for job in jobs
+                            if any(job in pending[window] for window in active)
+                        }
+                        unit_metrics = {
+                            datatype: stage_metrics(datatype, source_file)
+                            for datatype in pending_jobs
+                        }
+                        grids = source_file_grids(
+                            data,
+                            list(pending_jobs),
+                            tmask,
+                            run["weights"].get(source),
+                            run["interpolation_method"],
+                            run["water_mask"],
+                            run["interpolation_threads"],
+                            run["batch_variables"],
+                            run["memory_budget_mb"],
+                            buffers,
+                            unit_metrics,
+                        )
+                        for datatype, block_start, grid in grids:
+                            job = pending_jobs[datatype]
+                            _, hdf5_file, groupname = job
+                            block_end = block_start + len(grid)
+                            for window in active:
+                                if job not in pending[window]:
+                                    continue
+                                accumulator = accumulators.get((window, source), 1)
+                                hdf5_path = os.path.join(dirnames[window], hdf5_file)
+                                writer = writers[hdf5_path]
+                                with unit_metrics[datatype].timing("write"):
+                                    if resume and block_start == 0:
+                                        writer.discard_records(
+                                            groupname, accumulator, len(datearrays)
+                                        )
+                                    errors = writer.write(
+                                        grid,
+                                        datearrays[block_start:block_end],
+                                        METADATA[datatype],
+                                        groupname,
+                                        accumulator + block_start,
+                                        storage[datatype],
+                                    )
+                                    if block_end == len(datearrays):
+                                        writer.flush()
+                                unit_metrics[datatype].add_errors(errors)
+                                unit_metrics[datatype].bytes_written += grid.nbytes
+                                if block_end < len(datearrays):
+                                    continue
+                                manifests[hdf5_path].record(
+                                    datatype,
+                                    source_file,
+                                    hdf5_file,
+                                    accumulator,
+                                    len(datearrays),
+                                )
+                        if metrics is not None:
+                            for unit in unit_metrics.values():
+                                unit.n_records = len(datearrays)
+                                metrics.record(unit)
+                if len(n_records) != 1:
+                    raise AssertionError(
+                        f"Completed units from {source_file} have different numbers "
+                        f"of time records: {sorted(n_records)}"
+                    )
+                (n_records,) = n_records
+                for window in active:
+                    accumulators[window, source] = (
+                        accumulators.get((window, source), 1) + n_records
+                    )
+            for window in active:
+                if window[1] != day:
+                    continue
+                for hdf5_file in run["hdf5_files"]:
+                    writers.pop(os.path.join(dirnames[window], hdf5_file)).close()
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return [dirnames[window] for window in windows]
+
+
+def process_windows_parallel(run, windows, workers, resume=False, metrics=None):
+    """Create the HDF5 forcing files for a collection of run windows on a pool of
+    worker processes.
+
+    An HDF5 file can only be written by one process at a time, and each source file
+    should only be read once, so the datatypes are grouped into the collections of
+    HDF5 files that share source files, and each group is processed by
+    :py:func:`process_windows` in a worker process.
+    The groups with the most 3-D datatypes are started first so that they don't
+    hold up the end of the run.
+    The source files are found once for all of the groups, and the workers load the
+    interpolation operators and grid geometry from their caches rather than being
+    sent them with the run settings.
+
+    :arg dict run: Run settings from :py:func:`prepare_run`
+
+    :arg list windows: (start date, number of days plus 1) tuples of the run windows
+
+    :arg int workers: Number of worker processes
+
+    :arg boolean resume: Resume an interrupted run
+
+    :arg metrics: Run metrics to record the processing of each datatype from each
+                  source file in, as each worker finishes
+    :type metrics: :py:class:`run_metrics`
+
+    :return: Output directories of the run windows, or :py:obj:`None` if any of the
+             source files are missing
+    :rtype: list
+    """
+    distinct_windows, days = window_days(windows)
+    source_files = find_source_files(run, days)
+    if source_files is None:
+        return
+    # Groups of (jobs keyed by source, HDF5 file names); a source whose HDF5 files
+    # overlap those of existing groups is merged with them
+    groups = []
+    for source, jobs in run["source_jobs"].items():
+        group_jobs = {source: jobs}
+        group_files = {hdf5_file for _, hdf5_file, _ in jobs}
+        for group in [group for group in groups if group[1] & group_files]:
+            groups.remove(group)
+            group_jobs.update(group[0])
+            group_files |= group[1]
+        groups.append((group_jobs, group_files))
+
+    def group_cost(group):
+        # 3-D datatypes have tens of depth levels, so they dominate the run time
+        return sum(
+            10 if datatype in THREE_D_DATATYPES else 1
+            for jobs in group[0].values()
+            for datatype, _, _ in jobs
+        )
+
+    # The interpolation operators, water mask, and archive index are replaced by the
+    # weights file paths and the found source files so that they aren't pickled for
+    # every worker
+    worker_run = dict(
+        run,
+        archive_index=None,
+        weights={
+            source: None if weights is None else run["weights_paths"][source]
+            for source, weights in run["weights"].items()
+        },
+        water_mask=None,
+    )
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _process_windows_worker,
+                dict(worker_run, source_jobs=group_jobs, hdf5_files=group_files),
+                windows,
+                resume,
+                {
+                    (source, day): file_path
+                    for (source, day), file_path in source_files.items()
+                    if source in group_jobs
+                },
+                run["water_mask"] is not None,
             )
-        if stokesV is not None:
-            process_grid(
-                stokesV_list,
-                "stokesV",
-                os.path.join(dirname, stokesV),
-                "Stokes V",
-                salishseacast_grid_path,
-                wave_weights,
+            for group_jobs, group_files in sorted(groups, key=group_cost, reverse=True)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            hdf5_files, elapsed, records = future.result()
+            print(
+                f"\n{', '.join(sorted(hdf5_files))} finished in {format_elapsed(elapsed)}"
             )
+            if metrics is not None:
+                for record in records:
+                    metrics.record(record)
+    return [window_dirname(run, *window) for window in distinct_windows]
+
+
+def _process_windows_worker(run, windows, resume, source_files, land_mask):
+    t_start = time.time()
+    run["weights"] = {
+        source: None
+        if path is None
+        else mohid_interpolate.load_weights(path, run["interpolation_method"])
+        for source, path in run["weights"].items()
+    }
+    if land_mask:
+        run["water_mask"] = load_grid_geometry(
+            run["salishseacast_grid_path"], run["grid_cache_dir"]
+        ).water_mask
+    metrics = run_metrics()
+    process_windows(run, windows, resume, metrics, source_files)
+    return run["hdf5_files"], time.time() - t_start, metrics.records
+
+
+@function_timer
+def create_hdf5(
+    yaml_filename,
+    start_date,
+    n_days,
+    interpolation_threads=None,
+    resume=False,
+    workers=1,
+    metrics_file=None,
+    metrics_callback=None,
+):
+    """Create HDF5 forcing files for a MIDOSS-MOHID run.
+
+    YAML_FILENAME: File path/name of YAML file to control HDF5 forcing files creation.
+
+    [%Y-%m-%d]: Date on which to start HDF5 forcing files creation.
+
+    N_DAYS: Number of days plus 1 of HDF5 forcing to create in each file.
+            Use 1 to create 2 days of forcing which is what is required for a 1 day MOHID run.
+    \f
+
+    :type yaml_filename: str
+    :type start_date: :py:class:`datetime.datetime`
+    :type n_days: int
+    :arg int interpolation_threads: Number of threads to use for HRDPS and WaveWatch3
+                                    interpolation; overrides the run YAML setting.
+    :arg boolean resume: Resume an interrupted run, keeping the units of work that it
+                         completed.
+    :arg int workers: Number of worker processes to write the HDF5 files with.
+    :arg str metrics_file: File path/name of JSON lines file to write the metrics of
+                           the processing of each datatype from each source file to.
+    :arg metrics_callback: Function to call with the metrics dict of the processing of
+                           each datatype from each source file.
+    :type metrics_callback: callable
+    """
+    run = prepare_run(yaml_filename, interpolation_threads)
+    if run is None:
+        return
+    metrics = run_metrics(metrics_file, metrics_callback, append=resume)
+    if workers > 1:
+        process_windows_parallel(run, [(start_date, n_days)], workers, resume, metrics)
+    else:
+        process_windows(run, [(start_date, n_days)], resume, metrics)
+    metrics.summary()
+
+
+def read_windows(windows_filename):
+    """Read the start dates and numbers of days of a collection of run windows from a
+    CSV or YAML file.
+
+    A CSV file has a header line with :kbd:`start_date` and :kbd:`n_days` columns.
+    A YAML file is a list of mappings with :kbd:`start_date` and :kbd:`n_days` keys.
+
+    :arg str windows_filename: File path/name of CSV or YAML file of run windows
+
+    :return: (start date, number of days plus 1) tuples
+    :rtype: list
+    """
+    with open(windows_filename, "r") as f:
+        if os.path.splitext(windows_filename)[1].lower() == ".csv":
+            entries = list(csv.DictReader(f))
+        else:
+            entries = yaml.safe_load(f)
+    return [
+        (parse(str(entry["start_date"])), int(entry["n_days"])) for entry in entries
+    ]
+
+
+@function_timer
+def create_hdf5_batch(
+    yaml_filename,
+    windows_filename,
+    interpolation_threads=None,
+    resume=False,
+    workers=1,
+    metrics_file=None,
+    metrics_callback=None,
+):
+    """Create HDF5 forcing files for a batch of MIDOSS-MOHID runs.
+
+    YAML_FILENAME: File path/name of YAML file to control HDF5 forcing files creation.
+
+    WINDOWS_FILENAME: File path/name of CSV or YAML file of the start dates and
+    numbers of days plus 1 of the run windows to create HDF5 forcing files for.
+    A CSV file has a header line with start_date and n_days columns.
+    A YAML file is a list of mappings with start_date and n_days keys.
+
+    Each source day that is included in any of the run windows is processed once,
+    and written into all of the run windows that include it.
+    \f
+
+    :type yaml_filename: str
+    :type windows_filename: str
+    :arg int interpolation_threads: Number of threads to use for HRDPS and WaveWatch3
+                                    interpolation; overrides the run YAML setting.
+    :arg boolean resume: Resume an interrupted run, keeping the units of work that it
+                         completed.
+    :arg int workers: Number of worker processes to write the HDF5 files with.
+    :arg str metrics_file: File path/name of JSON lines file to write the metrics of
+                           the processing of each datatype from each source file to.
+    :arg metrics_callback: Function to call with the metrics dict of the processing of
+                           each datatype from each source file.
+    :type metrics_callback: callable
+    """
+    windows = read_windows(windows_filename)
+    if not windows:
+        print(f"No run windows found in {windows_filename}")
+        return
+    run = prepare_run(yaml_filename, interpolation_threads)
+    if run is None:
+        return
+    metrics = run_metrics(metrics_file, metrics_callback, append=resume)
+    if workers > 1:
+        process_windows_parallel(run, windows, workers, resume, metrics)
+    else:
+        process_windows(run, windows, resume, metrics)
+    metrics.summary()
 
 
 if __name__ == "__main__":
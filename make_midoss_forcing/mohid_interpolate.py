@@ -13,9 +13,21 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import functools
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy
 import xarray
 
+# Index value that marks a missing source point in a weights file;
+# it is what a NaN index becomes when it is cast to int64
+MISSING_INDEX = numpy.iinfo(numpy.int64).min
+
+# Number of values calculated at a time in each tile of the vectorized interpolation
+TILE_SIZE = 2 ** 16
+
 
 class weighting_matrix:
     def __init__(self, path):
@@ -44,7 +56,372 @@ class weighting_matrix:
         self.weights = (w1, w2, w3, w4)
 
 
-def hrdps(windarr, weighting_matrix_obj):
+class interpolation_operator:
+    """Compiled form of a :py:class:`weighting_matrix`.
+
+    The 4 source points of each target grid cell are stored as a fixed width
+    (ELLPACK) sparse matrix with int32 indices, float32 weights, and a precomputed
+    validity mask for missing source points.
+    Missing source points have indices of 0 and weights of 0.
+
+    :arg y_indices: Source grid y indices with dimensions (4, y, x)
+    :type y_indices: :py:class:`numpy.ndarray`
+
+    :arg x_indices: Source grid x indices with dimensions (4, y, x)
+    :type x_indices: :py:class:`numpy.ndarray`
+
+    :arg weights: Interpolation weights with dimensions (4, y, x)
+    :type weights: :py:class:`numpy.ndarray`
+
+    :arg valid: :py:obj:`True` where the source point exists, dimensions (4, y, x)
+    :type valid: :py:class:`numpy.ndarray`
+    """
+
+    arrays = ("y_indices", "x_indices", "weights", "valid")
+
+    def __init__(self, y_indices, x_indices, weights, valid):
+        self.y_indices = y_indices
+        self.x_indices = x_indices
+        self.weights = weights
+        self.valid = valid
+        self.have_source = valid.any(axis=0)
+        self.grid_shape = valid.shape[1:]
+        self.water_mask = None
+        self._restricted = {}
+
+    @classmethod
+    def from_weighting_matrix(cls, weighting_matrix_obj):
+        """Compile the indices and weights of a :py:class:`weighting_matrix`.
+
+        :arg weighting_matrix_obj: Interpolation indices and weights
+        :type weighting_matrix_obj: :py:class:`make_midoss_forcing.mohid_interpolate.weighting_matrix`
+
+        :rtype: :py:class:`make_midoss_forcing.mohid_interpolate.interpolation_operator`
+        """
+        y_indices = numpy.stack(weighting_matrix_obj.y_indices)
+        x_indices = numpy.stack(weighting_matrix_obj.x_indices)
+        weights = numpy.stack(weighting_matrix_obj.weights)
+        valid = y_indices != MISSING_INDEX
+        return cls(
+            numpy.where(valid, y_indices, 0).astype(numpy.int32),
+            numpy.where(valid, x_indices, 0).astype(numpy.int32),
+            numpy.where(valid, weights, 0).astype(numpy.float32),
+            valid,
+        )
+
+    @classmethod
+    def load(cls, dirname):
+        """Memory-map an operator that was stored with :py:meth:`save`.
+
+        :arg str dirname: Directory that the operator arrays are stored in.
+
+        :rtype: :py:class:`make_midoss_forcing.mohid_interpolate.interpolation_operator`
+        """
+        return cls(
+            *(
+                numpy.load(os.path.join(dirname, f"{name}.npy"), mmap_mode="r")
+                for name in cls.arrays
+            )
+        )
+
+    def save(self, dirname):
+        """Store the operator arrays as :kbd:`.npy` files in :kbd:`dirname`.
+
+        The arrays are written to a temporary directory that is renamed when it is
+        complete so that concurrent runs never see a partial operator.
+
+        :arg str dirname: Directory to store the operator arrays in.
+        """
+        tmp_dirname = f"{dirname}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dirname, exist_ok=True)
+        for name in self.arrays:
+            numpy.save(os.path.join(tmp_dirname, f"{name}.npy"), getattr(self, name))
+        try:
+            os.rename(tmp_dirname, dirname)
+        except OSError:
+            # Another process stored the operator first
+            for name in self.arrays:
+                os.remove(os.path.join(tmp_dirname, f"{name}.npy"))
+            os.rmdir(tmp_dirname)
+
+    def restrict(self, water_mask):
+        """Return an operator that only calculates the water points of the
+        SalishSeaCast grid.
+
+        The arrays of the returned operator have dimensions (4, water point) and its
+        :py:attr:`water_mask` attribute is used to scatter the results into the grid.
+        Restricted operators are cached so that they are only built once per mask.
+
+        :arg water_mask: SalishSeaCast grid (y, x) mask that is :py:obj:`True` at water points.
+        :type water_mask: :py:class:`numpy.ndarray`
+
+        :rtype: :py:class:`make_midoss_forcing.mohid_interpolate.interpolation_operator`
+        """
+        water_mask = numpy.asarray(water_mask, dtype=bool)
+        key = hashlib.sha256(water_mask.tobytes()).hexdigest()
+        if key not in self._restricted:
+            operator = interpolation_operator(
+                *(getattr(self, name)[:, water_mask] for name in self.arrays)
+            )
+            operator.grid_shape = self.grid_shape
+            operator.water_mask = water_mask
+            self._restricted[key] = operator
+        return self._restricted[key]
+
+
+def weights_file_hash(path):
+    """Calculate a digest of the contents of an interpolation weights file.
+
+    :arg str path: File path/name of interpolation weights file.
+
+    :return: First 16 hexadecimal digits of the SHA-256 digest of the file contents.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+@functools.lru_cache(maxsize=None)
+def load_operator(path):
+    """Load the compiled interpolation operator for an interpolation weights file.
+
+    The operator is stored in a directory next to the weights file that is keyed by
+    the weights file content hash, and memory-mapped on subsequent loads.
+    If the directory can't be written the operator is compiled in memory for each run.
+    The operator is cached so that each weights file is only loaded once per process.
+
+    :arg str path: File path/name of interpolation weights file.
+
+    :rtype: :py:class:`make_midoss_forcing.mohid_interpolate.interpolation_operator`
+    """
+    stem = os.path.splitext(path)[0]
+    operator_dir = f"{stem}.{weights_file_hash(path)}.operator"
+    if os.path.isdir(operator_dir):
+        return interpolation_operator.load(operator_dir)
+    operator = interpolation_operator.from_weighting_matrix(weighting_matrix(path))
+    try:
+        operator.save(operator_dir)
+    except OSError as exc:
+        print(f"Unable to store interpolation operator in {operator_dir}: {exc}")
+        return operator
+    return interpolation_operator.load(operator_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def load_weights(path, method="vectorized"):
+    """Load the interpolation weights that :kbd:`method` uses from a weights file.
+
+    :arg str path: File path/name of interpolation weights file.
+
+    :arg str method: Interpolation engine; one of :kbd:`vectorized` or :kbd:`loop`.
+
+    :return: Compiled operator for :kbd:`vectorized`,
+             weighting matrix for :kbd:`loop`.
+    :rtype: :py:class:`make_midoss_forcing.mohid_interpolate.interpolation_operator` or
+            :py:class:`make_midoss_forcing.mohid_interpolate.weighting_matrix`
+    """
+    if method == "loop":
+        return weighting_matrix(path)
+    _check_method(method)
+    return load_operator(path)
+
+
+def hrdps(
+    windarr,
+    weighting_matrix_obj,
+    method="vectorized",
+    water_mask=None,
+    fill_value=0,
+    threads=1,
+):
+    """Interpolate HRDPS-gridded values on to the SalishSeaCast grid.
+
+    :arg windarr: HRDPS-gridded array with dimensions (time, y, x) or (y, x),
+                  or (variable, time, y, x) for several variables at once
+    :type windarr: :py:class:`numpy.ndarray`
+
+    :arg weighting_matrix_obj: Interpolation indices and weights
+    :type weighting_matrix_obj: :py:class:`make_midoss_forcing.mohid_interpolate.weighting_matrix`
+
+    :arg str method: Interpolation engine to use; one of :kbd:`vectorized` or :kbd:`loop`.
+                     :kbd:`loop` is the original cell by cell reference implementation.
+
+    :arg water_mask: SalishSeaCast grid (y, x) mask that is :py:obj:`True` at water points.
+                     If it is given only the water points are calculated,
+                     and land points are set to :kbd:`fill_value`.
+    :type water_mask: :py:class:`numpy.ndarray`
+
+    :arg float fill_value: Value for land points when :kbd:`water_mask` is given.
+
+    :arg int threads: Number of threads to split the :kbd:`vectorized` calculation over.
+
+    :return: SalishSeaCast-gridded array with the same leading dimensions as the input
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    return _interpolate(
+        windarr,
+        weighting_matrix_obj,
+        method,
+        water_mask,
+        fill_value,
+        threads,
+        skip_missing=False,
+    )
+
+
+def wavewatch(
+    wavewatcharr,
+    weighting_matrix_obj,
+    method="vectorized",
+    water_mask=None,
+    fill_value=0,
+    threads=1,
+):
+    """Interpolate WaveWatch3-gridded values on to the SalishSeaCast grid.
+
+    Source points flagged with :py:data:`MISSING_INDEX` and NaN source values are
+    skipped. Cells for which all 4 source points are missing are set to NaN.
+
+    :arg wavewatcharr: WaveWatch3-gridded array with dimensions (time, y, x) or (y, x),
+                       or (variable, time, y, x) for several variables at once
+    :type wavewatcharr: :py:class:`numpy.ndarray`
+
+    :arg weighting_matrix_obj: Interpolation indices and weights
+    :type weighting_matrix_obj: :py:class:`make_midoss_forcing.mohid_interpolate.weighting_matrix`
+
+    :arg str method: Interpolation engine to use; one of :kbd:`vectorized` or :kbd:`loop`.
+                     :kbd:`loop` is the original cell by cell reference implementation.
+
+    :arg water_mask: SalishSeaCast grid (y, x) mask that is :py:obj:`True` at water points.
+                     If it is given only the water points are calculated,
+                     and land points are set to :kbd:`fill_value`.
+    :type water_mask: :py:class:`numpy.ndarray`
+
+    :arg float fill_value: Value for land points when :kbd:`water_mask` is given.
+
+    :arg int threads: Number of threads to split the :kbd:`vectorized` calculation over.
+
+    :return: SalishSeaCast-gridded array with the same leading dimensions as the input
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    return _interpolate(
+        wavewatcharr,
+        weighting_matrix_obj,
+        method,
+        water_mask,
+        fill_value,
+        threads,
+        skip_missing=True,
+    )
+
+
+def _check_method(method):
+    assert method in (
+        "vectorized",
+        "loop",
+    ), f"Invalid interpolation method {method}. method must be one of ('vectorized', 'loop')"
+
+
+def _interpolate(
+    source_arr,
+    weighting_matrix_obj,
+    method,
+    water_mask,
+    fill_value,
+    threads,
+    skip_missing,
+):
+    if method == "loop":
+        loop = _wavewatch_loop if skip_missing else _hrdps_loop
+        if source_arr.ndim == 4:
+            new_grid = numpy.stack(
+                [loop(arr, weighting_matrix_obj) for arr in source_arr]
+            )
+        else:
+            new_grid = loop(source_arr, weighting_matrix_obj)
+        if water_mask is not None:
+            new_grid[..., ~numpy.asarray(water_mask, dtype=bool)] = fill_value
+        return new_grid
+    _check_method(method)
+    operator = weighting_matrix_obj
+    if not isinstance(operator, interpolation_operator):
+        operator = interpolation_operator.from_weighting_matrix(weighting_matrix_obj)
+    if water_mask is not None:
+        operator = operator.restrict(water_mask)
+    # Target points are calculated as a flattened vector that is divided into tiles of
+    # contiguous points, each of which is written directly into the shared results array
+    n_points = operator.have_source.size
+    values = numpy.empty(
+        source_arr.shape[:-2] + (n_points,),
+        dtype=numpy.result_type(source_arr, operator.weights),
+    )
+    # Tiles are sized to keep the temporary arrays in _gather() small,
+    # and there are several tiles per thread to even out the load
+    n_values = int(numpy.prod(source_arr.shape[:-2], dtype=int)) * n_points
+    n_tiles = max(4 * threads if threads > 1 else 1, -(-n_values // TILE_SIZE))
+    edges = numpy.linspace(0, n_points, min(n_tiles, n_points) + 1, dtype=int)
+    tiles = [slice(start, stop) for start, stop in zip(edges[:-1], edges[1:])]
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            # NumPy releases the GIL for the indexing and arithmetic in _gather()
+            for future in [
+                executor.submit(
+                    _gather, source_arr, operator, skip_missing, tile, values[..., tile]
+                )
+                for tile in tiles
+            ]:
+                future.result()
+    else:
+        for tile in tiles:
+            _gather(source_arr, operator, skip_missing, tile, values[..., tile])
+    if operator.water_mask is None:
+        return values.reshape(source_arr.shape[:-2] + operator.grid_shape)
+    new_grid = numpy.full(
+        source_arr.shape[:-2] + operator.grid_shape, fill_value, dtype=values.dtype
+    )
+    new_grid[..., operator.water_mask] = values
+    return new_grid
+
+
+def _gather(source_arr, operator, skip_missing, points, out):
+    """Calculate the 4-point weighted sums for a slice of the flattened target points
+    of :kbd:`operator` and all leading (e.g. time) indices of :kbd:`source_arr` at once,
+    and store them in :kbd:`out`.
+
+    When :kbd:`skip_missing` is :py:obj:`False` the sum is a plain sum so NaNs propagate,
+    like :py:func:`_hrdps_loop`.
+    When it is :py:obj:`True` missing source points and NaN terms are dropped from the sum,
+    and cells without any source points are NaN, like :py:func:`_wavewatch_loop`.
+    Results agree with the loop implementations to float32 precision.
+    """
+    n_points = operator.have_source.size
+    for i, (y_index, x_index, weight, valid) in enumerate(
+        zip(
+            operator.y_indices.reshape(4, n_points)[:, points],
+            operator.x_indices.reshape(4, n_points)[:, points],
+            operator.weights.reshape(4, n_points)[:, points],
+            operator.valid.reshape(4, n_points)[:, points],
+        )
+    ):
+        term = source_arr[..., y_index, x_index] * weight
+        if skip_missing:
+            term[..., ~valid] = 0
+            numpy.nan_to_num(
+                term, copy=False, nan=0, posinf=numpy.inf, neginf=-numpy.inf
+            )
+        if i == 0:
+            out[...] = term
+        else:
+            out += term
+    if skip_missing:
+        out[..., ~operator.have_source.reshape(n_points)[points]] = numpy.nan
+    return out
+
+
+def _hrdps_loop(windarr, weighting_matrix_obj):
     shape = windarr.shape
     if len(shape) == 3:
         windarr = numpy.transpose(windarr, [1, 2, 0])
@@ -83,7 +460,7 @@ def hrdps(windarr, weighting_matrix_obj):
     return new_grid
 
 
-def wavewatch(wavewatcharr, weighting_matrix_obj):
+def _wavewatch_loop(wavewatcharr, weighting_matrix_obj):
     shape = wavewatcharr.shape
     ndims = len(shape)
     if ndims == 3:
@@ -116,19 +493,19 @@ def wavewatch(wavewatcharr, weighting_matrix_obj):
                 wave_wgt03[i][j],
                 wave_wgt04[i][j],
             )
-            if y1 == -9223372036854775808:
+            if y1 == MISSING_INDEX:
                 s1 = False
             else:
                 s1 = wavewatcharr[y1][x1] * w1
-            if y2 == -9223372036854775808:
+            if y2 == MISSING_INDEX:
                 s2 = False
             else:
                 s2 = wavewatcharr[y2][x2] * w2
-            if y3 == -9223372036854775808:
+            if y3 == MISSING_INDEX:
                 s3 = False
             else:
                 s3 = wavewatcharr[y3][x3] * w3
-            if y4 == -9223372036854775808:
+            if y4 == MISSING_INDEX:
                 s4 = False
             else:
                 s4 = wavewatcharr[y4][x4] * w4
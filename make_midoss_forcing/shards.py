@@ -0,0 +1,377 @@
+#  Copyright 2019-2021, the MIDOSS project contributors, The University of British Columbia,
+#  and Dalhousie University.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Split the creation of the HDF5 forcing files for a collection of run windows into
+shards that are processed by the tasks of a cluster array job,
+and verify that the HDF5 forcing files of all of the shards are complete.
+
+Each run window is assigned to exactly one shard, so the HDF5 forcing files of a
+window are only written by one task.
+"""
+import os
+from datetime import timedelta
+
+import h5py
+
+from make_midoss_forcing import make_hdf5
+
+
+def date_range_windows(start_date, end_date, n_days, step_days=None):
+    """Calculate the run windows that start at regular intervals in a date range.
+
+    :arg start_date: Start date of the first run window
+    :type start_date: :py:class:`datetime.datetime`
+
+    :arg end_date: Latest start date of a run window
+    :type end_date: :py:class:`datetime.datetime`
+
+    :arg int n_days: Number of days plus 1 of each run window
+
+    :arg int step_days: Number of days between the start dates of the run windows;
+                        defaults to :kbd:`n_days` so that consecutive windows
+                        overlap by 1 day, like a sequence of MOHID runs
+
+    :return: (start date, number of days plus 1) tuples
+    :rtype: list
+    """
+    step = timedelta(days=step_days or max(n_days, 1))
+    windows = []
+    start = start_date
+    while start <= end_date:
+        windows.append((start, n_days))
+        start += step
+    return windows
+
+
+def read_run_windows(
+    windows_filename=None, start_date=None, end_date=None, n_days=0, step_days=None
+):
+    """Get the run windows from a CSV or YAML file of run windows, or from a date range.
+
+    :arg str windows_filename: File path/name of CSV or YAML file of run windows;
+                               see :py:func:`make_midoss_forcing.make_hdf5.read_windows`
+
+    :arg start_date: Start date of the first run window in the date range
+    :type start_date: :py:class:`datetime.datetime`
+
+    :arg end_date: Latest start date of a run window in the date range
+    :type end_date: :py:class:`datetime.datetime`
+
+    :arg int n_days: Number of days plus 1 of each run window in the date range
+
+    :arg int step_days: Number of days between the start dates of the run windows in
+                        the date range
+
+    :return: (start date, number of days plus 1) tuples,
+             or :py:obj:`None` if the run windows are not given correctly
+    :rtype: list
+    """
+    if windows_filename is not None:
+        if start_date is not None or end_date is not None:
+            print("Give either a run windows file or a date range, not both")
+            return
+        windows = make_hdf5.read_windows(windows_filename)
+    elif start_date is not None:
+        windows = date_range_windows(
+            start_date, end_date or start_date, n_days, step_days
+        )
+    else:
+        print("Give either a run windows file or a date range")
+        return
+    if not windows:
+        print("No run windows found")
+        return
+    return windows
+
+
+def shard_windows(windows, task_index, task_count):
+    """Select the run windows of one shard of a collection of run windows.
+
+    The distinct run windows are sorted by date and split into :kbd:`task_count`
+    contiguous shards that have about the same number of days,
+    so that windows that overlap are usually in the same shard and the source files
+    of the days that they share are read once.
+    The shards only depend on the run windows and the number of tasks,
+    so each task calculates its own shard,
+    and every window is in exactly one shard.
+
+    :arg list windows: (start date, number of days plus 1) tuples of the run windows
+
+    :arg int task_index: Index of the task; 0 to :kbd:`task_count - 1`
+
+    :arg int task_count: Number of tasks
+
+    :return: (start date, number of days plus 1) tuples of the run windows of the
+             task's shard
+    :rtype: list
+    """
+    windows = sorted(set(windows))
+    weights = [n_days + 1 for _, n_days in windows]
+    total = sum(weights)
+    shard = []
+    cumulative = 0
+    for window, weight in zip(windows, weights):
+        # Each window is assigned to the task whose share of the days contains the
+        # middle of the window's days
+        if (2 * cumulative + weight) * task_count // (2 * total) == task_index:
+            shard.append(window)
+        cumulative += weight
+    return shard
+
+
+def array_task(task_index=None, task_count=None, environ=None):
+    """Get the index and the number of tasks of an array job.
+
+    Values that are not given are read from the SLURM array job environment
+    variables:
+    the task index is :envvar:`SLURM_ARRAY_TASK_ID` minus
+    :envvar:`SLURM_ARRAY_TASK_MIN`, divided by :envvar:`SLURM_ARRAY_TASK_STEP`,
+    so that arrays don't have to start at 0 or have consecutive task ids,
+    and the number of tasks is :envvar:`SLURM_ARRAY_TASK_COUNT`.
+
+    :arg int task_index: Index of the task; 0 to :kbd:`task_count - 1`
+
+    :arg int task_count: Number of tasks
+
+    :arg dict environ: Environment variables; defaults to :py:data:`os.environ`
+
+    :return: Task index and number of tasks, or :py:obj:`None` if they can't be
+             determined or are inconsistent
+    :rtype: tuple
+    """
+    environ = os.environ if environ is None else environ
+    if task_index is None and "SLURM_ARRAY_TASK_ID" in environ:
+        task_index = (
+            int(environ["SLURM_ARRAY_TASK_ID"])
+            - int(environ.get("SLURM_ARRAY_TASK_MIN", 0))
+        ) // int(environ.get("SLURM_ARRAY_TASK_STEP", 1))
+    if task_count is None and "SLURM_ARRAY_TASK_COUNT" in environ:
+        task_count = int(environ["SLURM_ARRAY_TASK_COUNT"])
+    if task_index is None or task_count is None:
+        print(
+            "Task index and number of tasks must be given, or set by a SLURM array job"
+        )
+        return
+    if not 0 <= task_index < task_count:
+        print(
+            f"Task index {task_index} is out of range for {task_count} tasks; "
+            f"it must be from 0 to {task_count - 1}"
+        )
+        return
+    return task_index, task_count
+
+
+@make_hdf5.function_timer
+def create_hdf5_shard(
+    yaml_filename,
+    windows,
+    task_index=None,
+    task_count=None,
+    interpolation_threads=None,
+    resume=False,
+    workers=1,
+    metrics_file=None,
+):
+    """Create the HDF5 forcing files for one shard of a collection of run windows.
+
+    :arg str yaml_filename: File path/name of YAML file to control HDF5 forcing files
+                            creation.
+
+    :arg list windows: (start date, number of days plus 1) tuples of all of the run
+                       windows.
+
+    :arg int task_index: Index of the task; read from the SLURM array job environment
+                         if it is not given.
+
+    :arg int task_count: Number of tasks; read from the SLURM array job environment
+                         if it is not given.
+
+    :arg int interpolation_threads: Number of threads to use for HRDPS and WaveWatch3
+                                    interpolation; overrides the run YAML setting.
+
+    :arg boolean resume: Resume an interrupted task, keeping the units of work that it
+                         completed.
+
+    :arg int workers: Number of worker processes to write the HDF5 files with.
+
+    :arg str metrics_file: File path/name of JSON lines file to write the metrics of
+                           the processing of each datatype from each source file to;
+                           :kbd:`{task_index}` in it is replaced by the task index.
+
+    :return: Output directories of the run windows of the shard
+    :rtype: list
+    """
+    task = array_task(task_index, task_count)
+    if task is None:
+        return
+    task_index, task_count = task
+    shard = shard_windows(windows, task_index, task_count)
+    if not shard:
+        print(f"Task {task_index} of {task_count} has no run windows")
+        return []
+    print(f"Task {task_index} of {task_count}: {len(shard)} run windows")
+    run = make_hdf5.prepare_run(yaml_filename, interpolation_threads)
+    if run is None:
+        return
+    if metrics_file is not None:
+        metrics_file = metrics_file.format(task_index=task_index)
+    metrics = make_hdf5.run_metrics(metrics_file, append=resume)
+    if workers > 1:
+        dirnames = make_hdf5.process_windows_parallel(
+            run, shard, workers, resume, metrics
+        )
+    else:
+        dirnames = make_hdf5.process_windows(run, shard, resume, metrics)
+    metrics.summary()
+    return dirnames
+
+
+def verify_windows(run, windows):
+    """Check that the HDF5 forcing files of a collection of run windows are complete.
+
+    The HDF5 forcing files of a run window are complete when each of them exists,
+    its manifest records a unit for each of its datatypes and each of the source files
+    of the days of the window,
+    the units of each datatype are contiguous time records from the first one,
+    and the datasets and :kbd:`/Time` records of the units are in the HDF5 file.
+
+    :arg dict run: Run settings from
+                   :py:func:`make_midoss_forcing.make_hdf5.prepare_run`
+
+    :arg list windows: (start date, number of days plus 1) tuples of the run windows
+
+    :return: Lists of the problems found in the run windows, keyed by their output
+             directories; the lists of complete windows are empty.
+             :py:obj:`None` if any of the source files are missing.
+    :rtype: dict
+    """
+    distinct_windows, days = make_hdf5.window_days(windows)
+    source_files = make_hdf5.find_source_files(run, days)
+    if source_files is None:
+        return
+    problems = {}
+    for window in distinct_windows:
+        dirname = make_hdf5.window_dirname(run, *window)
+        window_days = [day for day in days if window[0] <= day <= window[1]]
+        problems[dirname] = []
+        for hdf5_file in sorted(run["hdf5_files"]):
+            problems[dirname].extend(
+                verify_hdf5_file(
+                    os.path.join(dirname, hdf5_file),
+                    [
+                        (datatype, groupname, source)
+                        for source, jobs in run["source_jobs"].items()
+                        for datatype, job_hdf5_file, groupname in jobs
+                        if job_hdf5_file == hdf5_file
+                    ],
+                    {
+                        source: [source_files[source, day] for day in window_days]
+                        for source in run["source_jobs"]
+                    },
+                )
+            )
+    return problems
+
+
+def verify_hdf5_file(hdf5_path, jobs, window_source_files):
+    """Check that an HDF5 forcing file of a run window is complete.
+
+    :arg str hdf5_path: HDF5 forcing file path/name
+
+    :arg list jobs: (datatype, HDF5 group name, source) tuples of the datatypes that
+                    are written to the file
+
+    :arg dict window_source_files: Lists of the source files of the days of the
+                                   run window, keyed by source
+
+    :return: Problems found
+    :rtype: list
+    """
+    hdf5_file = os.path.basename(hdf5_path)
+    manifest_path = f"{hdf5_path}{make_hdf5.MANIFEST_SUFFIX}"
+    for path in (hdf5_path, manifest_path):
+        if not os.path.exists(path):
+            return [f"{os.path.basename(path)} is missing"]
+    manifest = make_hdf5.progress_manifest(manifest_path, resume=True)
+    problems = []
+    with h5py.File(hdf5_path, "r") as f:
+        times = set(f["Time"].keys()) if "Time" in f else set()
+        for datatype, groupname, source in jobs:
+            datasets = (
+                set(f["Results"][groupname].keys())
+                if groupname in f.get("Results", {})
+                else set()
+            )
+            accumulator = 1
+            for source_file in window_source_files[source]:
+                n_records = manifest.completed(datatype, source_file, accumulator)
+                if n_records is None:
+                    problems.append(
+                        f"{hdf5_file}: {datatype} from {source_file} is not recorded "
+                        f"at time record {accumulator}"
+                    )
+                    break
+                missing = [
+                    i
+                    for i in range(accumulator, accumulator + n_records)
+                    if f"{groupname}_{i:05d}" not in datasets
+                    or f"Time_{i:05d}" not in times
+                ]
+                if missing:
+                    problems.append(
+                        f"{hdf5_file}: {len(missing)} {groupname} time records from "
+                        f"{source_file} are missing"
+                    )
+                    break
+                accumulator += n_records
+    return problems
+
+
+@make_hdf5.function_timer
+def verify_shards(yaml_filename, windows, metrics_files=()):
+    """Verify that the HDF5 forcing files of all of the shards of a collection of run
+    windows are complete, and merge the processing metrics of the shards.
+
+    :arg str yaml_filename: File path/name of YAML file to control HDF5 forcing files
+                            creation.
+
+    :arg list windows: (start date, number of days plus 1) tuples of all of the run
+                       windows.
+
+    :arg metrics_files: File paths/names of the JSON lines metrics files of the shards
+                        to print a summary of together.
+    :type metrics_files: sequence
+
+    :return: :py:obj:`True` if the HDF5 forcing files of all of the run windows are
+             complete
+    :rtype: boolean
+    """
+    run = make_hdf5.prepare_run(yaml_filename)
+    if run is None:
+        return False
+    problems = verify_windows(run, windows)
+    if problems is None:
+        return False
+    for dirname, window_problems in problems.items():
+        print(f"{dirname}: {'incomplete' if window_problems else 'complete'}")
+        for problem in window_problems:
+            print(f"  {problem}")
+    incomplete = sum(1 for window_problems in problems.values() if window_problems)
+    print(f"\n{len(problems) - incomplete} of {len(problems)} run windows are complete")
+    if metrics_files:
+        metrics = make_hdf5.run_metrics()
+        for metrics_file in metrics_files:
+            metrics.read(metrics_file)
+        metrics.summary()
+    return not incomplete
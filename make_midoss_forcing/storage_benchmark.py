@@ -0,0 +1,129 @@
+#  Copyright 2019-2021, the MIDOSS project contributors, The University of British Columbia,
+#  and Dalhousie University.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Benchmark HDF5 chunking and filter settings for forcing files.
+
+The datasets of an existing HDF5 forcing file are rewritten with each of a collection
+of storage settings, and the write time, file size, and time to read the datasets back
+one at a time (like MOHID does) are reported for each of them.
+"""
+import json
+import os
+import time
+
+import h5py
+import yaml
+
+from make_midoss_forcing import make_hdf5
+
+
+def benchmark_storage(hdf5_path, settings, work_dir):
+    """Rewrite the datasets of an HDF5 forcing file with each of a collection of
+    storage settings and measure the write time, file size, and read-back time.
+
+    :arg str hdf5_path: File path/name of HDF5 forcing file to benchmark.
+
+    :arg dict settings: HDF5 storage settings, like the :kbd:`hdf5_storage` settings in
+                        a :command:`make-hdf5` YAML file, keyed by a name for each
+                        setting.
+
+    :arg str work_dir: Directory in which to write the benchmark files.
+
+    :return: Results for each setting.
+    :rtype: list
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    for name, storage in settings.items():
+        kwargs = make_hdf5.dataset_storage_kwargs(storage or {})
+        # keep_bits is applied to the values rather than passed to create_dataset()
+        keep_bits = kwargs.pop("keep_bits", None)
+        bench_path = os.path.join(work_dir, f"storage_benchmark_{name}.hdf5")
+        write_time = 0
+        with h5py.File(hdf5_path, "r") as src, h5py.File(bench_path, "w") as dest:
+            # Time records are copied as values because in consolidated layout files
+            # they are virtual datasets that map to the /Consolidated group
+            for dataset_name, dataset in src["/Time"].items():
+                dest_dataset = dest.create_dataset(
+                    f"/Time/{dataset_name}", data=dataset[()]
+                )
+                dest_dataset.attrs.update(dataset.attrs)
+            for groupname, group in src["/Results"].items():
+                dest_group = dest.require_group(f"/Results/{groupname}")
+                for dataset_name, dataset in group.items():
+                    data = dataset[()]
+                    if keep_bits is not None:
+                        data = make_hdf5.round_bits(data, keep_bits)
+                    t_start = time.perf_counter()
+                    dest_dataset = dest_group.create_dataset(
+                        dataset_name, data=data, **kwargs
+                    )
+                    dest_dataset.attrs.update(dataset.attrs)
+                    write_time += time.perf_counter() - t_start
+            t_start = time.perf_counter()
+            dest.flush()
+            write_time += time.perf_counter() - t_start
+        file_size = os.path.getsize(bench_path)
+        t_start = time.perf_counter()
+        with h5py.File(bench_path, "r") as bench:
+            for group in bench["/Results"].values():
+                for dataset in group.values():
+                    dataset[()]
+        read_time = time.perf_counter() - t_start
+        os.remove(bench_path)
+        results.append(
+            {
+                "name": name,
+                "storage": storage,
+                "write_time": write_time,
+                "file_size": file_size,
+                "read_time": read_time,
+            }
+        )
+    return results
+
+
+def print_results(results):
+    """Print a table of storage benchmark results.
+
+    :arg list results: Results from :py:func:`benchmark_storage`.
+    """
+    print(f"{'setting':<24} {'write (s)':>10} {'size (MB)':>10} {'read (s)':>10}")
+    for result in results:
+        print(
+            f"{result['name']:<24} {result['write_time']:>10.2f} "
+            f"{result['file_size'] / 2 ** 20:>10.1f} {result['read_time']:>10.2f}"
+        )
+
+
+def run_benchmark(hdf5_path, settings_yaml, work_dir, results_json=None):
+    """Benchmark the storage settings in a YAML file for an HDF5 forcing file,
+    print a table of the results, and optionally store them in a JSON file.
+
+    :arg str hdf5_path: File path/name of HDF5 forcing file to benchmark.
+
+    :arg str settings_yaml: File path/name of YAML file of storage settings keyed by
+                            a name for each setting.
+
+    :arg str work_dir: Directory in which to write the benchmark files.
+
+    :arg str results_json: File path/name of JSON file to store the results in.
+    """
+    with open(settings_yaml, "r") as f:
+        settings = yaml.safe_load(f)
+    results = benchmark_storage(hdf5_path, settings, work_dir)
+    print_results(results)
+    if results_json is not None:
+        with open(results_json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -21,5 +21,13 @@ setuptools.setup(
     entry_points="""
     [console_scripts]
     make-hdf5=make_midoss_forcing.cli:make_hdf5_cli
+    make-hdf5-batch=make_midoss_forcing.cli:make_hdf5_batch_cli
+    make-hdf5-shard=make_midoss_forcing.cli:make_hdf5_shard_cli
+    make-hdf5-verify=make_midoss_forcing.cli:make_hdf5_verify_cli
+    make-hdf5-storage-benchmark=make_midoss_forcing.cli:storage_benchmark_cli
+    make-hdf5-benchmark=make_midoss_forcing.cli:benchmark_cli
+    make-forcing-statistics=make_midoss_forcing.cli:make_forcing_statistics_cli
+    make-forcing-statistics-maps=make_midoss_forcing.cli:make_forcing_statistics_maps_cli
+    make-forcing-statistics-catalog=make_midoss_forcing.cli:make_forcing_statistics_catalog_cli
     """
 )
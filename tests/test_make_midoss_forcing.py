@@ -14,3 +14,1845 @@
 #  limitations under the License.
 """Unit tests for make_midoss_forcing
 """
+import json
+import os
+from datetime import datetime, timedelta
+
+import h5py
+import numpy
+import pytest
+import xarray
+
+from make_midoss_forcing import (
+    forcing_paths,
+    make_forcing_statistics,
+    make_hdf5,
+    mohid_interpolate,
+    shards,
+)
+
+
+SOURCE_SHAPE = (10, 12)
+GRID_SHAPE = (898, 398)
+
+# (depth, y, x) shape of the synthetic SalishSeaCast source files
+SSC_SHAPE = (3, 8, 6)
+SSC_DAYS = [datetime(2019, 1, 1) + timedelta(days=day) for day in range(3)]
+GRID_T_JOBS = [
+    ("salinity", "t.hdf5", "salinity"),
+    ("temperature", "t.hdf5", "temperature"),
+    ("sea_surface_height", "t.hdf5", "water level"),
+]
+
+
+def _write_weights(path, rng, missing_fraction=0, fully_missing=0):
+    """Write a synthetic interpolation weights file with NaN indices and weights at
+    missing source points, like the WaveWatch3 weights files have.
+    """
+    shape = (4,) + GRID_SHAPE
+    y = rng.integers(0, SOURCE_SHAPE[0], shape).astype(float)
+    x = rng.integers(0, SOURCE_SHAPE[1], shape).astype(float)
+    weights = rng.random(shape)
+    missing = rng.random(shape) < missing_fraction
+    missing[:, :fully_missing] = True
+    for values in (y, x, weights):
+        values[missing] = numpy.nan
+    xarray.Dataset(
+        {
+            name: (("index", "y", "x"), values)
+            for name, values in (("y", y), ("x", x), ("weights", weights))
+        }
+    ).to_netcdf(path)
+    return path
+
+
+def _write_grid_T(ssc_path, day, rng, n_steps=4):
+    """Write a synthetic SalishSeaCast grid_T file for a day with land points at the
+    edge of the domain and in the deepest level.
+    """
+    dirname = os.path.join(ssc_path, day.strftime("%d%b%y").lower())
+    os.makedirs(dirname, exist_ok=True)
+    times = numpy.datetime64(day, "m") + numpy.arange(
+        30, 60 * n_steps, 60, dtype="timedelta64[m]"
+    )
+    data_vars = {}
+    for variable in ("vosaline", "votemper"):
+        values = rng.standard_normal((n_steps,) + SSC_SHAPE).astype("float32")
+        values[:, -1] = numpy.nan
+        values[..., :2, :2] = numpy.nan
+        data_vars[variable] = (("time_counter", "deptht", "y", "x"), values)
+    data_vars["sossheig"] = (
+        ("time_counter", "y", "x"),
+        rng.standard_normal((n_steps,) + SSC_SHAPE[1:]).astype("float32"),
+    )
+    ymd = day.strftime("%Y%m%d")
+    path = os.path.join(dirname, f"SalishSea_1h_{ymd}_{ymd}_grid_T.nc")
+    xarray.Dataset(data_vars, coords={"time_counter": times}).to_netcdf(path)
+    return path
+
+
+def _run(tmp_path, ssc_path, **settings):
+    """Run settings like make_hdf5.prepare_run() returns for the calculation of the
+    grid_T datatypes from the synthetic SalishSeaCast files.
+    """
+    run = {
+        "run_description": {},
+        "source_paths": {"salishseacast": f"{ssc_path}/"},
+        "archive_index": None,
+        "archive_index_path": None,
+        "salishseacast_grid_path": None,
+        "grid_cache_dir": None,
+        "output_path": str(tmp_path / "output"),
+        "hdf5_files": {"t.hdf5"},
+        "source_jobs": {"grid_T": GRID_T_JOBS},
+        "weights": {},
+        "weights_paths": {},
+        "interpolation_method": "vectorized",
+        "batch_variables": True,
+        "memory_budget_mb": None,
+        "interpolation_threads": 1,
+        "water_mask": None,
+        "hdf5_layout": "per_time_step",
+    }
+    run.update(settings)
+    return run
+
+
+def _read_records(hdf5_path):
+    """Read the values of all of the time record datasets in an HDF5 forcing file,
+    keyed by their paths.
+    """
+    records = {}
+    with h5py.File(hdf5_path, "r") as f:
+        for group in ("Time", "Results"):
+            f[group].visititems(
+                lambda name, item: records.__setitem__(f"{group}/{name}", item[()])
+                if isinstance(item, h5py.Dataset)
+                else None
+            )
+    return records
+
+
+def _write_mesh_mask(path, tmask):
+    """Write a synthetic SalishSeaCast mesh mask file with a (t, z, y, x) tmask."""
+    xarray.Dataset({"tmask": (("t", "z", "y", "x"), tmask[numpy.newaxis])}).to_netcdf(
+        path
+    )
+    return str(path)
+
+
+def _touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+
+
+@pytest.fixture(scope="module")
+def rng():
+    return numpy.random.default_rng(42)
+
+
+@pytest.fixture(scope="module")
+def ssc_path(tmp_path_factory):
+    ssc_path = tmp_path_factory.mktemp("salishseacast")
+    rng = numpy.random.default_rng(7)
+    for day in SSC_DAYS:
+        _write_grid_T(ssc_path, day, rng)
+    return ssc_path
+
+
+@pytest.fixture(scope="module")
+def wind_weights(tmp_path_factory, rng):
+    path = _write_weights(tmp_path_factory.mktemp("weights") / "wind.nc", rng)
+    return mohid_interpolate.weighting_matrix(path)
+
+
+@pytest.fixture(scope="module")
+def wave_weights(tmp_path_factory, rng):
+    # The first 3 rows of the grid have no source points at all
+    path = _write_weights(
+        tmp_path_factory.mktemp("weights") / "wave.nc",
+        rng,
+        missing_fraction=0.3,
+        fully_missing=3,
+    )
+    return mohid_interpolate.weighting_matrix(path)
+
+
+@pytest.fixture(scope="module")
+def source_values(rng):
+    values = rng.standard_normal((2,) + SOURCE_SHAPE).astype("float32")
+    values[:, :2, :3] = numpy.nan
+    return values
+
+
+@pytest.fixture(scope="module")
+def water_mask(rng):
+    return rng.random(GRID_SHAPE) < 0.6
+
+
+@pytest.fixture(scope="module")
+def hrdps_loop(source_values, wind_weights):
+    return mohid_interpolate.hrdps(source_values, wind_weights, method="loop")
+
+
+@pytest.fixture(scope="module")
+def wavewatch_loop(source_values, wave_weights):
+    return mohid_interpolate.wavewatch(source_values, wave_weights, method="loop")
+
+
+class TestWeightingMatrix:
+    """Unit tests for the missing source point sentinel of weighting_matrix."""
+
+    def test_missing_indices(self, wave_weights):
+        assert (wave_weights.y_indices[0][:3] == mohid_interpolate.MISSING_INDEX).all()
+        assert mohid_interpolate.MISSING_INDEX == numpy.iinfo(numpy.int64).min
+
+
+class TestHRDPS:
+    """Unit tests for the vectorized mohid_interpolate.hrdps() engine."""
+
+    def test_matches_loop(self, source_values, wind_weights, hrdps_loop):
+        new_grid = mohid_interpolate.hrdps(source_values, wind_weights)
+        assert new_grid.shape == (2,) + GRID_SHAPE
+        # NaN source values propagate into the cells that use them
+        assert numpy.isnan(hrdps_loop).any()
+        numpy.testing.assert_allclose(new_grid, hrdps_loop, rtol=1e-5, atol=1e-6)
+
+    def test_dtype(self, source_values, wind_weights, hrdps_loop):
+        new_grid = mohid_interpolate.hrdps(source_values, wind_weights)
+        assert new_grid.dtype == numpy.float32
+        assert hrdps_loop.dtype == numpy.float64
+
+    def test_compiled_operator(self, source_values, wind_weights, hrdps_loop):
+        operator = mohid_interpolate.interpolation_operator.from_weighting_matrix(
+            wind_weights
+        )
+        new_grid = mohid_interpolate.hrdps(source_values, operator)
+        numpy.testing.assert_allclose(new_grid, hrdps_loop, rtol=1e-5, atol=1e-6)
+
+    def test_water_mask(self, source_values, wind_weights, hrdps_loop, water_mask):
+        new_grid = mohid_interpolate.hrdps(
+            source_values, wind_weights, water_mask=water_mask, fill_value=-1
+        )
+        expected = hrdps_loop.copy()
+        expected[:, ~water_mask] = -1
+        numpy.testing.assert_allclose(new_grid, expected, rtol=1e-5, atol=1e-6)
+
+    def test_threads(self, source_values, wind_weights, hrdps_loop):
+        new_grid = mohid_interpolate.hrdps(source_values, wind_weights, threads=4)
+        numpy.testing.assert_allclose(new_grid, hrdps_loop, rtol=1e-5, atol=1e-6)
+
+    def test_batched_variables(self, source_values, wind_weights):
+        batch = numpy.stack([source_values, 2 * source_values])
+        new_grid = mohid_interpolate.hrdps(batch, wind_weights)
+        for values, expected in zip(batch, new_grid):
+            numpy.testing.assert_array_equal(
+                mohid_interpolate.hrdps(values, wind_weights), expected
+            )
+
+
+class TestWavewatch:
+    """Unit tests for the vectorized mohid_interpolate.wavewatch() engine."""
+
+    def test_matches_loop(self, source_values, wave_weights, wavewatch_loop):
+        new_grid = mohid_interpolate.wavewatch(source_values, wave_weights)
+        numpy.testing.assert_allclose(new_grid, wavewatch_loop, rtol=1e-5, atol=1e-6)
+
+    def test_fully_missing_cells(self, source_values, wave_weights, wavewatch_loop):
+        new_grid = mohid_interpolate.wavewatch(source_values, wave_weights)
+        assert numpy.isnan(wavewatch_loop[:, :3]).all()
+        assert numpy.isnan(new_grid[:, :3]).all()
+
+    def test_nan_source_values_skipped(self, source_values, wave_weights):
+        new_grid = mohid_interpolate.wavewatch(source_values, wave_weights)
+        have_source = (
+            numpy.stack(wave_weights.y_indices) != mohid_interpolate.MISSING_INDEX
+        ).any(axis=0)
+        assert not numpy.isnan(new_grid[:, have_source]).any()
+
+    def test_dtype(self, source_values, wave_weights, wavewatch_loop):
+        new_grid = mohid_interpolate.wavewatch(source_values, wave_weights)
+        assert new_grid.dtype == numpy.float32
+        assert wavewatch_loop.dtype == numpy.float64
+
+    def test_water_mask(self, source_values, wave_weights, wavewatch_loop, water_mask):
+        new_grid = mohid_interpolate.wavewatch(
+            source_values, wave_weights, water_mask=water_mask
+        )
+        expected = wavewatch_loop.copy()
+        expected[:, ~water_mask] = 0
+        numpy.testing.assert_allclose(new_grid, expected, rtol=1e-5, atol=1e-6)
+
+    def test_threads(self, source_values, wave_weights, wavewatch_loop):
+        new_grid = mohid_interpolate.wavewatch(source_values, wave_weights, threads=3)
+        numpy.testing.assert_allclose(new_grid, wavewatch_loop, rtol=1e-5, atol=1e-6)
+
+    def test_invalid_method(self, source_values, wave_weights):
+        with pytest.raises(AssertionError):
+            mohid_interpolate.wavewatch(source_values, wave_weights, method="sparse")
+
+
+@pytest.fixture(scope="module")
+def wave_operator(wave_weights):
+    return mohid_interpolate.interpolation_operator.from_weighting_matrix(wave_weights)
+
+
+class TestInterpolationOperator:
+    """Unit tests for storing, loading, and restricting
+    mohid_interpolate.interpolation_operator.
+    """
+
+    def check_equal(self, loaded, operator):
+        for name in mohid_interpolate.interpolation_operator.arrays:
+            assert getattr(loaded, name).dtype == getattr(operator, name).dtype
+            numpy.testing.assert_array_equal(
+                getattr(loaded, name), getattr(operator, name)
+            )
+        numpy.testing.assert_array_equal(loaded.have_source, operator.have_source)
+        assert loaded.grid_shape == operator.grid_shape == GRID_SHAPE
+
+    def test_save_load(self, wave_operator, tmp_path):
+        dirname = str(tmp_path / "wave.operator")
+        wave_operator.save(dirname)
+        assert os.listdir(tmp_path) == ["wave.operator"]
+        loaded = mohid_interpolate.interpolation_operator.load(dirname)
+        self.check_equal(loaded, wave_operator)
+        assert isinstance(loaded.weights, numpy.memmap)
+        assert (loaded.y_indices.dtype, loaded.weights.dtype) == (
+            numpy.int32,
+            numpy.float32,
+        )
+
+    def test_save_existing(self, wave_operator, tmp_path):
+        # Another process stored the operator first
+        dirname = str(tmp_path / "wave.operator")
+        wave_operator.save(dirname)
+        wave_operator.save(dirname)
+        assert os.listdir(tmp_path) == ["wave.operator"]
+        self.check_equal(
+            mohid_interpolate.interpolation_operator.load(dirname), wave_operator
+        )
+
+    def test_loaded_operator_interpolates(
+        self, wave_operator, tmp_path, source_values, wavewatch_loop
+    ):
+        dirname = str(tmp_path / "wave.operator")
+        wave_operator.save(dirname)
+        loaded = mohid_interpolate.interpolation_operator.load(dirname)
+        numpy.testing.assert_allclose(
+            mohid_interpolate.wavewatch(source_values, loaded),
+            wavewatch_loop,
+            rtol=1e-5,
+            atol=1e-6,
+        )
+
+    def test_restrict(self, wave_operator, water_mask):
+        restricted = wave_operator.restrict(water_mask)
+        for name in mohid_interpolate.interpolation_operator.arrays:
+            numpy.testing.assert_array_equal(
+                getattr(restricted, name), getattr(wave_operator, name)[:, water_mask]
+            )
+        assert restricted.grid_shape == GRID_SHAPE
+        numpy.testing.assert_array_equal(restricted.water_mask, water_mask)
+        assert wave_operator.water_mask is None
+
+    def test_restrict_cached(self, wave_operator, water_mask):
+        restricted = wave_operator.restrict(water_mask)
+        # Masks are cached by their contents
+        assert wave_operator.restrict(water_mask.copy()) is restricted
+        assert wave_operator.restrict(water_mask.astype(int)) is restricted
+        assert wave_operator.restrict(~water_mask) is not restricted
+
+    def test_load_operator(self, tmp_path, monkeypatch):
+        rng = numpy.random.default_rng(3)
+        path = str(_write_weights(tmp_path / "wave.nc", rng, missing_fraction=0.3))
+        mohid_interpolate.load_operator.cache_clear()
+        operator = mohid_interpolate.load_operator(path)
+        operator_dir = (
+            f"{tmp_path}/wave.{mohid_interpolate.weights_file_hash(path)}.operator"
+        )
+        assert os.path.isdir(operator_dir)
+        assert isinstance(operator.weights, numpy.memmap)
+        expected = mohid_interpolate.interpolation_operator.from_weighting_matrix(
+            mohid_interpolate.weighting_matrix(path)
+        )
+        self.check_equal(operator, expected)
+        # Stored operators are loaded without reading the weights file
+        mohid_interpolate.load_operator.cache_clear()
+        monkeypatch.setattr(
+            mohid_interpolate,
+            "weighting_matrix",
+            lambda path: pytest.fail(f"{path} was read"),
+        )
+        self.check_equal(mohid_interpolate.load_operator(path), expected)
+        mohid_interpolate.load_operator.cache_clear()
+
+    def test_changed_weights_file(self, tmp_path):
+        rng = numpy.random.default_rng(5)
+        path = str(_write_weights(tmp_path / "wave.nc", rng))
+        mohid_interpolate.load_operator.cache_clear()
+        mohid_interpolate.load_operator(path)
+        first_hash = mohid_interpolate.weights_file_hash(path)
+        # A new weights file with the same name is stored under a new key
+        _write_weights(tmp_path / "wave.nc", rng)
+        second_hash = mohid_interpolate.weights_file_hash(path)
+        assert second_hash != first_hash
+        mohid_interpolate.load_operator.cache_clear()
+        operator = mohid_interpolate.load_operator(path)
+        assert sorted(os.listdir(tmp_path)) == sorted(
+            [
+                "wave.nc",
+                f"wave.{first_hash}.operator",
+                f"wave.{second_hash}.operator",
+            ]
+        )
+        self.check_equal(
+            operator,
+            mohid_interpolate.interpolation_operator.from_weighting_matrix(
+                mohid_interpolate.weighting_matrix(path)
+            ),
+        )
+        mohid_interpolate.load_operator.cache_clear()
+
+
+@pytest.fixture(scope="module")
+def ssc_values(rng):
+    # (time, depth, y, x) values with NaNs at land points
+    values = rng.standard_normal((3, 4, 7, 6)).astype("float32")
+    values[:, :, :2, :2] = numpy.nan
+    values[:, -1] = numpy.nan
+    return values
+
+
+class TestMungArray:
+    """Unit tests for make_hdf5.mung_array()."""
+
+    def test_3d(self, ssc_values):
+        mohid_gridded = make_hdf5.mung_array(ssc_values[0], "3D")
+        expected = numpy.nan_to_num(
+            numpy.flip(numpy.transpose(ssc_values[0, :, 1:-1, 1:-1], [0, 2, 1]), axis=0)
+        )
+        assert mohid_gridded.dtype == numpy.float32
+        numpy.testing.assert_array_equal(mohid_gridded, expected)
+
+    @pytest.mark.parametrize(
+        "array_slice_type, index", (("3D", ()), ("2D", (slice(None), 0)))
+    )
+    def test_out_buffer(self, ssc_values, array_slice_type, index):
+        values = ssc_values[index]
+        expected = make_hdf5.mung_array(values, array_slice_type)
+        out = numpy.full(expected.shape, -1, dtype="float32")
+        mohid_gridded = make_hdf5.mung_array(values, array_slice_type, out=out)
+        assert mohid_gridded is out
+        numpy.testing.assert_array_equal(out, expected)
+
+    def test_source_not_modified(self, ssc_values):
+        values = ssc_values.copy()
+        make_hdf5.mung_array(values, "3D")
+        numpy.testing.assert_array_equal(values, ssc_values)
+
+
+class TestUnstaggerMungArray:
+    """Unit tests for make_hdf5.unstagger_mung_array()."""
+
+    @pytest.mark.parametrize("coordinate", ("x", "y"))
+    def test_matches_unstagger_dataarray(self, ssc_values, coordinate):
+        velocity = xarray.DataArray(ssc_values, dims=("time", "depth", "y", "x"))
+        expected = make_hdf5.mung_array(
+            make_hdf5.unstagger_dataarray(velocity, coordinate).values, "3D"
+        )
+        mohid_gridded = make_hdf5.unstagger_mung_array(ssc_values, coordinate)
+        assert mohid_gridded.dtype == numpy.float32
+        numpy.testing.assert_allclose(mohid_gridded, expected, rtol=1e-6)
+
+    @pytest.mark.parametrize("coordinate", ("x", "y"))
+    def test_out_buffer(self, ssc_values, coordinate):
+        expected = make_hdf5.unstagger_mung_array(ssc_values[0], coordinate)
+        out = numpy.full(expected.shape, -1, dtype="float32")
+        mohid_gridded = make_hdf5.unstagger_mung_array(
+            ssc_values[0], coordinate, out=out
+        )
+        assert mohid_gridded is out
+        numpy.testing.assert_array_equal(out, expected)
+
+
+class TestRoundBits:
+    """Unit tests for make_hdf5.round_bits()."""
+
+    @pytest.mark.parametrize(
+        "value, expected",
+        (
+            # 1.01b is halfway between 1.0b and 1.1b, and rounds to the even 1.0b
+            (1.25, 1.0),
+            # 1.11b is halfway between 1.1b and 10.0b, and rounds to the even 10.0b
+            (1.75, 2.0),
+            (-1.25, -1.0),
+            (-1.75, -2.0),
+            # 1.011b is not a tie, so it rounds to the nearest value
+            (1.375, 1.5),
+            (1.125, 1.0),
+        ),
+    )
+    def test_ties_to_even(self, value, expected):
+        rounded = make_hdf5.round_bits(numpy.array([value], dtype="float32"), 1)
+        assert rounded[0] == expected
+
+    def test_relative_error(self, rng):
+        values = rng.standard_normal(10000).astype("float32") * 1e3
+        rounded = make_hdf5.round_bits(values, 7)
+        assert rounded.dtype == numpy.float32
+        assert (numpy.abs(rounded - values) <= 2 ** -8 * numpy.abs(values)).all()
+        # The dropped mantissa bits are zeros
+        assert (rounded.view("uint32") & numpy.uint32(2 ** 16 - 1) == 0).all()
+
+    def test_special_values(self):
+        values = numpy.array([0, -0.0, numpy.inf, -numpy.inf], dtype="float32")
+        numpy.testing.assert_array_equal(make_hdf5.round_bits(values, 5), values)
+        assert numpy.isnan(make_hdf5.round_bits(numpy.float32([numpy.nan]), 5)[0])
+
+    @pytest.mark.parametrize("keep_bits", (0, 1, 5, 22))
+    def test_non_finite_unchanged(self, keep_bits):
+        values = numpy.array(
+            [numpy.nan, -numpy.nan, numpy.inf, -numpy.inf, 1.5], dtype="float32"
+        )
+        rounded = make_hdf5.round_bits(values, keep_bits)
+        numpy.testing.assert_array_equal(
+            rounded[:4].view("uint32"), values[:4].view("uint32")
+        )
+        assert numpy.isfinite(rounded[4])
+
+    def test_all_bits_kept(self, rng):
+        values = rng.standard_normal(100).astype("float32")
+        rounded = make_hdf5.round_bits(values, 23)
+        numpy.testing.assert_array_equal(rounded, values)
+        assert rounded is not values
+
+
+@pytest.fixture(scope="module")
+def values(rng):
+    # (time, location) values with a large offset to check the numerical stability
+    return 1e4 + rng.standard_normal((50, 3))
+
+
+class TestRunningStats:
+    """Unit tests for make_forcing_statistics.running_stats."""
+
+    def check(self, stats, values):
+        assert stats.count == len(values)
+        numpy.testing.assert_allclose(stats.mean, values.mean(axis=0), rtol=1e-12)
+        numpy.testing.assert_allclose(stats.std, values.std(axis=0), rtol=1e-9)
+        numpy.testing.assert_array_equal(stats.min, values.min(axis=0))
+        numpy.testing.assert_array_equal(stats.max, values.max(axis=0))
+
+    def test_add(self, values):
+        stats = make_forcing_statistics.running_stats(values.shape[1:])
+        for time_step in values:
+            stats.add(time_step)
+        self.check(stats, values)
+
+    def test_add_block(self, values):
+        stats = make_forcing_statistics.running_stats(values.shape[1:])
+        for start in range(0, len(values), 7):
+            stats.add_block(values[start : start + 7])
+        stats.add_block(values[:0])
+        self.check(stats, values)
+
+    def test_merge(self, values):
+        parts = []
+        for start, stop in ((0, 1), (1, 20), (20, 20), (20, 50)):
+            part = make_forcing_statistics.running_stats(values.shape[1:])
+            part.add_block(values[start:stop])
+            parts.append(part)
+        stats = make_forcing_statistics.running_stats(values.shape[1:])
+        for part in parts:
+            stats.merge(part)
+        self.check(stats, values)
+
+    def test_merge_summaries(self, values):
+        stats = make_forcing_statistics.running_stats()
+        for start, stop in ((0, 13), (13, 50)):
+            part = make_forcing_statistics.running_stats(values.shape[1:])
+            part.add_block(values[start:stop])
+            stats.merge(
+                make_forcing_statistics.running_stats.from_summary(part.summary(1))
+            )
+        self.check(stats, values[:, 1])
+
+    def test_exceedances(self, values):
+        stats = make_forcing_statistics.running_stats(values.shape[1:], threshold=1e4)
+        stats.add_block(values[:25])
+        other = make_forcing_statistics.running_stats(values.shape[1:], threshold=1e4)
+        other.add_block(values[25:])
+        stats.merge(other)
+        numpy.testing.assert_allclose(
+            stats.arrays()["exceedance_fraction"], (values > 1e4).mean(axis=0)
+        )
+
+    def test_empty(self):
+        stats = make_forcing_statistics.running_stats((2,))
+        stats.merge(make_forcing_statistics.running_stats((2,)))
+        assert stats.count == 0
+        assert numpy.isnan(stats.arrays()["mean"]).all()
+
+
+@pytest.fixture(scope="module")
+def windows():
+    return shards.date_range_windows(
+        datetime(2019, 1, 1), datetime(2019, 12, 31), 1, step_days=1
+    ) + shards.date_range_windows(
+        datetime(2019, 3, 1), datetime(2019, 5, 31), 7, step_days=3
+    )
+
+
+class TestShardWindows:
+    """Unit tests for shards.shard_windows()."""
+
+    @pytest.mark.parametrize("task_count", (1, 2, 7, 16, 500))
+    def test_every_window_once(self, windows, task_count):
+        task_shards = [
+            shards.shard_windows(windows, task_index, task_count)
+            for task_index in range(task_count)
+        ]
+        sharded = [window for shard in task_shards for window in shard]
+        assert sorted(sharded) == sorted(set(windows))
+        assert len(sharded) == len(set(sharded))
+
+    def test_contiguous_shards(self, windows):
+        task_shards = [
+            shards.shard_windows(windows, task_index, 7) for task_index in range(7)
+        ]
+        sharded = [window for shard in task_shards for window in shard]
+        assert sharded == sorted(set(windows))
+
+    def test_balanced_days(self, windows):
+        days = [
+            sum(n_days + 1 for _, n_days in shards.shard_windows(windows, i, 4))
+            for i in range(4)
+        ]
+        assert max(days) - min(days) <= 2 * max(n_days + 1 for _, n_days in windows)
+
+    def test_duplicate_windows(self, windows):
+        assert shards.shard_windows(windows + windows, 3, 7) == shards.shard_windows(
+            windows, 3, 7
+        )
+
+
+class TestArrayTask:
+    """Unit tests for shards.array_task()."""
+
+    def test_options(self):
+        assert shards.array_task(2, 4, environ={}) == (2, 4)
+
+    def test_slurm_array_step(self):
+        environ = {
+            "SLURM_ARRAY_TASK_ID": "9",
+            "SLURM_ARRAY_TASK_MIN": "1",
+            "SLURM_ARRAY_TASK_STEP": "4",
+            "SLURM_ARRAY_TASK_COUNT": "3",
+        }
+        assert shards.array_task(environ=environ) == (2, 3)
+
+    def test_out_of_range(self, capsys):
+        environ = {"SLURM_ARRAY_TASK_ID": "4", "SLURM_ARRAY_TASK_COUNT": "4"}
+        assert shards.array_task(environ=environ) is None
+        assert "must be from 0 to 3" in capsys.readouterr().out
+
+    def test_missing(self, capsys):
+        assert shards.array_task(task_count=4, environ={}) is None
+        assert "Task index" in capsys.readouterr().out
+
+
+class TestVerifyHDF5File:
+    """Unit tests for shards.verify_hdf5_file()."""
+
+    @pytest.fixture
+    def window(self, tmp_path, ssc_path):
+        run = _run(tmp_path, ssc_path)
+        (dirname,) = make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)])
+        source_files = make_hdf5.find_source_files(run, SSC_DAYS[:2])
+        return (
+            os.path.join(dirname, "t.hdf5"),
+            [(datatype, groupname, "grid_T") for datatype, _, groupname in GRID_T_JOBS],
+            {"grid_T": [source_files["grid_T", day] for day in SSC_DAYS[:2]]},
+        )
+
+    def test_complete(self, window):
+        assert shards.verify_hdf5_file(*window) == []
+
+    def test_missing_time_record(self, window):
+        hdf5_path, jobs, window_source_files = window
+        with h5py.File(hdf5_path, "a") as f:
+            del f["Results/salinity/salinity_00006"]
+        problems = shards.verify_hdf5_file(hdf5_path, jobs, window_source_files)
+        assert problems == [
+            f"t.hdf5: 1 salinity time records from "
+            f"{window_source_files['grid_T'][1]} are missing"
+        ]
+
+    def test_missing_group(self, window):
+        hdf5_path, jobs, window_source_files = window
+        with h5py.File(hdf5_path, "a") as f:
+            del f["Results/water level"]
+        problems = shards.verify_hdf5_file(hdf5_path, jobs, window_source_files)
+        assert problems == [
+            f"t.hdf5: 4 water level time records from "
+            f"{window_source_files['grid_T'][0]} are missing"
+        ]
+
+    def test_truncated_manifest(self, window):
+        hdf5_path, jobs, window_source_files = window
+        manifest_path = f"{hdf5_path}{make_hdf5.MANIFEST_SUFFIX}"
+        with open(manifest_path) as f:
+            lines = f.readlines()
+        with open(manifest_path, "w") as f:
+            f.writelines(lines[:-1])
+            f.write(lines[-1][: len(lines[-1]) // 2])
+        problems = shards.verify_hdf5_file(hdf5_path, jobs, window_source_files)
+        assert len(problems) == 1
+        assert "is not recorded at time record 5" in problems[0]
+
+    def test_missing_file(self, window):
+        hdf5_path, jobs, window_source_files = window
+        os.remove(hdf5_path)
+        problems = shards.verify_hdf5_file(hdf5_path, jobs, window_source_files)
+        assert problems == ["t.hdf5 is missing"]
+
+
+class TestResume:
+    """Unit tests for resuming interrupted make_hdf5.process_windows() runs with the
+    progress_manifest of each HDF5 file.
+    """
+
+    @pytest.fixture
+    def completed(self, tmp_path, ssc_path):
+        run = _run(tmp_path, ssc_path)
+        (dirname,) = make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)])
+        hdf5_path = os.path.join(dirname, "t.hdf5")
+        return run, hdf5_path, _read_records(hdf5_path)
+
+    def test_manifest_units(self, completed):
+        run, hdf5_path, _ = completed
+        manifest = make_hdf5.progress_manifest(
+            f"{hdf5_path}{make_hdf5.MANIFEST_SUFFIX}", resume=True
+        )
+        source_files = make_hdf5.find_source_files(run, SSC_DAYS[:2])
+        for datatype, _, _ in GRID_T_JOBS:
+            for accumulator, day in ((1, SSC_DAYS[0]), (5, SSC_DAYS[1])):
+                source_file = source_files["grid_T", day]
+                assert manifest.completed(datatype, source_file, accumulator) == 4
+            assert manifest.completed(datatype, source_file, 1) is None
+
+    def test_completed_units_skipped(self, completed, monkeypatch):
+        run, hdf5_path, expected = completed
+        opened = []
+        monkeypatch.setattr(
+            make_hdf5.xarray,
+            "open_dataset",
+            lambda *args, **kwargs: opened.append(args) or xarray.load_dataset(*args),
+        )
+        metrics = make_hdf5.run_metrics()
+        make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)], resume=True, metrics=metrics)
+        assert opened == []
+        assert metrics.records == []
+        numpy.testing.assert_equal(_read_records(hdf5_path), expected)
+
+    def test_removed_unit_rewritten(self, completed):
+        run, hdf5_path, expected = completed
+        source_file = make_hdf5.find_source_files(run, SSC_DAYS[1:2])[
+            "grid_T", SSC_DAYS[1]
+        ]
+        manifest_path = f"{hdf5_path}{make_hdf5.MANIFEST_SUFFIX}"
+        with open(manifest_path) as f:
+            lines = f.readlines()
+        with open(manifest_path, "w") as f:
+            f.writelines(
+                line
+                for line in lines
+                if not ('"temperature"' in line and source_file in line)
+            )
+        with h5py.File(hdf5_path, "a") as f:
+            for record in range(5, 9):
+                del f[f"Results/temperature/temperature_{record:05d}"]
+        metrics = make_hdf5.run_metrics()
+        make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)], resume=True, metrics=metrics)
+        assert [
+            (record["datatype"], record["source_file"], record["n_records"])
+            for record in metrics.records
+        ] == [("temperature", source_file, 4)]
+        numpy.testing.assert_equal(_read_records(hdf5_path), expected)
+
+    def test_recorded_unit_without_datasets_rewritten(self, completed):
+        run, hdf5_path, expected = completed
+        with h5py.File(hdf5_path, "a") as f:
+            del f["Results/salinity/salinity_00002"]
+        metrics = make_hdf5.run_metrics()
+        make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)], resume=True, metrics=metrics)
+        assert [record["datatype"] for record in metrics.records] == ["salinity"]
+        numpy.testing.assert_equal(_read_records(hdf5_path), expected)
+
+    def test_partial_manifest_line(self, completed):
+        run, hdf5_path, expected = completed
+        manifest_path = f"{hdf5_path}{make_hdf5.MANIFEST_SUFFIX}"
+        with open(manifest_path) as f:
+            lines = f.readlines()
+        # An interrupted run can leave an incomplete last line
+        with open(manifest_path, "w") as f:
+            f.writelines(lines[:-1])
+            f.write(lines[-1][:-10])
+        metrics = make_hdf5.run_metrics()
+        make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)], resume=True, metrics=metrics)
+        assert len(metrics.records) == 1
+        numpy.testing.assert_equal(_read_records(hdf5_path), expected)
+
+    def test_new_run_replaces_manifest(self, completed):
+        run, hdf5_path, _ = completed
+        make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)])
+        with open(f"{hdf5_path}{make_hdf5.MANIFEST_SUFFIX}") as f:
+            assert len(f.readlines()) == 2 * len(GRID_T_JOBS)
+
+
+class TestConsolidatedLayout:
+    """Unit tests for HDF5 forcing files with the consolidated layout."""
+
+    @pytest.fixture
+    def layouts(self, tmp_path, ssc_path):
+        dirnames = {}
+        for layout in ("per_time_step", "consolidated"):
+            run = _run(tmp_path / layout, ssc_path, hdf5_layout=layout)
+            (dirnames[layout],) = make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)])
+        return dirnames
+
+    def test_virtual_datasets(self, layouts):
+        with h5py.File(os.path.join(layouts["consolidated"], "t.hdf5"), "r") as f:
+            for _, _, groupname in GRID_T_JOBS:
+                for record in range(1, 9):
+                    assert f[f"Results/{groupname}/{groupname}_{record:05d}"].is_virtual
+
+    def test_matches_per_time_step(self, layouts):
+        per_time_step = _read_records(os.path.join(layouts["per_time_step"], "t.hdf5"))
+        consolidated = _read_records(os.path.join(layouts["consolidated"], "t.hdf5"))
+        assert consolidated.keys() == per_time_step.keys()
+        numpy.testing.assert_equal(consolidated, per_time_step)
+
+    def test_forcing_statistics(self, layouts):
+        locations = [(1, 2), (3, 5), (2, 0)]
+        windows = [(0, 4), (2, 6), (0, 8)]
+        stats = {
+            layout: make_forcing_statistics.calculate_forcing_statistics(
+                dirname, locations, windows
+            )
+            for layout, dirname in layouts.items()
+        }
+        records = _read_records(os.path.join(layouts["per_time_step"], "t.hdf5"))
+        gridx, gridy = numpy.array(locations).T
+        for window_index, (start, hours) in enumerate(windows):
+            for location_index in range(len(locations)):
+                per_time_step = stats["per_time_step"].statistics(
+                    window_index, location_index
+                )
+                assert (
+                    stats["consolidated"].statistics(window_index, location_index)
+                    == per_time_step
+                )
+            series = numpy.array(
+                [
+                    records[f"Results/salinity/salinity_{record:05d}"][-1, gridx, gridy]
+                    for record in range(start + 1, start + hours + 1)
+                ]
+            )
+            for location_index in range(len(locations)):
+                assert (
+                    stats["per_time_step"].statistics(window_index, location_index)[
+                        "salinity"
+                    ]["mean"]
+                    == "%.4g" % series[:, location_index].mean()
+                )
+
+
+@pytest.fixture(scope="module")
+def block_variable():
+    return xarray.DataArray(
+        numpy.zeros((24, 40, 30, 20), dtype="float32"),
+        dims=("time_counter", "deptht", "y", "x"),
+    )
+
+
+class TestTimeBlockSize:
+    """Unit tests for make_hdf5.time_block_size()."""
+
+    def step_mb(self, variable):
+        return (
+            variable[0].size
+            * variable.dtype.itemsize
+            * make_hdf5.STREAMING_COPIES
+            / 2 ** 20
+        )
+
+    def test_budget_smaller_than_one_step(self, block_variable):
+        assert (
+            make_hdf5.time_block_size(block_variable, self.step_mb(block_variable) / 2)
+            == 1
+        )
+        assert make_hdf5.time_block_size(block_variable, 0) == 1
+
+    def test_budget_larger_than_window(self, block_variable):
+        budget = self.step_mb(block_variable) * 100
+        assert make_hdf5.time_block_size(block_variable, budget) == 24
+
+    def test_whole_steps(self, block_variable):
+        step_mb = self.step_mb(block_variable)
+        assert make_hdf5.time_block_size(block_variable, step_mb * 5) == 5
+        assert make_hdf5.time_block_size(block_variable, step_mb * 5.9) == 5
+
+    def test_float64_variable(self, block_variable):
+        step_mb = self.step_mb(block_variable)
+        assert (
+            make_hdf5.time_block_size(block_variable.astype("float64"), step_mb * 6)
+            == 3
+        )
+
+    def test_budgeted_run_matches(self, tmp_path, ssc_path):
+        (expected,) = make_hdf5.process_windows(
+            _run(tmp_path / "unbudgeted", ssc_path), [(SSC_DAYS[0], 1)]
+        )
+        (budgeted,) = make_hdf5.process_windows(
+            _run(tmp_path / "budgeted", ssc_path, memory_budget_mb=1e-6),
+            [(SSC_DAYS[0], 1)],
+        )
+        numpy.testing.assert_equal(
+            _read_records(os.path.join(budgeted, "t.hdf5")),
+            _read_records(os.path.join(expected, "t.hdf5")),
+        )
+
+
+class TestBatchWindows:
+    """Unit tests for processing a batch of run windows with
+    make_hdf5.process_windows().
+    """
+
+    def test_overlapping_windows(self, tmp_path, ssc_path, monkeypatch):
+        windows = [(SSC_DAYS[0], 1), (SSC_DAYS[1], 1)]
+        expected = [
+            make_hdf5.process_windows(_run(tmp_path / f"{i}", ssc_path), [window])[0]
+            for i, window in enumerate(windows)
+        ]
+        opened = []
+        open_dataset = xarray.open_dataset
+        monkeypatch.setattr(
+            make_hdf5.xarray,
+            "open_dataset",
+            lambda *args, **kwargs: opened.append(args[0])
+            or open_dataset(*args, **kwargs),
+        )
+        metrics = make_hdf5.run_metrics()
+        dirnames = make_hdf5.process_windows(
+            _run(tmp_path / "batch", ssc_path), windows, metrics=metrics
+        )
+        source_files = make_hdf5.find_source_files(_run(tmp_path, ssc_path), SSC_DAYS)
+        assert sorted(opened) == sorted(source_files["grid_T", day] for day in SSC_DAYS)
+        assert len(metrics.records) == len(SSC_DAYS) * len(GRID_T_JOBS)
+        assert len(dirnames) == len(windows)
+        for dirname, expected_dirname in zip(dirnames, expected):
+            assert os.path.basename(dirname) == os.path.basename(expected_dirname)
+            numpy.testing.assert_equal(
+                _read_records(os.path.join(dirname, "t.hdf5")),
+                _read_records(os.path.join(expected_dirname, "t.hdf5")),
+            )
+
+
+class TestStorageSettings:
+    """Unit tests for the HDF5 storage settings of the datatype datasets that
+    make_hdf5.process_windows() writes.
+    """
+
+    @pytest.fixture
+    def run_description(self):
+        return {
+            "hdf5_storage": {"compression": "gzip", "compression_opts": 4},
+            "salish_seacast_forcing": {
+                "salinity": {"hdf5_storage": {"shuffle": True, "chunks": [1, 4, 6]}},
+                "sea_surface_height": {
+                    "hdf5_storage": {"compression": "lzf", "chunks": [2, 3]}
+                },
+            },
+        }
+
+    def test_storage_settings(self, run_description):
+        assert make_hdf5.storage_settings(run_description, "salinity") == {
+            "compression": "gzip",
+            "compression_opts": 4,
+            "shuffle": True,
+            "chunks": [1, 4, 6],
+        }
+        assert make_hdf5.storage_settings(run_description, "temperature") == {
+            "compression": "gzip",
+            "compression_opts": 4,
+        }
+        # The gzip level doesn't apply to the section's compression filter
+        assert make_hdf5.storage_settings(run_description, "sea_surface_height") == {
+            "compression": "lzf",
+            "chunks": [2, 3],
+        }
+
+    def test_dataset_filters(self, tmp_path, ssc_path, run_description):
+        (expected,) = make_hdf5.process_windows(
+            _run(tmp_path / "default", ssc_path), [(SSC_DAYS[0], 1)]
+        )
+        (dirname,) = make_hdf5.process_windows(
+            _run(tmp_path, ssc_path, run_description=run_description),
+            [(SSC_DAYS[0], 1)],
+        )
+        hdf5_path = os.path.join(dirname, "t.hdf5")
+        with h5py.File(hdf5_path, "r") as f:
+            salinity = f["Results/salinity/salinity_00001"]
+            assert (salinity.compression, salinity.compression_opts) == ("gzip", 4)
+            assert salinity.shuffle
+            assert salinity.chunks == (1, 4, 6)
+            temperature = f["Results/temperature/temperature_00001"]
+            assert (temperature.compression, temperature.compression_opts) == (
+                "gzip",
+                4,
+            )
+            assert not temperature.shuffle
+            water_level = f["Results/water level/water level_00001"]
+            assert water_level.compression == "lzf"
+            assert water_level.chunks == (2, 3)
+            for dataset in (salinity, temperature, water_level):
+                assert dataset.dtype == numpy.float32
+                assert dataset.scaleoffset is None
+        # Lossless filters store the same values
+        numpy.testing.assert_equal(
+            _read_records(hdf5_path), _read_records(os.path.join(expected, "t.hdf5"))
+        )
+
+    def test_uncompressed_default(self, tmp_path, ssc_path):
+        (dirname,) = make_hdf5.process_windows(
+            _run(tmp_path, ssc_path), [(SSC_DAYS[0], 1)]
+        )
+        with h5py.File(os.path.join(dirname, "t.hdf5"), "r") as f:
+            dataset = f["Results/salinity/salinity_00001"]
+            assert dataset.compression is None
+            assert not dataset.shuffle
+            assert dataset.chunks is None
+
+
+class TestPrecisionSettings:
+    """Unit tests for the reduced precision HDF5 storage settings of the datatype
+    datasets that make_hdf5.process_windows() writes, and the errors that are
+    reported for them.
+    """
+
+    @pytest.fixture
+    def reduced(self, tmp_path, ssc_path):
+        run_description = {
+            "salish_seacast_forcing": {
+                "salinity": {"hdf5_storage": {"keep_bits": 7, "compression": "gzip"}},
+                "temperature": {
+                    "hdf5_storage": {"scaleoffset": 2, "chunks": [3, 4, 6]}
+                },
+                "sea_surface_height": {"hdf5_storage": {"dtype": "float16"}},
+            }
+        }
+        (expected,) = make_hdf5.process_windows(
+            _run(tmp_path / "full", ssc_path), [(SSC_DAYS[0], 1)]
+        )
+        metrics = make_hdf5.run_metrics()
+        (dirname,) = make_hdf5.process_windows(
+            _run(tmp_path, ssc_path, run_description=run_description),
+            [(SSC_DAYS[0], 1)],
+            metrics=metrics,
+        )
+        return (
+            os.path.join(dirname, "t.hdf5"),
+            _read_records(os.path.join(expected, "t.hdf5")),
+            metrics.records,
+        )
+
+    def errors(self, records, expected, groupname):
+        """Maximum absolute error of the stored values of a group, and the maximum
+        absolute values that they were calculated from.
+        """
+        names = [name for name in expected if name.startswith(f"Results/{groupname}/")]
+        max_error = max(
+            numpy.nanmax(numpy.abs(records[name].astype(float) - expected[name]))
+            for name in names
+        )
+        max_value = max(numpy.nanmax(numpy.abs(expected[name])) for name in names)
+        return max_error, max_value
+
+    def reported(self, metrics_records, datatype):
+        return [record for record in metrics_records if record["datatype"] == datatype]
+
+    def test_dataset_settings(self, reduced):
+        hdf5_path, _, _ = reduced
+        with h5py.File(hdf5_path, "r") as f:
+            salinity = f["Results/salinity/salinity_00001"]
+            assert salinity.dtype == numpy.float32
+            assert salinity.compression == "gzip"
+            assert salinity.scaleoffset is None
+            temperature = f["Results/temperature/temperature_00001"]
+            assert temperature.dtype == numpy.float32
+            assert temperature.scaleoffset == 2
+            assert temperature.chunks == (3, 4, 6)
+            water_level = f["Results/water level/water level_00001"]
+            assert water_level.dtype == numpy.float16
+            assert water_level.scaleoffset is None
+
+    def test_keep_bits(self, reduced):
+        hdf5_path, expected, metrics_records = reduced
+        records = _read_records(hdf5_path)
+        max_error, max_value = self.errors(records, expected, "salinity")
+        assert 0 < max_error <= 2 ** -8 * max_value
+        # The dropped mantissa bits are zeros
+        for name, values in records.items():
+            if name.startswith("Results/salinity/"):
+                finite = values[numpy.isfinite(values)]
+                assert (finite.view("uint32") & numpy.uint32(2 ** 16 - 1) == 0).all()
+        reported = self.reported(metrics_records, "salinity")
+        assert max(record["max_error"] for record in reported) == pytest.approx(
+            max_error
+        )
+
+    def test_scaleoffset(self, reduced):
+        hdf5_path, expected, metrics_records = reduced
+        max_error, _ = self.errors(_read_records(hdf5_path), expected, "temperature")
+        assert 0 < max_error <= 0.5e-2
+        reported = self.reported(metrics_records, "temperature")
+        assert len(reported) == 2
+        assert max(record["max_error"] for record in reported) == pytest.approx(
+            max_error
+        )
+
+    def test_float16(self, reduced):
+        hdf5_path, expected, metrics_records = reduced
+        max_error, max_value = self.errors(
+            _read_records(hdf5_path), expected, "water level"
+        )
+        assert 0 < max_error <= 2 ** -11 * max_value
+        reported = self.reported(metrics_records, "sea_surface_height")
+        assert max(record["max_error"] for record in reported) == pytest.approx(
+            max_error
+        )
+        for record in reported:
+            # 4 time records from each source file
+            assert (
+                record["error_values"]
+                == 4 * expected["Results/water level/water level_00001"].size
+            )
+            assert 0 < record["rms_error"] <= record["max_error"]
+
+    def test_full_precision_errors_not_reported(self, tmp_path, ssc_path):
+        metrics = make_hdf5.run_metrics()
+        make_hdf5.process_windows(
+            _run(tmp_path, ssc_path), [(SSC_DAYS[0], 1)], metrics=metrics
+        )
+        for record in metrics.records:
+            assert "max_error" not in record
+
+
+class TestArchiveFileNames:
+    """Unit tests for the parsing of the archive file names of each source by
+    forcing_paths.archive_index.
+    """
+
+    @pytest.mark.parametrize(
+        "name, expected",
+        (
+            (
+                "SalishSea_1h_20190101_20190101_grid_T.nc",
+                ("salishseacast", "grid_T", "20190101"),
+            ),
+            (
+                "SalishSea_1h_20190101_20190101_grid_U.nc",
+                ("salishseacast", "grid_U", "20190101"),
+            ),
+            ("SalishSea_1h_20190101_20190102_grid_T.nc", None),
+            ("SalishSea_1d_20190101_20190101_grid_T.nc", None),
+            ("SalishSea_1h_20190101_20190101_grid_T.nc.tmp", None),
+        ),
+    )
+    def test_salishseacast(self, name, expected):
+        assert forcing_paths._salishseacast_file(name) == expected
+
+    @pytest.mark.parametrize(
+        "name, expected",
+        (
+            ("ops_y2019m01d02.nc", ("hrdps", "", "20190102")),
+            ("ops_y2019m1d2.nc", None),
+            ("ops_y2019m01d02.nc.bak", None),
+        ),
+    )
+    def test_hrdps(self, name, expected):
+        assert forcing_paths._hrdps_file(name) == expected
+
+    @pytest.mark.parametrize(
+        "name, expected",
+        (
+            ("SoG_ww3_fields_20190103.nc", ("wavewatch3", "", "20190103")),
+            ("SoG_ww3_fields_20190103_20190103.nc", ("wavewatch3", "", "20190103")),
+            ("SoG_ww3_fields_20190103_20190104.nc", None),
+            ("SoG_ww3_points_20190103.nc", None),
+        ),
+    )
+    def test_wavewatch3(self, name, expected):
+        assert forcing_paths._ww3_file(name) == expected
+
+
+class TestArchiveIndex:
+    """Unit tests for forcing_paths.archive_index."""
+
+    @pytest.fixture
+    def archive(self, tmp_path):
+        for day in SSC_DAYS[:2]:
+            ddmmmyy = day.strftime("%d%b%y").lower()
+            ymd = day.strftime("%Y%m%d")
+            for filetype in ("grid_T", "grid_U"):
+                _touch(
+                    tmp_path
+                    / "ssc"
+                    / ddmmmyy
+                    / f"SalishSea_1h_{ymd}_{ymd}_{filetype}.nc"
+                )
+            _touch(tmp_path / "hrdps" / f"ops_{day:y%Ym%md%d}.nc")
+            _touch(tmp_path / "ww3" / ddmmmyy / f"SoG_ww3_fields_{ymd}_{ymd}.nc")
+            _touch(tmp_path / "ww3" / ddmmmyy / f"SoG_ww3_fields_{ymd}.nc")
+        # Files and directories that aren't in the archive naming schemes
+        _touch(tmp_path / "ssc" / "rivers" / "SalishSea_1h_20190101_20190101_grid_T.nc")
+        _touch(tmp_path / "hrdps" / "README")
+        source_paths = {
+            source: f"{tmp_path / source}/" for source in ("ssc", "hrdps", "ww3")
+        }
+        source_paths["salishseacast"] = source_paths.pop("ssc")
+        source_paths["wavewatch3"] = source_paths.pop("ww3")
+        return source_paths, str(tmp_path / "index.json")
+
+    def test_find(self, archive):
+        source_paths, index_path = archive
+        index = forcing_paths.archive_index(source_paths, index_path)
+        index.refresh()
+        found, missing = index.find(
+            "salishseacast", SSC_DAYS[0], SSC_DAYS[-1], filetype="grid_T"
+        )
+        ssc_path = source_paths["salishseacast"]
+        assert found == {
+            SSC_DAYS[0]: f"{ssc_path}01jan19/SalishSea_1h_20190101_20190101_grid_T.nc",
+            SSC_DAYS[1]: f"{ssc_path}02jan19/SalishSea_1h_20190102_20190102_grid_T.nc",
+        }
+        assert missing == [SSC_DAYS[2]]
+        found, missing = index.find("hrdps", *SSC_DAYS[:2])
+        assert found == {
+            SSC_DAYS[0]: f"{source_paths['hrdps']}ops_y2019m01d01.nc",
+            SSC_DAYS[1]: f"{source_paths['hrdps']}ops_y2019m01d02.nc",
+        }
+        assert missing == []
+        # The single date WaveWatch3 file name takes precedence
+        found, _ = index.find("wavewatch3", *SSC_DAYS[:2])
+        assert found[SSC_DAYS[0]] == (
+            f"{source_paths['wavewatch3']}01jan19/SoG_ww3_fields_20190101.nc"
+        )
+        # Other file types and sources are distinct entries
+        assert index.find("salishseacast", *SSC_DAYS[:2])[0] == {}
+        assert index.find("hrdps", *SSC_DAYS[:2], filetype="grid_T")[0] == {}
+
+    def test_stored_index(self, archive, monkeypatch):
+        source_paths, index_path = archive
+        index = forcing_paths.archive_index(source_paths, index_path)
+        index.refresh()
+        stored = forcing_paths.archive_index(source_paths, index_path)
+        assert stored.files == index.files
+        # The directories haven't changed, so they aren't listed again
+        monkeypatch.setattr(
+            forcing_paths.os,
+            "listdir",
+            lambda path: pytest.fail(f"{path} was rescanned"),
+        )
+        stored.refresh()
+        assert stored.files == index.files
+
+    def test_other_source_paths_not_loaded(self, archive, tmp_path):
+        source_paths, index_path = archive
+        forcing_paths.archive_index(source_paths, index_path).refresh()
+        other_paths = dict(source_paths, hrdps=f"{tmp_path}/other/")
+        assert forcing_paths.archive_index(other_paths, index_path).files == {}
+
+    def test_changed_directory_rescanned(self, archive, monkeypatch):
+        source_paths, index_path = archive
+        forcing_paths.archive_index(source_paths, index_path).refresh()
+        day_path = os.path.join(source_paths["salishseacast"], "02jan19")
+        os.remove(os.path.join(day_path, "SalishSea_1h_20190102_20190102_grid_T.nc"))
+        # Make sure that the modification time changes on coarse clock file systems
+        mtime = os.stat(day_path).st_mtime_ns
+        os.utime(day_path, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+        listed = []
+        listdir = os.listdir
+        monkeypatch.setattr(
+            forcing_paths.os,
+            "listdir",
+            lambda path: listed.append(path) or listdir(path),
+        )
+        index = forcing_paths.archive_index(source_paths, index_path)
+        index.refresh()
+        assert listed == [day_path]
+        found, missing = index.find("salishseacast", *SSC_DAYS[:2], filetype="grid_T")
+        assert list(found) == [SSC_DAYS[0]]
+        assert missing == [SSC_DAYS[1]]
+        assert index.find("salishseacast", *SSC_DAYS[:2], filetype="grid_U")[1] == []
+
+    def test_new_directory_scanned(self, archive, tmp_path):
+        source_paths, index_path = archive
+        forcing_paths.archive_index(source_paths, index_path).refresh()
+        _touch(
+            tmp_path / "ssc" / "03jan19" / "SalishSea_1h_20190103_20190103_grid_T.nc"
+        )
+        index = forcing_paths.archive_index(source_paths, index_path)
+        assert index.find(
+            "salishseacast", SSC_DAYS[0], SSC_DAYS[-1], filetype="grid_T"
+        )[1] == [SSC_DAYS[2]]
+        index.refresh()
+        assert (
+            index.find("salishseacast", SSC_DAYS[0], SSC_DAYS[-1], filetype="grid_T")[1]
+            == []
+        )
+
+
+@pytest.fixture(scope="module")
+def point_records(rng):
+    """(time, depth, x, y) values of synthetic HDF5 forcing records."""
+    return rng.standard_normal((7, 3, 9, 11)).astype("float32")
+
+
+class TestReadPoints:
+    """Unit tests for the extraction of the values at locations from HDF5 forcing
+    datasets by make_forcing_statistics.
+    """
+
+    locations = [(4, 2), (1, 7), (4, 9), (6, 2)]
+
+    @pytest.fixture
+    def hdf5_file(self, tmp_path, point_records):
+        with h5py.File(tmp_path / "points.hdf5", "w") as f:
+            f.create_dataset("3d", data=point_records[0])
+            f.create_dataset("2d", data=point_records[0, 0])
+            f.create_dataset("series_3d", data=point_records, chunks=(2, 1, 4, 4))
+            f.create_dataset("series_2d", data=point_records[:, 0])
+            yield f
+
+    def test_point_selection(self):
+        gridx, gridy, x_slice, y_slice = make_forcing_statistics.point_selection(
+            self.locations
+        )
+        numpy.testing.assert_array_equal(gridx, [4, 1, 4, 6])
+        numpy.testing.assert_array_equal(gridy, [2, 7, 9, 2])
+        assert (x_slice, y_slice) == (slice(1, 7), slice(2, 10))
+
+    def test_single_location(self):
+        points = make_forcing_statistics.point_selection((3, 5))
+        assert points[2:] == (slice(3, 4), slice(5, 6))
+
+    def test_read_points_3d(self, hdf5_file, point_records):
+        points = make_forcing_statistics.point_selection(self.locations)
+        values = make_forcing_statistics.read_points(hdf5_file["3d"], points)
+        gridx, gridy = numpy.array(self.locations).T
+        # Surface level
+        numpy.testing.assert_array_equal(values, point_records[0, -1, gridx, gridy])
+        assert values.dtype == numpy.float64
+
+    def test_read_points_2d(self, hdf5_file, point_records):
+        points = make_forcing_statistics.point_selection(self.locations)
+        values = make_forcing_statistics.read_points(hdf5_file["2d"], points)
+        gridx, gridy = numpy.array(self.locations).T
+        numpy.testing.assert_array_equal(values, point_records[0, 0, gridx, gridy])
+
+    # All of the time steps at once, blocks of 3 time steps of the 6 x 8 float32
+    # hyperslab, and one time step at a time
+    @pytest.mark.parametrize("read_bytes", (2 ** 20, 3 * 6 * 8 * 4, 1))
+    @pytest.mark.parametrize("n_times", (7, 5))
+    def test_read_consolidated_points(
+        self, hdf5_file, point_records, monkeypatch, read_bytes, n_times
+    ):
+        monkeypatch.setattr(make_forcing_statistics, "SERIES_READ_BYTES", read_bytes)
+        points = make_forcing_statistics.point_selection(self.locations)
+        gridx, gridy = numpy.array(self.locations).T
+        values = make_forcing_statistics.read_consolidated_points(
+            hdf5_file["series_3d"], points, n_times
+        )
+        numpy.testing.assert_array_equal(
+            values, point_records[:n_times, -1, gridx, gridy]
+        )
+        values = make_forcing_statistics.read_consolidated_points(
+            hdf5_file["series_2d"], points, n_times
+        )
+        numpy.testing.assert_array_equal(
+            values, point_records[:n_times, 0, gridx, gridy]
+        )
+
+    def test_consolidated_dataset(self, tmp_path, ssc_path):
+        for layout in ("per_time_step", "consolidated"):
+            run = _run(tmp_path / layout, ssc_path, hdf5_layout=layout)
+            (dirname,) = make_hdf5.process_windows(run, [(SSC_DAYS[0], 1)])
+            with h5py.File(os.path.join(dirname, "t.hdf5"), "r") as f:
+                dataset = make_forcing_statistics.consolidated_dataset(f, "salinity")
+                if layout == "per_time_step":
+                    assert dataset is None
+                else:
+                    assert dataset.shape[0] == 8
+
+
+@pytest.fixture(scope="module")
+def maps_forcing(tmp_path_factory, rng):
+    """Directory of a synthetic HDF5 forcing file, and the (time, x, y) surface
+    values of its variables.
+    """
+    path = tmp_path_factory.mktemp("maps")
+    surface = {}
+    with h5py.File(path / "forcing.hdf5", "w") as f:
+        for group, shape in (
+            ("salinity", (2, 5, 4)),
+            ("water level", (5, 4)),
+            ("wind velocity X", (5, 4)),
+            ("wind velocity Y", (5, 4)),
+        ):
+            values = rng.standard_normal((6,) + shape).astype("float32")
+            # Land cells
+            values[..., 0, 0] = numpy.nan
+            for time_index, record in enumerate(values):
+                f.create_dataset(
+                    f"Results/{group}/{group}_{time_index + 1:05d}", data=record
+                )
+            surface[group] = (values[:, -1] if len(shape) == 3 else values).astype(
+                float
+            )
+    surface["wind speed"] = numpy.sqrt(
+        surface["wind velocity X"] ** 2 + surface["wind velocity Y"] ** 2
+    )
+    return str(path), surface
+
+
+class TestStatisticsMaps:
+    """Unit tests for make_forcing_statistics.write_statistics_maps()."""
+
+    windows = [(0, 6), (2, 3)]
+    thresholds = {"water level": 0.5, "wind speed": 1.2}
+
+    @pytest.mark.parametrize("workers, chunk_rows", ((1, 64), (1, 2), (2, 2)))
+    def test_matches_numpy(self, maps_forcing, tmp_path, workers, chunk_rows):
+        path, surface = maps_forcing
+        maps_file = tmp_path / "maps.hdf5"
+        make_forcing_statistics.write_statistics_maps(
+            path,
+            str(maps_file),
+            self.windows,
+            self.thresholds,
+            workers=workers,
+            chunk_rows=chunk_rows,
+        )
+        with h5py.File(maps_file, "r") as maps:
+            for start, hours in self.windows:
+                window_group = maps[f"{hours}h_from_{start}"]
+                assert window_group.attrs["start_hour"] == start
+                assert window_group.attrs["hours"] == hours
+                assert set(window_group) == set(surface)
+                for variable, values in surface.items():
+                    window_values = values[start : start + hours]
+                    variable_group = window_group[variable]
+                    expected = {
+                        "min": window_values.min(axis=0),
+                        "max": window_values.max(axis=0),
+                        "mean": window_values.mean(axis=0),
+                        "std": window_values.std(axis=0),
+                    }
+                    if variable in self.thresholds:
+                        assert (
+                            variable_group.attrs["threshold"]
+                            == self.thresholds[variable]
+                        )
+                        expected["exceedance_fraction"] = (
+                            window_values > self.thresholds[variable]
+                        ).mean(axis=0)
+                    assert set(variable_group) == set(expected)
+                    for name, expected_values in expected.items():
+                        assert variable_group[name].dtype == numpy.float32
+                        numpy.testing.assert_allclose(
+                            variable_group[name][()],
+                            expected_values,
+                            rtol=1e-6,
+                            atol=1e-6,
+                        )
+
+    def test_no_files(self, tmp_path, capsys):
+        maps_file = tmp_path / "maps.hdf5"
+        make_forcing_statistics.write_statistics_maps(
+            str(tmp_path), str(maps_file), self.windows
+        )
+        assert not maps_file.exists()
+        assert "No HDF5 forcing files found" in capsys.readouterr().out
+
+
+class TestStatisticsCatalog:
+    """Unit tests for the reuse of the cached HDF5 forcing file summaries of
+    make_forcing_statistics.catalog_forcing_statistics().
+    """
+
+    locations = [(1, 2), (3, 5)]
+
+    @pytest.fixture
+    def campaign(self, tmp_path, ssc_path, monkeypatch):
+        output_path = tmp_path / "campaign"
+        run = _run(tmp_path, ssc_path, output_path=str(output_path))
+        make_hdf5.process_windows(run, [(SSC_DAYS[0], 1), (SSC_DAYS[1], 1)])
+        summarized = []
+        summarize_file = make_forcing_statistics.summarize_file
+        monkeypatch.setattr(
+            make_forcing_statistics,
+            "summarize_file",
+            lambda file, locations: summarized.append((file, list(locations)))
+            or summarize_file(file, locations),
+        )
+        return str(output_path), str(tmp_path / "catalog.json"), summarized
+
+    def catalog(self, campaign, tmp_path, locations=None):
+        path, catalog_path, summarized = campaign
+        summarized.clear()
+        stats_file = tmp_path / "stats.yaml"
+        make_forcing_statistics.catalog_forcing_statistics(
+            path, locations or self.locations, catalog_path, str(stats_file)
+        )
+        return stats_file.read_text(), sorted(summarized)
+
+    def test_unchanged_files_reused(self, campaign, tmp_path):
+        path, _, _ = campaign
+        stats, summarized = self.catalog(campaign, tmp_path)
+        assert summarized == sorted(
+            (file, self.locations) for file in make_forcing_statistics.hdf5_files(path)
+        )
+        assert self.catalog(campaign, tmp_path) == (stats, [])
+
+    def test_new_location(self, campaign, tmp_path):
+        path, _, _ = campaign
+        self.catalog(campaign, tmp_path)
+        _, summarized = self.catalog(campaign, tmp_path, self.locations + [(2, 0)])
+        assert summarized == sorted(
+            (file, [(2, 0)]) for file in make_forcing_statistics.hdf5_files(path)
+        )
+
+    def test_changed_mtime(self, campaign, tmp_path):
+        path, _, _ = campaign
+        stats, _ = self.catalog(campaign, tmp_path)
+        file = make_forcing_statistics.hdf5_files(path)[0]
+        stat = os.stat(file)
+        os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert self.catalog(campaign, tmp_path) == (stats, [(file, self.locations)])
+
+    def test_changed_size(self, campaign, tmp_path):
+        path, catalog_path, _ = campaign
+        stats, _ = self.catalog(campaign, tmp_path)
+        file = make_forcing_statistics.hdf5_files(path)[0]
+        # A file that is rewritten within the resolution of its modification time
+        catalog = make_forcing_statistics.statistics_catalog(catalog_path)
+        catalog.files[file]["size"] += 1
+        catalog.save()
+        assert self.catalog(campaign, tmp_path) == (stats, [(file, self.locations)])
+
+    def test_changed_path(self, campaign, tmp_path):
+        path, catalog_path, _ = campaign
+        stats, _ = self.catalog(campaign, tmp_path)
+        file = make_forcing_statistics.hdf5_files(path)[0]
+        moved = os.path.join(os.path.dirname(file), "moved.hdf5")
+        os.rename(file, moved)
+        assert self.catalog(campaign, tmp_path) == (stats, [(moved, self.locations)])
+
+    def test_changed_version(self, campaign, tmp_path, monkeypatch):
+        path, _, _ = campaign
+        self.catalog(campaign, tmp_path)
+        monkeypatch.setattr(
+            make_forcing_statistics,
+            "CATALOG_VERSION",
+            make_forcing_statistics.CATALOG_VERSION + 1,
+        )
+        _, summarized = self.catalog(campaign, tmp_path)
+        assert len(summarized) == len(make_forcing_statistics.hdf5_files(path))
+
+
+class TestLoadGridGeometry:
+    """Unit tests for the caching of the grid geometry by
+    make_hdf5.load_grid_geometry().
+    """
+
+    @pytest.fixture
+    def mesh_mask(self, tmp_path, rng):
+        tmask = (rng.random(SSC_SHAPE) < 0.7).astype("int8")
+        make_hdf5.load_grid_geometry.cache_clear()
+        yield _write_mesh_mask(tmp_path / "mesh_mask.nc", tmask), tmask
+        make_hdf5.load_grid_geometry.cache_clear()
+
+    def load(self, path, cache_dir, monkeypatch):
+        """Load the grid geometry in a new process, and record whether the mesh mask
+        file was read.
+        """
+        make_hdf5.load_grid_geometry.cache_clear()
+        opened = []
+        open_dataset = xarray.open_dataset
+        monkeypatch.setattr(
+            make_hdf5.xarray,
+            "open_dataset",
+            lambda path: opened.append(path) or open_dataset(path),
+        )
+        geometry = make_hdf5.load_grid_geometry(path, cache_dir)
+        return geometry, opened
+
+    def test_tmask(self, mesh_mask, tmp_path, monkeypatch):
+        path, tmask = mesh_mask
+        geometry, opened = self.load(path, str(tmp_path / "cache"), monkeypatch)
+        assert opened == [path]
+        numpy.testing.assert_array_equal(
+            geometry.tmask, make_hdf5.mung_array(tmask, "3D")
+        )
+        assert geometry.grid_shape == SSC_SHAPE[1:]
+        numpy.testing.assert_array_equal(
+            geometry.water_mask[1:-1, 1:-1], tmask[0, 1:-1, 1:-1] != 0
+        )
+
+    def test_cached(self, mesh_mask, tmp_path, monkeypatch):
+        path, _ = mesh_mask
+        cache_dir = str(tmp_path / "cache")
+        expected, _ = self.load(path, cache_dir, monkeypatch)
+        assert len(os.listdir(cache_dir)) == 1
+        geometry, opened = self.load(path, cache_dir, monkeypatch)
+        assert opened == []
+        assert isinstance(geometry.tmask, numpy.memmap)
+        numpy.testing.assert_array_equal(geometry.tmask, expected.tmask)
+        # The geometry is loaded once per process
+        assert make_hdf5.load_grid_geometry(path, cache_dir) is geometry
+
+    def test_changed_mtime(self, mesh_mask, tmp_path, monkeypatch):
+        path, _ = mesh_mask
+        cache_dir = str(tmp_path / "cache")
+        self.load(path, cache_dir, monkeypatch)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        _, opened = self.load(path, cache_dir, monkeypatch)
+        assert opened == [path]
+        assert len(os.listdir(cache_dir)) == 2
+
+    def test_regenerated_in_place(self, mesh_mask, tmp_path, monkeypatch):
+        path, tmask = mesh_mask
+        cache_dir = str(tmp_path / "cache")
+        self.load(path, cache_dir, monkeypatch)
+        stat = os.stat(path)
+        # A larger mesh mask with the same modification time
+        tmask = numpy.concatenate((tmask, tmask[-1:]))
+        _write_mesh_mask(path, tmask)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert os.stat(path).st_size != stat.st_size
+        geometry, opened = self.load(path, cache_dir, monkeypatch)
+        assert opened == [path]
+        numpy.testing.assert_array_equal(
+            geometry.tmask, make_hdf5.mung_array(tmask, "3D")
+        )
+
+    def test_other_path(self, mesh_mask, tmp_path, monkeypatch):
+        path, tmask = mesh_mask
+        cache_dir = str(tmp_path / "cache")
+        self.load(path, cache_dir, monkeypatch)
+        other_path = _write_mesh_mask(tmp_path / "other_mesh_mask.nc", tmask)
+        _, opened = self.load(other_path, cache_dir, monkeypatch)
+        assert opened == [other_path]
+        assert len(os.listdir(cache_dir)) == 2
+
+    def test_no_cache_dir(self, mesh_mask, tmp_path, monkeypatch):
+        path, _ = mesh_mask
+        geometry, _ = self.load(path, None, monkeypatch)
+        _, opened = self.load(path, None, monkeypatch)
+        assert opened == [path]
+        assert not isinstance(geometry.tmask, numpy.memmap)
+
+
+@pytest.fixture(scope="module")
+def writer_batch(rng):
+    """Values and date arrays of a batch of 4 time records."""
+    data = rng.standard_normal((4, 2, 3, 5)).astype("float32")
+    datearrays = [[2019.0, 1.0, 1.0, hour, 0.0, 0.0] for hour in range(4)]
+    return data, datearrays
+
+
+class TestHDF5Writer:
+    """Unit tests for make_hdf5.hdf5_writer, which keeps an HDF5 forcing file open
+    for a whole run.
+    """
+
+    @pytest.mark.parametrize("layout", make_hdf5.HDF5_LAYOUTS)
+    def test_batches(self, tmp_path, writer_batch, layout):
+        data, datearrays = writer_batch
+        hdf5_path = tmp_path / "t.hdf5"
+        with make_hdf5.hdf5_writer(hdf5_path, "w", layout) as writer:
+            writer.write(data[:2], datearrays[:2], {}, "salinity", 1)
+            assert writer.has_records("salinity", 1, 2)
+            assert not writer.has_records("salinity", 1, 3)
+            writer.write(data[2:], datearrays[2:], {}, "salinity", 3)
+            assert writer.has_records("salinity", 1, 4)
+        records = _read_records(hdf5_path)
+        for i in range(4):
+            numpy.testing.assert_array_equal(
+                records[f"Results/salinity/salinity_{i + 1:05d}"], data[i]
+            )
+            numpy.testing.assert_array_equal(
+                records[f"Time/Time_{i + 1:05d}"], datearrays[i]
+            )
+
+    def test_reopened(self, tmp_path, writer_batch, capsys):
+        data, datearrays = writer_batch
+        hdf5_path = tmp_path / "t.hdf5"
+        with make_hdf5.hdf5_writer(hdf5_path, "w") as writer:
+            writer.write(data, datearrays, {}, "salinity", 1)
+        with make_hdf5.hdf5_writer(hdf5_path, "a") as writer:
+            # The existing time records are read when the file is opened
+            assert writer.has_records("salinity", 1, 4)
+            writer.write(data[::-1], datearrays, {}, "salinity", 1)
+            assert "Dataset already exists at salinity_00001" in capsys.readouterr().out
+            with pytest.raises(AssertionError, match="Time_00001 exists"):
+                writer.write(data[:2], datearrays[2:], {}, "salinity", 1)
+        numpy.testing.assert_array_equal(
+            _read_records(hdf5_path)["Results/salinity/salinity_00001"], data[0]
+        )
+
+    def test_discard_records(self, tmp_path, writer_batch):
+        data, datearrays = writer_batch
+        hdf5_path = tmp_path / "t.hdf5"
+        with make_hdf5.hdf5_writer(hdf5_path, "w") as writer:
+            writer.write(data, datearrays, {}, "salinity", 1)
+            writer.discard_records("salinity", 3, 2)
+            assert writer.has_records("salinity", 1, 2)
+            assert not writer.has_records("salinity", 3, 1)
+            writer.write(data[2:], datearrays[2:], {}, "salinity", 3)
+            assert writer.has_records("salinity", 1, 4)
+
+    def test_open_for_whole_window(self, tmp_path, ssc_path, monkeypatch):
+        writers = []
+
+        class recording_writer(make_hdf5.hdf5_writer):
+            def __init__(self, filename, mode="a", layout="per_time_step"):
+                super().__init__(filename, mode, layout)
+                writers.append((filename, mode, self))
+
+        monkeypatch.setattr(make_hdf5, "hdf5_writer", recording_writer)
+        dirnames = make_hdf5.process_windows(
+            _run(tmp_path, ssc_path), [(SSC_DAYS[0], 1), (SSC_DAYS[1], 1)]
+        )
+        # Each window's file is opened once for all of its days, and closed at the end
+        assert [(filename, mode) for filename, mode, _ in writers] == [
+            (os.path.join(dirname, "t.hdf5"), "w") for dirname in dirnames
+        ]
+        for _, _, writer in writers:
+            assert not writer.file
+
+
+class TestRunMetrics:
+    """Unit tests for the JSON lines records of make_hdf5.run_metrics."""
+
+    keys = {
+        "datatype",
+        "source_file",
+        "n_records",
+        "read_time",
+        "interpolate_time",
+        "transform_time",
+        "write_time",
+        "bytes_read",
+        "bytes_written",
+        "throughput_mb_s",
+        "peak_rss_mb",
+    }
+
+    @pytest.fixture
+    def metrics_file(self, tmp_path, ssc_path):
+        metrics_file = tmp_path / "metrics.jsonl"
+        called = []
+        metrics = make_hdf5.run_metrics(str(metrics_file), callback=called.append)
+        make_hdf5.process_windows(
+            _run(tmp_path, ssc_path), [(SSC_DAYS[0], 1)], metrics=metrics
+        )
+        assert called == metrics.records
+        return metrics_file, metrics
+
+    def test_schema(self, metrics_file, tmp_path, ssc_path):
+        metrics_file, metrics = metrics_file
+        with open(metrics_file) as f:
+            records = [json.loads(line) for line in f]
+        assert records == metrics.records
+        source_files = make_hdf5.find_source_files(
+            _run(tmp_path, ssc_path), SSC_DAYS[:2]
+        )
+        assert sorted(
+            (record["datatype"], record["source_file"]) for record in records
+        ) == sorted(
+            (datatype, source_files["grid_T", day])
+            for datatype, _, _ in GRID_T_JOBS
+            for day in SSC_DAYS[:2]
+        )
+        # Number of values in each MOHID-gridded time record
+        record_values = {
+            "salinity": 3 * 4 * 6,
+            "temperature": 3 * 4 * 6,
+            "sea_surface_height": 4 * 6,
+        }
+        for record in records:
+            assert set(record) == self.keys
+            assert record["n_records"] == 4
+            # 4 float32 time records
+            assert record["bytes_written"] == 4 * record_values[record["datatype"]] * 4
+            assert record["bytes_read"] > 0
+            for stage in make_hdf5.METRICS_STAGES:
+                assert record[f"{stage}_time"] >= 0
+            assert record["throughput_mb_s"] > 0
+            assert record["peak_rss_mb"] > 0
+
+    def test_reduced_precision_schema(self, tmp_path, ssc_path):
+        run_description = {
+            "salish_seacast_forcing": {"salinity": {"hdf5_storage": {"keep_bits": 7}}}
+        }
+        metrics_file = tmp_path / "metrics.jsonl"
+        make_hdf5.process_windows(
+            _run(tmp_path, ssc_path, run_description=run_description),
+            [(SSC_DAYS[0], 1)],
+            metrics=make_hdf5.run_metrics(str(metrics_file)),
+        )
+        with open(metrics_file) as f:
+            records = [json.loads(line) for line in f]
+        for record in records:
+            if record["datatype"] == "salinity":
+                assert set(record) == self.keys | {
+                    "max_error",
+                    "rms_error",
+                    "error_values",
+                }
+            else:
+                assert set(record) == self.keys
+
+    def test_read(self, metrics_file):
+        metrics_file, metrics = metrics_file
+        read_metrics = make_hdf5.run_metrics()
+        read_metrics.read(str(metrics_file))
+        read_metrics.read(str(metrics_file))
+        assert read_metrics.records == metrics.records * 2
+
+    def test_append(self, metrics_file):
+        metrics_file, metrics = metrics_file
+        appended = make_hdf5.run_metrics(str(metrics_file), append=True)
+        appended.record(metrics.records[0])
+        with open(metrics_file) as f:
+            assert len(f.readlines()) == len(metrics.records) + 1
+        # A new run starts a new file
+        make_hdf5.run_metrics(str(metrics_file))
+        assert metrics_file.read_text() == ""
+
+    def test_summary(self, metrics_file, capsys):
+        _, metrics = metrics_file
+        metrics.summary()
+        lines = capsys.readouterr().out.splitlines()
+        totals = {line.split()[0]: line.split()[1] for line in lines[2:]}
+        assert totals == {
+            "salinity": "2",
+            "temperature": "2",
+            "sea_surface_height": "2",
+            "total": "6",
+        }